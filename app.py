@@ -8,18 +8,204 @@ from flask import (
     session,
     abort,
     request,
-    flash
+    flash,
+    Response,
+    make_response,
+    stream_template,
+    stream_with_context,
+    template_rendered,
+    before_render_template,
+    jsonify
 )
+from itertools import chain
+import click
+import csv
+import time
 from secrets import token_hex
 from expense_tracker.db_storage import ExpensesDatabaseStorage
-from functools import wraps
-from expense_tracker import utils
+from expense_tracker.categories import category_registry
+from expense_tracker.connection_pool import connect
+from expense_tracker.passwords import HashingBusy
+from expense_tracker.sessions import ServerSideSessionInterface, session_store
+from expense_tracker.analytics_cache import analytics_cache
+from expense_tracker.currencies import exchange_rates, read_rates
+from expense_tracker.page_cache import page_cache, page_key, page_etag, add_cache_headers
+from functools import partial, wraps
+from expense_tracker import (
+    analytics,
+    utils,
+    metrics,
+    config,
+    recurring,
+    migrations,
+    importers,
+    exporters,
+    group_commit,
+    instrumentation
+)
 
 app = Flask(__name__)
-app.secret_key = token_hex(32)
+app.secret_key = config.SECRET_KEY or token_hex(32)
+if not config.SECRET_KEY:
+    app.logger.warning('EXPENSES_SECRET_KEY is not set, sessions will only '
+                       'work on this worker until it restarts')
+# Only a signed session id goes in the cookie, the data stays on the server
+app.session_interface = ServerSideSessionInterface(session_store)
 
 app.jinja_env.filters['to_currency'] = utils.to_currency
+# Expense records are formatted while rendering, with no per-row copies
+app.jinja_env.filters['cents_to_currency'] = utils.cents_to_currency
+app.jinja_env.filters['format_datetime'] = utils.format_datetime
+
+# Templates read submitted values from `form`, which the ASGI app
+# (asgi.py) fills from its awaitable request.form
+@app.context_processor
+def inject_form():
+    return {'form': request.form}
+
+def run_migrations():
+    storage = ExpensesDatabaseStorage()
+    try:
+        applied = migrations.apply_migrations(storage.connection)
+        storage.create_expense_partitions(config.PARTITION_MONTHS_AHEAD)
+        return applied
+    finally:
+        storage.close_connection()
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Apply pending schema migrations."""
+    applied = run_migrations()
+    for name in applied:
+        print(f'Applied {name}')
+    if not applied:
+        print('Database schema is up to date')
+
+@app.cli.command('check-indexes')
+def check_indexes_command():
+    """Verify the hot storage queries use their indexes."""
+    storage = ExpensesDatabaseStorage()
+    try:
+        results = migrations.check_index_usage(storage.connection)
+    finally:
+        storage.close_connection()
+
+    for name, expected_index, used, ok in results:
+        status = 'OK' if ok else 'MISSING'
+        print(f'{status:8} {name}: expected {expected_index}, '
+              f'used {", ".join(sorted(used)) or "no index"}')
+    if not all(ok for *_, ok in results):
+        raise SystemExit(1)
+
+@app.cli.command('partition-expenses')
+@click.option('--hash-partitions', type=int, default=0,
+              help='Also split every month into this many partitions by user.')
+@click.option('--months-ahead', type=int, default=config.PARTITION_MONTHS_AHEAD)
+def partition_expenses_command(hash_partitions, months_ahead):
+    """Convert expenses to monthly partitions (locks the table while it runs)."""
+    storage = ExpensesDatabaseStorage()
+    try:
+        partitions = storage.partition_expenses(hash_partitions, months_ahead)
+    finally:
+        storage.close_connection()
+    print(f'expenses now has {partitions} monthly partitions')
+
+@app.cli.command('create-partitions')
+@click.option('--months-ahead', type=int, default=config.PARTITION_MONTHS_AHEAD)
+def create_partitions_command(months_ahead):
+    """Create the upcoming monthly expenses partitions."""
+    storage = ExpensesDatabaseStorage()
+    try:
+        print(f'Created {storage.create_expense_partitions(months_ahead)} partitions')
+    finally:
+        storage.close_connection()
+
+@app.cli.command('check-rollups')
+@click.option('--rebuild', is_flag=True,
+              help='Rebuild the rollups from expenses after the check.')
+def check_rollups_command(rebuild):
+    """Diff the analytics rollups and budget totals against the expenses table."""
+    storage = ExpensesDatabaseStorage()
+    try:
+        mismatches = storage.diff_rollups()
+        for row in mismatches:
+            print(f"user {row['user_id']} day {row['day']} "
+                  f"category {row['category_id']}: "
+                  f"expected {row['expected_count']} txns / {row['expected_cents']} cents, "
+                  f"rollup has {row['rollup_count']} txns / {row['rollup_cents']} cents")
+        print(f'{len(mismatches)} mismatching rollup rows')
+
+        monthly_mismatches = storage.diff_monthly_totals()
+        for row in monthly_mismatches:
+            print(f"user {row['user_id']} month {row['month']:%Y-%m} "
+                  f"category {row['category_id']}: "
+                  f"expected {row['expected_count']} txns / {row['expected_cents']} cents, "
+                  f"total has {row['total_count']} txns / {row['total_cents']} cents")
+        print(f'{len(monthly_mismatches)} mismatching monthly total rows')
+
+        if rebuild:
+            rows = storage.rebuild_rollups()
+            print(f'Rebuilt {rows} rollup rows')
+            rows = storage.rebuild_monthly_totals()
+            print(f'Rebuilt {rows} monthly total rows')
+        elif mismatches or monthly_mismatches:
+            raise SystemExit(1)
+    finally:
+        storage.close_connection()
+
+@app.cli.command('import-rates')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def import_rates_command(path):
+    """Load daily exchange rates from a date,currency,units_per_usd CSV file."""
+    with open(path, newline='', encoding='utf-8') as rates_file:
+        try:
+            rates = read_rates(rates_file)
+        except ValueError as error:
+            raise click.ClickException(str(error))
+
+    storage = ExpensesDatabaseStorage()
+    try:
+        print(f'Imported {storage.import_exchange_rates(rates)} exchange rates')
+    finally:
+        storage.close_connection()
+    exchange_rates.invalidate()
+
+@app.cli.command('purge-sessions')
+def purge_sessions_command():
+    """Delete expired sessions from the sessions table."""
+    storage = ExpensesDatabaseStorage()
+    try:
+        print(f'Deleted {storage.purge_expired_sessions()} expired sessions')
+    finally:
+        storage.close_connection()
+
+if config.MIGRATE_ON_STARTUP:
+    run_migrations()
+
+@app.cli.command('materialize-recurring')
+@click.option('--catch-up/--latest-only', default=config.RECURRING_CATCH_UP,
+              help='Add every missed occurrence, or only the latest due one.')
+def materialize_recurring_command(catch_up):
+    """Add the due occurrences of recurring expenses."""
+    storage = ExpensesDatabaseStorage()
+    try:
+        result = recurring.materialize_due(storage, catch_up=catch_up)
+    finally:
+        storage.close_connection()
+
+    if result is None:
+        print('Another process is materializing recurring expenses')
+    else:
+        print('Added {1} expenses for {0} recurring expense rules'.format(*result))
+
+if config.RECURRING_SCHEDULER:
+    recurring.scheduler.start()
 
+if config.CATEGORY_LISTEN:
+    category_registry.listen(partial(connect, config.DB_NAME, config.DB_PRIMARY_DSN))
+
+# The signed-in user's id and name are kept in the session at sign-in,
+# so authenticated requests need no user lookup
 def requires_signin(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
@@ -33,21 +219,131 @@ def requires_signin(func):
 
 def load_expense(func):
     @wraps(func)
-    def wrapper(*args, **kwargs):
-        user = session.get('user_signed_in')
+    def wrapper(user_id, *args, **kwargs):
         expense_id = kwargs.get('expense_id')
-        expense = g.storage.find_expense_by_id(user['user_id'], expense_id)
+        expense = g.storage.find_expense_by_id(user_id, expense_id)
         if not expense:
             abort(404, description='Expense record not found')
 
-        return func(expense, *args, **kwargs)
+        return func(expense, user_id, *args, **kwargs)
+    return wrapper
+
+# Alerts the triggers raised for budgets the user's writes went past
+def flash_budget_alerts(user_id):
+    alerts = g.storage.pop_budget_alerts(user_id)
+    if alerts:
+        for message in utils.budget_alert_messages(alerts, category_registry.by_id(g.storage)):
+            flash(message, 'error')
+
+# Shared with the async views in asgi.py
+def page_version(data_version, rates_generation):
+    # Pages in another currency change with the exchange rates too,
+    # and budgets are shown for the current month
+    return (data_version, rates_generation, utils.current_month())
+
+def page_cursor(args):
+    # Cursors come from encode_page_cursor, so a bad one was edited
+    try:
+        return utils.decode_page_cursor(args.get('after'))
+    except ValueError:
+        abort(400, description='Invalid page cursor')
+
+def cached_page_response(response_class, key, if_none_match):
+    """
+    The ETag of the page at `key`, and the response answering it without
+    rendering: 304 if the browser has it, else the cached rendering, else
+    None.
+    """
+    etag = page_etag(key)
+    if if_none_match.contains(etag):
+        return etag, add_cache_headers(response_class('', status=304), etag)
+
+    body = page_cache.get(key)
+    if body is not None:
+        return etag, add_cache_headers(response_class(body, mimetype='text/html'), etag)
+    return etag, None
+
+# For pages built only from the user's expenses. An unchanged page costs
+# one data version lookup: 304 if the browser has it, else the rendering
+# cached by the first request. Pages showing flash messages are rendered.
+def cached_page(func):
+    @wraps(func)
+    def wrapper(user_id, *args, **kwargs):
+        if '_flashes' in session:
+            return func(user_id, *args, **kwargs)
+
+        g.data_version = g.storage.get_data_version(user_id)
+        version = page_version(g.data_version, exchange_rates.refresh(g.storage))
+        key = page_key(user_id, version, request.path, request.args)
+        etag, cached = cached_page_response(Response, key, request.if_none_match)
+        if cached is not None:
+            return cached
+
+        response = make_response(func(user_id, *args, **kwargs))
+        if response.status_code != 200 or '_flashes' in session:
+            return response
+        if not response.is_streamed:
+            page_cache.set(key, response.get_data())
+        return add_cache_headers(response, etag)
     return wrapper
 
 
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.template_time = 0.0
+
+@before_render_template.connect_via(app)
+def record_template_start(sender, template, context, **extra):
+    g.template_started = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def record_template_end(sender, template, context, **extra):
+    started = g.pop('template_started', None)
+    if started is not None:
+        g.template_time += time.perf_counter() - started
+
+@app.after_request
+def add_request_profile(response):
+    started = g.get('request_started')
+    if started is None:
+        return response
+
+    total = time.perf_counter() - started
+    storage = g.get('storage')
+    db_time = storage.db_time if storage else 0.0
+    query_count = storage.query_count if storage else 0
+
+    response.headers['Server-Timing'] = (
+        f'db;dur={db_time * 1000:.1f};desc="{query_count} queries", '
+        f'tpl;dur={g.template_time * 1000:.1f}, '
+        f'total;dur={total * 1000:.1f}'
+    )
+
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    instrumentation.request_duration.observe(route, total)
+    instrumentation.request_db_duration.observe(route, db_time)
+    return response
+
+# Set on responses to requests that may have written, for
+# DB_READ_YOUR_WRITES_SECONDS. Until it expires the client's reads
+# stay on the primary, where its writes already are.
+READ_PRIMARY_COOKIE = 'read_primary'
+
 @app.before_request
 def create_db_connection():
     if not hasattr(g, 'storage'):
         g.storage = ExpensesDatabaseStorage()
+        g.storage.replica_reads = (request.method in ('GET', 'HEAD')
+                                   and READ_PRIMARY_COOKIE not in request.cookies)
+
+@app.after_request
+def read_own_writes(response):
+    if config.DB_REPLICA_DSNS and request.method not in ('GET', 'HEAD'):
+        response.set_cookie(READ_PRIMARY_COOKIE, '1',
+                            max_age=config.DB_READ_YOUR_WRITES_SECONDS,
+                            httponly=True, samesite='Lax')
+    return response
 
 @app.teardown_appcontext
 def teardown_db(exception=None):
@@ -55,85 +351,346 @@ def teardown_db(exception=None):
         g.storage.close_connection()
 
 
+@app.errorhandler(HashingBusy)
+def hashing_busy(error):
+    flash('Too many sign-in attempts right now. Please try again in a moment.', 'error')
+    template = 'sign_up.html' if request.endpoint == 'sign_up' else 'sign_in.html'
+    return render_template(template), 429, {'Retry-After': '1'}
+
 @app.route('/')
 def index():
     return redirect(url_for('expense_list'))
 
+# Processing analytics results to the right format for the template
+def format_groups_for_template(groups_data, grouping_option):
+    for group in groups_data:
+        if grouping_option in ('week','month','day'):
+            group['group_value'] = group['group_value'].strftime('%Y-%m-%d')
+        group['total_amount'] /= 100
+        group['avg_amount'] /= 100
+        for column in analytics.CENT_COLUMNS:
+            if group.get(column) is not None:
+                group[column] /= 100
+    return groups_data
+
+def format_pivot_for_template(pivot):
+    if pivot is None:
+        return None
+    categories, months, matrix = pivot
+    return {
+        'months': [month.strftime('%Y-%m') for month in months],
+        'rows': [(name, (cents / 100).tolist()) for name, cents in zip(categories, matrix)],
+    }
+
+def analytics_template_args(groups_data, pivot, grouping_option):
+    return {
+        'groups_data': format_groups_for_template(groups_data, grouping_option),
+        'pivot': format_pivot_for_template(pivot),
+    }
+
+def frame_report(frame, grouping_option, date_from, date_to, currency, category_names):
+    # The NumPy engine's groups and pivot for the user's expense frame
+    frame = exchange_rates.convert_frame(frame.between(date_from, date_to), currency)
+    report = analytics.grouped_report(frame, grouping_option, category_names)
+    if report is None:
+        return None, None
+    return report['groups'], report['pivot']
+
+def grouped_analytics(user_id, grouping_option, date_from, date_to, currency='USD'):
+    """
+    Groups and, with the NumPy engine, the category-by-month pivot, in
+    `currency`.
+    """
+    if not analytics.enabled():
+        groups_data = analytics_cache.grouped_data(
+            g.storage, user_id, grouping_option, date_from, date_to,
+            g.get('data_version'), currency
+        )
+        return groups_data, None
+
+    def report():
+        frame = analytics.frame_cache.load(g.storage, user_id, g.get('data_version'))
+        return frame_report(frame, grouping_option, date_from, date_to, currency,
+                            category_registry.by_id(g.storage))
+
+    return analytics_cache.cached(g.storage, 'numpy', user_id, grouping_option, date_from,
+                                  date_to, g.get('data_version'), currency, report)
+
 @app.route('/expenses')
 @requires_signin
+@cached_page
 def expense_list(user_id):
-    expenses = g.storage.get_all_user_expenses(user_id)
-
-    for expense in expenses:
-        expense['amount_usd'] = expense.pop('amount_cents_usd') / 100
-        expense['transaction_datetime'] = expense['transaction_datetime'].strftime('%Y-%m-%d %H:%M')
-
-    return render_template('expense_list.html', expenses=expenses)
+    if request.args.get('stream'):
+        return streamed_expense_list(user_id)
+
+    after = page_cursor(request.args)
+    expenses, next_key = g.storage.get_user_expenses_page(
+        user_id, config.EXPENSES_PAGE_SIZE, after
+    )
+
+    currencies = exchange_rates.currencies(g.storage)
+    currency = utils.report_currency(request.args, currencies)
+    next_cursor = utils.encode_page_cursor(next_key) if next_key else None
+    return render_template('expense_list.html', expenses=expenses,
+                           next_cursor=next_cursor,
+                           categories=category_registry.ordered(g.storage),
+                           currencies=currencies, currency=currency,
+                           amounts=exchange_rates.convert_records(expenses, currency),
+                           budgets=g.storage.get_budgets(user_id, utils.current_month()))
+
+def streamed_expense_list(user_id):
+    # Rows are pulled from a server-side cursor while the page is being
+    # sent, so memory use doesn't grow with the size of the history.
+    # Categories are loaded first: a registry reload once the cursor is
+    # open would commit its transaction and close it mid-stream.
+    categories = category_registry.ordered(g.storage)
+    rows = g.storage.iter_user_expenses(user_id)
+    first = next(rows, None)
+    if first is None:
+        return render_template('expense_list.html', expenses=[])
+
+    return stream_template('expense_list.html', expenses=chain([first], rows),
+                           categories=categories)
+
+@app.route('/expenses/search')
+@requires_signin
+def search_expenses(user_id):
+    categories = category_registry.ordered(g.storage)
+    filters, errors = utils.search_filters(request.args)
+    for error in errors:
+        flash(error, 'error')
+    if errors or not filters:
+        return render_template('search_expenses.html', categories=categories)
+
+    after = page_cursor(request.args)
+    expenses, next_key = g.storage.search_expenses(
+        user_id, config.EXPENSES_PAGE_SIZE, after=after, **filters
+    )
+
+    next_url = None
+    if next_key:
+        args = request.args.to_dict()
+        args['after'] = utils.encode_page_cursor(next_key)
+        next_url = url_for('search_expenses', **args)
+    return render_template('search_expenses.html', categories=categories,
+                           expenses=expenses, next_url=next_url)
 
 @app.route('/expenses/new')
 @requires_signin
 def new_expense_view(user_id):
-    categories = g.storage.get_categories()
-    return render_template('add_expense.html', categories=categories, current_date=date.today())
+    categories = category_registry.ordered(g.storage)
+    return render_template('add_expense.html', categories=categories, current_date=date.today(),
+                           currencies=exchange_rates.currencies(g.storage))
 
 @app.route('/expenses', methods=['POST'])
 @requires_signin
 def create_expense(user_id):
     expense_data = utils.extract_expense_data(request.form)
+    currency = utils.extract_currency(request.form)
+    currencies = exchange_rates.currencies(g.storage)
 
     errors = utils.expense_data_errors(expense_data)
+    errors.extend(utils.errors_for_currency(currency, currencies))
+    if not errors:
+        errors = utils.errors_for_converted_amount(expense_data, currency)
     if errors:
         for error in errors:
             flash(error, 'error')
 
-        categories = g.storage.get_categories()
-        return render_template('add_expense.html', categories=categories, current_date=date.today())
+        categories = category_registry.ordered(g.storage)
+        return render_template('add_expense.html', categories=categories, current_date=date.today(),
+                               currencies=currencies)
 
     try:
-        expense_id = g.storage.create_new_expense(user_id, **expense_data)
+        if config.GROUP_COMMIT:
+            expense_id = group_commit.writer.create_new_expense(user_id, currency=currency,
+                                                                **expense_data)
+        else:
+            expense_id = g.storage.create_new_expense(user_id, currency=currency, **expense_data)
         if expense_id:
             flash('Expense created successfully', 'success')
+            flash_budget_alerts(user_id)
             return redirect(url_for('expense_list'))
         else:
             abort(500)
     except ValueError:
         abort(500)
 
+@app.route('/recurring')
+@requires_signin
+def recurring_expenses_view(user_id):
+    categories = category_registry.ordered(g.storage)
+    rules = g.storage.get_recurring_expenses(user_id)
+    return render_template('recurring_expenses.html', rules=rules,
+                           categories=categories, frequencies=recurring.FREQUENCIES,
+                           current_date=date.today())
+
+@app.route('/recurring', methods=['POST'])
+@requires_signin
+def create_recurring_expense(user_id):
+    expense_data = utils.extract_recurring_expense_data(request.form)
+
+    errors = utils.recurring_expense_errors(expense_data)
+    if errors:
+        for error in errors:
+            flash(error, 'error')
+
+        categories = category_registry.ordered(g.storage)
+        rules = g.storage.get_recurring_expenses(user_id)
+        return render_template('recurring_expenses.html', rules=rules,
+                               categories=categories, frequencies=recurring.FREQUENCIES,
+                               current_date=date.today())
+
+    rule_id = g.storage.create_recurring_expense(user_id, **expense_data)
+    # Occurrences from a start date in the past are added right away
+    rules, expenses = recurring.materialize_due(g.storage, catch_up=True,
+                                                recurring_expense_id=rule_id)
+    flash(f'Recurring expense created, {expenses} expenses added', 'success')
+    flash_budget_alerts(user_id)
+    return redirect(url_for('recurring_expenses_view'))
+
+@app.route('/recurring/<int:recurring_expense_id>/delete', methods=['POST'])
+@requires_signin
+def delete_recurring_expense(user_id, recurring_expense_id):
+    if not g.storage.delete_recurring_expense(user_id, recurring_expense_id):
+        abort(404, description='Recurring expense not found')
+
+    flash('Recurring expense stopped. Expenses it added are kept', 'success')
+    return redirect(url_for('recurring_expenses_view'))
+
+@app.route('/budgets')
+@requires_signin
+def budgets_view(user_id):
+    return render_template('budgets.html', categories=category_registry.ordered(g.storage),
+                           budgets=g.storage.get_budgets(user_id, utils.current_month()))
+
+@app.route('/budgets', methods=['POST'])
+@requires_signin
+def set_budget(user_id):
+    category_id, amount_cents, errors = utils.budget_request(request.form)
+    if errors:
+        for error in errors:
+            flash(error, 'error')
+        return render_template('budgets.html', categories=category_registry.ordered(g.storage),
+                               budgets=g.storage.get_budgets(user_id, utils.current_month()))
+
+    g.storage.set_budget(user_id, category_id, amount_cents, config.BUDGET_ALERT_PERCENTS)
+    flash('Budget saved', 'success')
+    return redirect(url_for('budgets_view'))
+
+@app.route('/budgets/<int:category_id>/delete', methods=['POST'])
+@requires_signin
+def delete_budget(user_id, category_id):
+    if not g.storage.delete_budget(user_id, category_id):
+        abort(404, description='Budget not found')
+
+    flash('Budget removed', 'success')
+    return redirect(url_for('budgets_view'))
+
+@app.route('/expenses/export', methods=['GET'])
+@requires_signin
+def export_expenses(user_id):
+    export_format = request.args.get('format', 'csv')
+    if export_format not in exporters.EXPORT_FORMATS:
+        abort(400, description='Export format must be csv or jsonl')
+
+    date_from = request.args.get('date_from')
+    date_to = request.args.get('date_to')
+    for date_str in (date_from, date_to):
+        if date_str and not utils.is_valid_date(date_str):
+            abort(400, description='Dates must be in YYYY-MM-DD format')
+
+    chunks, mimetype = exporters.EXPORT_FORMATS[export_format]
+    rows = g.storage.iter_expenses_for_export(user_id, date_from, date_to)
+    return Response(
+        stream_with_context(chunks(rows)),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': f'attachment; filename=expenses.{export_format}'
+        },
+    )
+
+@app.route('/expenses/import', methods=['GET'])
+@requires_signin
+def import_expenses_view(user_id):
+    return render_template('import_expenses.html')
+
+@app.route('/expenses/import', methods=['POST'])
+@requires_signin
+def import_expenses(user_id):
+    uploaded_file = request.files.get('expenses_file')
+    if not uploaded_file or not uploaded_file.filename:
+        flash('Select a file to import', 'error')
+        return render_template('import_expenses.html')
+
+    parser = importers.parser_for(uploaded_file.filename)
+    if not parser:
+        flash('Unsupported file type. Upload a .csv or .ofx file', 'error')
+        return render_template('import_expenses.html')
+
+    # Rows are parsed, validated and inserted in batches as the upload is
+    # read, so the whole file is never held in memory
+    # Categories are loaded up front: a registry reload inside the
+    # import's transaction would commit it partway through
+    parsed_rows = parser(importers.text_stream(uploaded_file.stream),
+                         category_registry.by_id(g.storage))
+    category_ids = category_registry.ids(g.storage)
+    row_errors = []
+    try:
+        imported_count = g.storage.import_expenses(
+            user_id, utils.validated_expenses(parsed_rows, row_errors, category_ids)
+        )
+    except (UnicodeDecodeError, csv.Error):
+        flash('The file could not be read. Make sure it is a valid UTF-8 '
+              'CSV or OFX file', 'error')
+        return render_template('import_expenses.html')
+
+    flash(f'Imported {imported_count} expenses', 'success')
+    flash_budget_alerts(user_id)
+    if row_errors:
+        flash(f'{len(row_errors)} rows were skipped because of errors', 'error')
+    return render_template('import_expenses.html', row_errors=row_errors)
+
 @app.route('/expenses/<int:expense_id>/edit', methods=['GET'])
 @requires_signin
 @load_expense
 def edit_expense_view(expense, user_id, expense_id):
-    categories = g.storage.get_categories()
+    categories = category_registry.ordered(g.storage)
 
     # # TODO - move this to a decorator later
     # expense = g.storage.find_expense_by_id(user_id, expense_id)
     # if not expense:
     #     abort(404, description='Expense not found')
 
-    expense['transaction_date'] = expense['transaction_datetime'].strftime('%Y-%m-%d')
-    expense['transaction_time'] = expense['transaction_datetime'].strftime('%H:%M')
-    expense['amount_usd'] = expense.pop('amount_cents_usd') / 100
-    return render_template('edit_expense.html', expense=expense, categories=categories)
+    return render_template('edit_expense.html', expense=expense, categories=categories,
+                           currencies=exchange_rates.currencies(g.storage))
 
 @app.route('/expenses/<int:expense_id>/edit', methods=['POST'])
 @requires_signin
 @load_expense
 def edit_expense(expense, user_id, expense_id):
     expense_data = utils.extract_expense_data(request.form)
+    currency = utils.extract_currency(request.form)
+    currencies = exchange_rates.currencies(g.storage)
 
     errors = utils.expense_data_errors(expense_data)
+    errors.extend(utils.errors_for_currency(currency, currencies))
+    if not errors:
+        errors = utils.errors_for_converted_amount(expense_data, currency)
     if errors:
         for error in errors:
             flash(error, 'error')
 
-        categories = g.storage.get_categories()
-        expense_data['id'] = expense_id
-        return render_template('edit_expense.html', expense=expense_data, categories=categories)
+        # The form shows the submitted values over the stored ones
+        categories = category_registry.ordered(g.storage)
+        return render_template('edit_expense.html', expense=expense, categories=categories,
+                               currencies=currencies)
 
     else:
         try:
-            g.storage.update_expense(user_id, expense_id, **expense_data)
+            g.storage.update_expense(user_id, expense_id, currency=currency, **expense_data)
             flash('Expense updated successfully', 'success')
+            flash_budget_alerts(user_id)
             return redirect(url_for('expense_list'))
         except ValueError:
             abort(500)
@@ -146,30 +703,78 @@ def delete_expense(expense, user_id, expense_id):
     flash('Expense deleted successfully', 'success')
     return redirect(url_for('expense_list'))
 
+# Deletes, recategorizes or shifts the dates of many expenses with one
+# statement. JSON clients get the result for every id.
+@app.route('/expenses/bulk', methods=['POST'])
+@requires_signin
+def bulk_edit_expenses(user_id):
+    action, expense_ids, arguments, errors = utils.bulk_request(request.form)
+    wants_json = request.accept_mimetypes.best == 'application/json'
+    if errors:
+        if wants_json:
+            return jsonify(errors=errors), 400
+        for error in errors:
+            flash(error, 'error')
+        return redirect(url_for('expense_list'))
+
+    if action == 'delete':
+        results = g.storage.delete_expenses(user_id, expense_ids)
+    elif action == 'recategorize':
+        results = g.storage.recategorize_expenses(user_id, expense_ids,
+                                                  arguments['category_id'])
+    else:
+        results = g.storage.shift_expense_dates(user_id, expense_ids,
+                                                arguments['days'])
+
+    if wants_json:
+        return jsonify(results={str(expense_id): status
+                                for expense_id, status in results.items()})
+
+    # Deleting only lowers totals, so it raises no budget alerts
+    if action != 'delete':
+        flash_budget_alerts(user_id)
+
+    statuses = list(results.values())
+    done = statuses.count('deleted') + statuses.count('updated')
+    flash(f'{done} of {len(statuses)} expenses '
+          f'{"deleted" if action == "delete" else "updated"}', 'success')
+    if statuses.count('future'):
+        flash(f'{statuses.count("future")} expenses were not moved '
+              'because they would be in the future', 'error')
+    if statuses.count('not_found'):
+        flash(f'{statuses.count("not_found")} expenses were not found', 'error')
+    return redirect(url_for('expense_list'))
+
 @app.route('/analytics', methods=['GET'])
 @requires_signin
+@cached_page
 def analytics_view(user_id):
+    currencies = exchange_rates.currencies(g.storage)
+    budgets = g.storage.get_budgets(user_id, utils.current_month())
     if request.args:
         if request.args.get('grouping_option'):
-            print(request.args)
             grouping_option = request.args.get('grouping_option')
             date_from = request.args.get('date_from')
             date_to = request.args.get('date_to')
-
-            groups_data = g.storage.get_grouped_data(user_id, grouping_option, date_from, date_to)
-            # Processing analytics results to the right format for the template
-            for group in groups_data:
-                if grouping_option in ('week','month','day'):
-                    group['group_value'] = group['group_value'].strftime('%Y-%m-%d')
-                group['total_amount'] /= 100
-                group['avg_amount'] /= 100
-
-            return render_template('analytics.html', groups_data=groups_data)
+            currency = utils.report_currency(request.args, currencies)
+
+            groups_data, pivot = grouped_analytics(user_id, grouping_option,
+                                                   date_from, date_to, currency)
+            return render_template('analytics.html', currencies=currencies,
+                                   currency=currency, budgets=budgets,
+                                   **analytics_template_args(groups_data, pivot,
+                                                             grouping_option))
         else:
             flash('You must select a grouping option', 'error')
-            return render_template('analytics.html')
+            return render_template('analytics.html', currencies=currencies,
+                                   budgets=budgets)
+
+    return render_template('analytics.html', currencies=currencies, budgets=budgets)
 
-    return render_template('analytics.html')
+@app.route('/metrics', methods=['GET'])
+def metrics_view():
+    return Response(metrics.render_metrics(),
+                    mimetype='text/plain; version=0.0.4')
 
 @app.route('/sign_up', methods=['GET', 'POST'])
 def sign_up():
@@ -184,7 +789,7 @@ def sign_up():
                 flash(error, 'error')
             return render_template('sign_up.html')
 
-        password_hash = utils.get_hashed_password()
+        password_hash = utils.get_hashed_password(password)
         g.storage.create_new_user(username, password_hash)
         flash('Signed up successfully. You can sign in now.')
         return redirect(url_for('sign_in'))
@@ -198,13 +803,13 @@ def sign_in():
         username = request.form.get('username', '').strip()
         password = request.form.get('password', '').strip()
 
-        if utils.valid_credentials(username, password):
-            user_id = g.storage.get_user_id(username)
+        user = utils.authenticate(username, password)
+        if user:
+            session.regenerate()
             session['user_signed_in'] = {
-                'username':username,
-                'user_id': user_id
+                'username': user['user_name'],
+                'user_id': user['id']
             }
-            session.modified = True
             flash('Signed in successfully.')
             return redirect(url_for('index'))
         else:
@@ -214,7 +819,6 @@ def sign_in():
 @app.route('/sign_out', methods=['GET'])
 def sign_out():
     user = session.pop('user_signed_in', None)
-    session.modified = True
     if user:
         flash('You were signed out successfully. Bye!')
     return redirect(url_for('sign_in'))
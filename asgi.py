@@ -0,0 +1,432 @@
+"""
+ASGI entry point for high-concurrency deployments:
+
+    hypercorn asgi:application --workers 1
+
+The hot pages (expense list, expense forms, analytics, sign in/up/out)
+are served by async Quart views on the async storage selected with
+EXPENSES_ASYNC_STORAGE_BACKEND. Every other URL (import, export,
+/metrics, ...) is passed to the Flask app from app.py, which also
+provides the session secret and session store so both share signed-in
+sessions.
+
+Needs the optional async dependencies: pip install quart 'psycopg[binary,pool]'
+"""
+import asyncio
+import time
+from datetime import date
+from functools import wraps
+from hypercorn.middleware import AsyncioWSGIMiddleware
+from quart.sessions import SessionInterface
+from quart.wrappers.response import DataBody
+from quart import (
+    Quart,
+    Response,
+    make_response,
+    render_template,
+    redirect,
+    url_for,
+    g,
+    session,
+    abort,
+    request,
+    flash,
+    stream_template,
+)
+from werkzeug.exceptions import MethodNotAllowed, NotFound
+from werkzeug.routing import RequestRedirect
+from app import (
+    app as wsgi_app,
+    analytics_template_args,
+    cached_page_response,
+    frame_report,
+    page_cursor,
+    page_version,
+)
+from expense_tracker import analytics, utils, config, group_commit, instrumentation
+from expense_tracker.async_storage import create_async_storage, close_async_pools
+from expense_tracker.categories import category_registry
+from expense_tracker.currencies import exchange_rates
+from expense_tracker.passwords import HashingBusy, password_hasher
+from expense_tracker.sessions import ServerSideSessionMixin
+from expense_tracker.analytics_cache import analytics_cache
+from expense_tracker.page_cache import page_cache, page_key, add_cache_headers
+
+
+class AsyncServerSideSessionInterface(ServerSideSessionMixin, SessionInterface):
+    # The session store blocks, so only cache misses and saves
+    # are run in a worker thread
+    async def open_session(self, app, request):
+        sid, version = self._session_key(app, request)
+        data = None
+        if sid:
+            data = self.store.cached(sid, version)
+            if data is None:
+                data = await asyncio.to_thread(self.store.load, sid, version)
+        return self._make_session(sid, version, data)
+
+    async def save_session(self, app, session, response):
+        if session.modified:
+            cookie_value = await asyncio.to_thread(self._save, app, session)
+        else:
+            cookie_value = self._save(app, session)
+        if response is not None:
+            self._write_cookie(app, session, response, cookie_value)
+
+
+app = Quart(__name__)
+app.secret_key = wsgi_app.secret_key
+app.session_interface = AsyncServerSideSessionInterface(wsgi_app.session_interface.store)
+
+app.jinja_env.filters['to_currency'] = utils.to_currency
+app.jinja_env.filters['cents_to_currency'] = utils.cents_to_currency
+app.jinja_env.filters['format_datetime'] = utils.format_datetime
+
+@app.context_processor
+async def inject_form():
+    return {'form': await request.form}
+
+# Templates link to pages only the Flask app serves
+def build_wsgi_url(error, endpoint, values):
+    adapter = wsgi_app.url_map.bind('', script_name=request.root_path)
+    return adapter.build(endpoint, values)
+
+app.url_build_error_handlers.append(build_wsgi_url)
+
+@app.after_serving
+async def close_pools():
+    await close_async_pools()
+
+def requires_signin(func):
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        user = session.get('user_signed_in')
+        if not user:
+            await flash('You must be signed in')
+            return redirect(url_for('sign_in'))
+
+        return await func(user['user_id'], *args, **kwargs)
+    return wrapper
+
+def load_expense(func):
+    @wraps(func)
+    async def wrapper(user_id, *args, **kwargs):
+        expense_id = kwargs.get('expense_id')
+        expense = await g.storage.find_expense_by_id(user_id, expense_id)
+        if not expense:
+            abort(404, description='Expense record not found')
+
+        return await func(expense, user_id, *args, **kwargs)
+    return wrapper
+
+async def flash_budget_alerts(user_id):
+    alerts = await g.storage.pop_budget_alerts(user_id)
+    if alerts:
+        category_names = await category_registry.by_id_async(g.storage)
+        for message in utils.budget_alert_messages(alerts, category_names):
+            await flash(message, 'error')
+
+def cached_page(func):
+    @wraps(func)
+    async def wrapper(user_id, *args, **kwargs):
+        if '_flashes' in session:
+            return await func(user_id, *args, **kwargs)
+
+        g.data_version = await g.storage.get_data_version(user_id)
+        version = page_version(g.data_version, await exchange_rates.refresh_async(g.storage))
+        key = page_key(user_id, version, request.path, request.args)
+        etag, cached = cached_page_response(Response, key, request.if_none_match)
+        if cached is not None:
+            return cached
+
+        response = await make_response(await func(user_id, *args, **kwargs))
+        if response.status_code != 200 or '_flashes' in session:
+            return response
+        if isinstance(response.response, DataBody):
+            page_cache.set(key, await response.get_data())
+        return add_cache_headers(response, etag)
+    return wrapper
+
+
+@app.before_request
+async def create_db_storage():
+    g.request_started = time.perf_counter()
+    g.storage = await create_async_storage()
+
+@app.teardown_appcontext
+async def teardown_db(exception=None):
+    if hasattr(g, 'storage'):
+        await g.storage.close_connection()
+
+@app.after_request
+async def add_request_profile(response):
+    started = g.get('request_started')
+    if started is None:
+        return response
+
+    total = time.perf_counter() - started
+    storage = g.get('storage')
+    db_time = storage.db_time if storage else 0.0
+    query_count = storage.query_count if storage else 0
+
+    response.headers['Server-Timing'] = (
+        f'db;dur={db_time * 1000:.1f};desc="{query_count} queries", '
+        f'total;dur={total * 1000:.1f}'
+    )
+
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    instrumentation.request_duration.observe(route, total)
+    instrumentation.request_db_duration.observe(route, db_time)
+    return response
+
+@app.errorhandler(HashingBusy)
+async def hashing_busy(error):
+    await flash('Too many sign-in attempts right now. Please try again in a moment.', 'error')
+    template = 'sign_up.html' if request.endpoint == 'sign_up' else 'sign_in.html'
+    return await render_template(template), 429, {'Retry-After': '1'}
+
+@app.route('/')
+async def index():
+    return redirect(url_for('expense_list'))
+
+@app.route('/expenses')
+@requires_signin
+@cached_page
+async def expense_list(user_id):
+    if request.args.get('stream'):
+        return await streamed_expense_list(user_id)
+
+    after = page_cursor(request.args)
+    expenses, next_key = await g.storage.get_user_expenses_page(
+        user_id, config.EXPENSES_PAGE_SIZE, after
+    )
+
+    next_cursor = utils.encode_page_cursor(next_key) if next_key else None
+    categories = await category_registry.ordered_async(g.storage)
+    currencies = await exchange_rates.currencies_async(g.storage)
+    currency = utils.report_currency(request.args, currencies)
+    return await render_template('expense_list.html', expenses=expenses,
+                                 next_cursor=next_cursor, categories=categories,
+                                 currencies=currencies, currency=currency,
+                                 amounts=exchange_rates.convert_records(expenses, currency),
+                                 budgets=await g.storage.get_budgets(user_id,
+                                                                     utils.current_month()))
+
+async def streamed_expense_list(user_id):
+    # Before the cursor opens, as in the Flask app
+    categories = await category_registry.ordered_async(g.storage)
+    rows = g.storage.iter_user_expenses(user_id)
+    first = await anext(rows, None)
+    if first is None:
+        return await render_template('expense_list.html', expenses=[])
+
+    async def expenses():
+        yield first
+        async for row in rows:
+            yield row
+
+    return await stream_template('expense_list.html', expenses=expenses(),
+                                 categories=categories)
+
+@app.route('/expenses/new')
+@requires_signin
+async def new_expense_view(user_id):
+    categories = await category_registry.ordered_async(g.storage)
+    return await render_template('add_expense.html', categories=categories,
+                                 current_date=date.today(),
+                                 currencies=await exchange_rates.currencies_async(g.storage))
+
+@app.route('/expenses', methods=['POST'])
+@requires_signin
+async def create_expense(user_id):
+    form = await request.form
+    expense_data = utils.extract_expense_data(form)
+    currency = utils.extract_currency(form)
+    currencies = await exchange_rates.currencies_async(g.storage)
+
+    category_ids = await category_registry.ids_async(g.storage)
+    errors = utils.expense_data_errors(expense_data, category_ids)
+    errors.extend(utils.errors_for_currency(currency, currencies))
+    if not errors:
+        errors = utils.errors_for_converted_amount(expense_data, currency)
+    if errors:
+        for error in errors:
+            await flash(error, 'error')
+
+        categories = await category_registry.ordered_async(g.storage)
+        return await render_template('add_expense.html', categories=categories,
+                                     current_date=date.today(), currencies=currencies)
+
+    try:
+        if config.GROUP_COMMIT:
+            expense_id = await asyncio.wrap_future(
+                group_commit.writer.submit(user_id, currency=currency, **expense_data))
+        else:
+            expense_id = await g.storage.create_new_expense(user_id, currency=currency,
+                                                            **expense_data)
+        if expense_id:
+            await flash('Expense created successfully', 'success')
+            await flash_budget_alerts(user_id)
+            return redirect(url_for('expense_list'))
+        else:
+            abort(500)
+    except ValueError:
+        abort(500)
+
+@app.route('/expenses/<int:expense_id>/edit', methods=['GET'])
+@requires_signin
+@load_expense
+async def edit_expense_view(expense, user_id, expense_id):
+    categories = await category_registry.ordered_async(g.storage)
+    return await render_template('edit_expense.html', expense=expense,
+                                 categories=categories,
+                                 currencies=await exchange_rates.currencies_async(g.storage))
+
+@app.route('/expenses/<int:expense_id>/edit', methods=['POST'])
+@requires_signin
+@load_expense
+async def edit_expense(expense, user_id, expense_id):
+    form = await request.form
+    expense_data = utils.extract_expense_data(form)
+    currency = utils.extract_currency(form)
+    currencies = await exchange_rates.currencies_async(g.storage)
+
+    category_ids = await category_registry.ids_async(g.storage)
+    errors = utils.expense_data_errors(expense_data, category_ids)
+    errors.extend(utils.errors_for_currency(currency, currencies))
+    if not errors:
+        errors = utils.errors_for_converted_amount(expense_data, currency)
+    if errors:
+        for error in errors:
+            await flash(error, 'error')
+
+        categories = await category_registry.ordered_async(g.storage)
+        return await render_template('edit_expense.html', expense=expense,
+                                     categories=categories, currencies=currencies)
+
+    try:
+        await g.storage.update_expense(user_id, expense_id, currency=currency, **expense_data)
+        await flash('Expense updated successfully', 'success')
+        await flash_budget_alerts(user_id)
+        return redirect(url_for('expense_list'))
+    except ValueError:
+        abort(500)
+
+@app.route('/expenses/<int:expense_id>/delete', methods=['POST'])
+@requires_signin
+@load_expense
+async def delete_expense(expense, user_id, expense_id):
+    await g.storage.delete_expense_by_id(user_id, expense_id)
+    await flash('Expense deleted successfully', 'success')
+    return redirect(url_for('expense_list'))
+
+async def grouped_analytics(user_id, grouping_option, date_from, date_to, currency='USD'):
+    if not analytics.enabled():
+        groups_data = await analytics_cache.grouped_data_async(
+            g.storage, user_id, grouping_option, date_from, date_to,
+            g.get('data_version'), currency
+        )
+        return groups_data, None
+
+    async def report():
+        frame = await analytics.frame_cache.load_async(g.storage, user_id,
+                                                       g.get('data_version'))
+        return frame_report(frame, grouping_option, date_from, date_to, currency,
+                            await category_registry.by_id_async(g.storage))
+
+    return await analytics_cache.cached_async(g.storage, 'numpy', user_id, grouping_option,
+                                              date_from, date_to, g.get('data_version'),
+                                              currency, report)
+
+@app.route('/analytics', methods=['GET'])
+@requires_signin
+@cached_page
+async def analytics_view(user_id):
+    currencies = await exchange_rates.currencies_async(g.storage)
+    budgets = await g.storage.get_budgets(user_id, utils.current_month())
+    if request.args:
+        grouping_option = request.args.get('grouping_option')
+        if grouping_option:
+            date_from = request.args.get('date_from')
+            date_to = request.args.get('date_to')
+            currency = utils.report_currency(request.args, currencies)
+
+            groups_data, pivot = await grouped_analytics(user_id, grouping_option,
+                                                         date_from, date_to, currency)
+            return await render_template('analytics.html', currencies=currencies,
+                                         currency=currency, budgets=budgets,
+                                         **analytics_template_args(groups_data, pivot,
+                                                                   grouping_option))
+        else:
+            await flash('You must select a grouping option', 'error')
+
+    return await render_template('analytics.html', currencies=currencies, budgets=budgets)
+
+@app.route('/sign_up', methods=['GET', 'POST'])
+async def sign_up():
+    if request.method == 'GET':
+        return await render_template('sign_up.html')
+
+    form = await request.form
+    username = form.get('username', '').strip()
+    password = form.get('password', '').strip()
+    username_taken = bool(username) and bool(await g.storage.get_user_id(username))
+    errors = utils.sign_up_credentials_errors(username, password, username_taken)
+    if errors:
+        for error in errors:
+            await flash(error, 'error')
+        return await render_template('sign_up.html')
+
+    password_hash = await password_hasher.hash_async(password)
+    await g.storage.create_new_user(username, password_hash)
+    await flash('Signed up successfully. You can sign in now.')
+    return redirect(url_for('sign_in'))
+
+@app.route('/sign_in', methods=['GET', 'POST'])
+async def sign_in():
+    if request.method == 'GET':
+        return await render_template('sign_in.html')
+
+    form = await request.form
+    username = form.get('username', '').strip()
+    password = form.get('password', '').strip()
+
+    user = await utils.authenticate_async(g.storage, username, password)
+    if user:
+        session.regenerate()
+        session['user_signed_in'] = {
+            'username': user['user_name'],
+            'user_id': user['id']
+        }
+        await flash('Signed in successfully.')
+        return redirect(url_for('index'))
+
+    await flash('Wrong credentials', 'error')
+    return await render_template('sign_in.html')
+
+@app.route('/sign_out', methods=['GET'])
+async def sign_out():
+    user = session.pop('user_signed_in', None)
+    if user:
+        await flash('You were signed out successfully. Bye!')
+    return redirect(url_for('sign_in'))
+
+
+wsgi_fallback = AsyncioWSGIMiddleware(wsgi_app)
+
+def served_by_async_app(scope):
+    adapter = app.url_map.bind('', path_info=scope['path'])
+    try:
+        adapter.match(scope['path'], method=scope['method'])
+    except (NotFound, MethodNotAllowed):
+        return False
+    except RequestRedirect:
+        pass
+
+    return True
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and not served_by_async_app(scope):
+        await wsgi_fallback(scope, receive, send)
+    else:
+        await app(scope, receive, send)
@@ -0,0 +1,117 @@
+"""
+Compares the SQL and NumPy analytics paths on one large history.
+
+Seeds a single benchmark user with --rows expenses (replacing previous
+benchmark data) and times, as the median of --repeat runs:
+
+    sql_grouped     get_grouped_data for each grouping (daily rollups)
+    sql_rich        monthly percentiles, running total, moving average and
+                    month-over-month delta, plus the category-by-month
+                    pivot, written as SQL aggregates and window functions
+    numpy_load      get_expense_columns and ExpenseFrame.parse, paid once
+                    per data version
+    numpy_grouped   analytics.grouped_report for each grouping, which
+                    includes all of the statistics above
+
+    python -m benchmarks.bench_analytics --rows 1000000
+"""
+import argparse
+import json
+import statistics
+import time
+from benchmarks import seed
+from benchmarks.common import current_commit, require_local_database
+from expense_tracker import analytics
+from expense_tracker.db_storage import ExpensesDatabaseStorage
+
+GROUPINGS = ('day', 'week', 'month', 'category')
+
+RICH_MONTHLY_QUERY = """
+    WITH monthly AS (
+        SELECT DATE_TRUNC('month', transaction_datetime) AS month,
+               COUNT(*) AS txn_count,
+               SUM(amount_cents_usd) AS total,
+               percentile_cont(ARRAY[0.5, 0.9])
+                   WITHIN GROUP (ORDER BY amount_cents_usd) AS percentiles
+        FROM expenses
+        WHERE user_id = %s
+        GROUP BY 1
+    )
+    SELECT month, txn_count, total, percentiles,
+           SUM(total) OVER (ORDER BY month) AS running_total,
+           AVG(total) OVER (ORDER BY month ROWS 2 PRECEDING) AS moving_avg,
+           total - LAG(total) OVER (ORDER BY month) AS delta
+    FROM monthly
+    ORDER BY month
+"""
+
+PIVOT_QUERY = """
+    SELECT category_id, DATE_TRUNC('month', transaction_datetime), SUM(amount_cents_usd)
+    FROM expenses
+    WHERE user_id = %s AND category_id IS NOT NULL
+    GROUP BY 1, 2
+"""
+
+def median_seconds(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return round(statistics.median(timings), 4)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--days', type=int, default=5 * 365)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if analytics.np is None:
+        raise SystemExit('NumPy is not installed: pip install numpy')
+    require_local_database()
+    user_id, = seed.seed(users=1, expenses_per_user=args.rows, days=args.days)
+
+    storage = ExpensesDatabaseStorage(is_test_env=True)
+    try:
+        cursor = storage.connection.cursor()
+        category_names = {category['id']: category['name']
+                          for category in storage.get_categories()}
+
+        def sql_grouped():
+            for grouping_option in GROUPINGS:
+                storage.get_grouped_data(user_id, grouping_option)
+
+        def sql_rich():
+            cursor.execute(RICH_MONTHLY_QUERY, (user_id, ))
+            cursor.fetchall()
+            cursor.execute(PIVOT_QUERY, (user_id, ))
+            cursor.fetchall()
+
+        def numpy_load():
+            return analytics.ExpenseFrame.parse(storage.get_expense_columns(user_id))
+
+        frame = numpy_load()
+
+        def numpy_grouped():
+            for grouping_option in GROUPINGS:
+                analytics.grouped_report(frame, grouping_option, category_names)
+
+        report = {
+            'commit': current_commit(),
+            'rows': len(frame),
+            'seconds': {
+                'sql_grouped': median_seconds(sql_grouped, args.repeat),
+                'sql_rich': median_seconds(sql_rich, args.repeat),
+                'numpy_load': median_seconds(numpy_load, args.repeat),
+                'numpy_grouped': median_seconds(numpy_grouped, args.repeat),
+            },
+        }
+        storage.connection.rollback()
+    finally:
+        storage.close_connection()
+
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
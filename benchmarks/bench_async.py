@@ -0,0 +1,158 @@
+"""
+Requests/sec at high client concurrency against one server process.
+
+Starts hypercorn with a single worker for each target, signs in a
+seeded benchmark user and keeps --clients keep-alive connections busy
+requesting --path for --seconds. Targets:
+
+    wsgi              the Flask app (app:app) on hypercorn's thread pool
+    asgi-threaded     asgi:application with EXPENSES_ASYNC_STORAGE_BACKEND=threaded
+    asgi-psycopg      asgi:application on the asyncio psycopg 3 pool
+
+    python -m benchmarks.seed --users 10 --expenses-per-user 2000
+    python -m benchmarks.bench_async --clients 500 --seconds 20
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import subprocess
+import sys
+import time
+from benchmarks import seed
+from benchmarks.common import current_commit, percentile, require_local_database
+from expense_tracker import config
+
+TARGETS = {
+    'wsgi': ('app:app', {}),
+    'asgi-threaded': ('asgi:application', {'EXPENSES_ASYNC_STORAGE_BACKEND': 'threaded'}),
+    'asgi-psycopg': ('asgi:application', {'EXPENSES_ASYNC_STORAGE_BACKEND': 'psycopg'}),
+}
+
+def start_server(target, port, pool_size):
+    application, extra_env = TARGETS[target]
+    env = dict(os.environ, EXPENSES_DB_NAME=config.TEST_DB_NAME,
+               EXPENSES_DB_POOL_MAX_SIZE=str(pool_size), **extra_env)
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'hypercorn', '--workers', '1',
+         '--bind', f'127.0.0.1:{port}', application],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/sign_in')
+            connection.getresponse().read()
+            return server
+        except OSError:
+            time.sleep(0.2)
+
+    server.kill()
+    raise RuntimeError(f'{target} server did not start')
+
+def session_cookie(port):
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    body = f'username={seed.BENCH_USER_PREFIX}0&password={seed.BENCH_PASSWORD}'
+    connection.request('POST', '/sign_in', body=body, headers={
+        'Content-Type': 'application/x-www-form-urlencoded',
+    })
+    response = connection.getresponse()
+    response.read()
+    cookie = response.getheader('Set-Cookie')
+    if response.status != 302 or not cookie:
+        raise RuntimeError('Sign-in failed, seed the benchmark users first')
+    return cookie.split(';', 1)[0]
+
+async def read_response(reader):
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Connection closed')
+    status = int(status_line.split()[1])
+
+    headers = {}
+    while (line := await reader.readline()) not in (b'\r\n', b''):
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+
+    return status
+
+async def client_loop(port, request_bytes, deadline, latencies, errors):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            writer.write(request_bytes)
+            status = await read_response(reader)
+            latencies.append(time.perf_counter() - started)
+            if status >= 400:
+                errors.append(status)
+    except (ConnectionError, asyncio.IncompleteReadError):
+        errors.append('connection')
+    finally:
+        writer.close()
+
+async def run_load(port, path, cookie, clients, seconds):
+    request_bytes = (
+        f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nCookie: {cookie}\r\n\r\n'
+    ).encode()
+    latencies = []
+    errors = []
+    deadline = time.monotonic() + seconds
+    await asyncio.gather(*(
+        client_loop(port, request_bytes, deadline, latencies, errors)
+        for _ in range(clients)
+    ))
+
+    latencies.sort()
+    return {
+        'requests_per_sec': round(len(latencies) / seconds, 1),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 1) if latencies else None,
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1) if latencies else None,
+        'errors': len(errors),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--clients', type=int, default=500)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--path', default='/expenses')
+    parser.add_argument('--pool-size', type=int, default=20)
+    parser.add_argument('--targets', nargs='*', choices=TARGETS, default=list(TARGETS))
+    parser.add_argument('--port', type=int, default=5099)
+    args = parser.parse_args()
+
+    require_local_database()
+    report = {
+        'commit': current_commit(),
+        'clients': args.clients,
+        'path': args.path,
+        'pool_size': args.pool_size,
+        'targets': {},
+    }
+    for target in args.targets:
+        server = start_server(target, args.port, args.pool_size)
+        try:
+            cookie = session_cookie(args.port)
+            report['targets'][target] = asyncio.run(
+                run_load(args.port, args.path, cookie, args.clients, args.seconds)
+            )
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
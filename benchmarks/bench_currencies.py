@@ -0,0 +1,106 @@
+"""
+Times reports in a converted currency on synthetic data (no database).
+
+Builds --rows expenses over --days days with --currencies daily rate
+series and times, as the median of --repeat runs:
+
+    per_row         the rate of every expense looked up on its own, as
+                    converting rows one at a time would
+    grouped         ExchangeRates.convert_grouped over the per-category
+                    daily rows get_grouped_data(by_day=True) returns
+    frame           ExchangeRates.convert_frame over an ExpenseFrame,
+                    then the NumPy category report on it
+
+    python -m benchmarks.bench_currencies --rows 1000000
+"""
+import argparse
+import json
+import random
+from bisect import bisect_right
+from datetime import date, timedelta
+from decimal import Decimal
+from benchmarks.bench_analytics import median_seconds
+from benchmarks.common import current_commit
+from expense_tracker import analytics
+from expense_tracker.currencies import EPOCH_ORDINAL, ExchangeRates
+
+CATEGORIES = 8
+
+class SyntheticRates:
+    def __init__(self, currencies, days, start):
+        rng = random.Random(0)
+        self.rows = [
+            (f'C{index:02d}', start + timedelta(days=day), Decimal(f'{rng.uniform(0.5, 150):.4f}'))
+            for index in range(currencies)
+            for day in range(days)
+        ]
+
+    def get_exchange_rates(self):
+        return self.rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--days', type=int, default=5 * 365)
+    parser.add_argument('--currencies', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if analytics.np is None:
+        raise SystemExit('NumPy is not installed: pip install numpy')
+    np = analytics.np
+    start = date(2020, 1, 1)
+    rates = ExchangeRates(ttl=3600)
+    rates.refresh(SyntheticRates(args.currencies, args.days, start))
+    currency = 'C00'
+
+    rng = np.random.default_rng(0)
+    first_day = start.toordinal() - EPOCH_ORDINAL
+    days = np.sort(rng.integers(first_day, first_day + args.days, args.rows)).astype(np.int32)
+    amounts = rng.integers(100, 50_000, args.rows, dtype=np.int64)
+    category_ids = rng.integers(1, CATEGORIES + 1, args.rows).astype(np.int32)
+    frame = analytics.ExpenseFrame(days, amounts, category_ids)
+
+    # The rows get_grouped_data(by_day=True) returns for the category grouping
+    keys = days.astype(np.int64) * (CATEGORIES + 1) + category_ids
+    unique_keys, group_index = np.unique(keys, return_inverse=True)
+    totals = np.bincount(group_index, weights=amounts).astype(np.int64)
+    counts = np.bincount(group_index)
+    grouped_rows = [
+        {'group_value': f'Category {key % (CATEGORIES + 1)}',
+         'day': date.fromordinal(int(key // (CATEGORIES + 1)) + EPOCH_ORDINAL),
+         'txn_count': int(count), 'total_amount': int(total)}
+        for key, count, total in zip(unique_keys.tolist(), counts.tolist(), totals.tolist())
+    ]
+
+    row_days = (days.astype(np.int64) + EPOCH_ORDINAL).tolist()
+    row_amounts = amounts.tolist()
+    day_ordinals = rates._days[currency]
+    day_rates = rates._rates[currency]
+
+    def per_row():
+        return [round(amount * day_rates[max(bisect_right(day_ordinals, day) - 1, 0)])
+                for day, amount in zip(row_days, row_amounts)]
+
+    def grouped():
+        rates._daily = {}
+        return rates.convert_grouped(grouped_rows, currency)
+
+    def converted_frame():
+        return analytics.grouped_report(rates.convert_frame(frame, currency), 'category',
+                                        {index: f'Category {index}'
+                                         for index in range(1, CATEGORIES + 1)})
+
+    print(json.dumps({
+        'commit': current_commit(),
+        'rows': args.rows,
+        'grouped_rows': len(grouped_rows),
+        'seconds': {
+            'per_row': median_seconds(per_row, args.repeat),
+            'grouped': median_seconds(grouped, args.repeat),
+            'frame': median_seconds(converted_frame, args.repeat),
+        },
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
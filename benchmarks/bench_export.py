@@ -0,0 +1,61 @@
+"""
+Measures /expenses/export throughput and memory on a large history.
+
+Seeds a user with --rows expenses in the local test database, streams
+the export through the Flask test client and reports MB/s, the peak
+Python heap allocated while exporting and the process peak RSS:
+
+    python -m benchmarks.bench_export --rows 500000 --format csv
+"""
+import argparse
+import json
+import resource
+import time
+import tracemalloc
+from secrets import token_hex
+from benchmarks.bench_import import sample_expenses
+from benchmarks.common import load_app, signed_in_client
+from expense_tracker.db_storage import ExpensesDatabaseStorage
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=500_000)
+    parser.add_argument('--format', choices=('csv', 'jsonl'), default='csv')
+    args = parser.parse_args()
+
+    app = load_app()
+    storage = ExpensesDatabaseStorage(is_test_env=True)
+    username = f'bench_{token_hex(6)}'
+    user_id = storage.create_new_user(username, 'x' * 60)
+    storage.import_expenses(user_id, sample_expenses(args.rows))
+
+    try:
+        client = signed_in_client(app, username, user_id)
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        response = client.get(f'/expenses/export?format={args.format}', buffered=False)
+        total_bytes = sum(len(chunk) for chunk in response.response)
+        response.close()
+        elapsed = time.perf_counter() - started
+        _, peak_heap = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        with storage.connection:
+            with storage.connection.cursor() as cursor:
+                cursor.execute('DELETE FROM expenses WHERE user_id = %s', (user_id, ))
+                cursor.execute('DELETE FROM users WHERE id = %s', (user_id, ))
+        storage.close_connection()
+
+    print(json.dumps({
+        'rows': args.rows,
+        'format': args.format,
+        'megabytes': round(total_bytes / 1e6, 1),
+        'megabytes_per_sec': round(total_bytes / 1e6 / elapsed, 1),
+        'peak_export_heap_mb': round(peak_heap / 1e6, 1),
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3, 1),
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Compares concurrent expense creation with and without group commit.
+
+--clients threads each create --expenses-per-client expenses for a
+benchmark user, first through create_new_expense (one INSERT and commit
+per expense, each thread on its own pooled connection), then through
+the group commit writer with --batch-size and --max-wait-ms. Reports
+inserts per second and p50/p99 latency per expense for both:
+
+    python -m benchmarks.bench_group_commit --clients 8 --expenses-per-client 2000
+"""
+import argparse
+import json
+import threading
+import time
+from secrets import token_hex
+from benchmarks.bench_import import delete_user_expenses, sample_expenses
+from benchmarks.common import current_commit, percentile, require_local_database
+from expense_tracker.db_storage import ExpensesDatabaseStorage
+from expense_tracker.group_commit import GroupCommitWriter
+
+def run_clients(clients, expenses_per_client, create):
+    latencies = []
+    lock = threading.Lock()
+
+    def client():
+        timings = []
+        for expense_data in sample_expenses(expenses_per_client):
+            started = time.perf_counter()
+            create(expense_data)
+            timings.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(timings)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'inserts_per_sec': round(len(latencies) / elapsed),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--expenses-per-client', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--max-wait-ms', type=float, default=2)
+    args = parser.parse_args()
+
+    require_local_database()
+    storage = ExpensesDatabaseStorage(is_test_env=True)
+    user_id = storage.create_new_user(f'bench_{token_hex(6)}', 'x' * 60)
+    local = threading.local()
+
+    def create_directly(expense_data):
+        if not hasattr(local, 'storage'):
+            local.storage = ExpensesDatabaseStorage(is_test_env=True)
+        local.storage.create_new_expense(user_id, **expense_data)
+        local.storage.close_connection()
+
+    writer = GroupCommitWriter(args.batch_size, args.max_wait_ms / 1000,
+                               storage_factory=lambda: ExpensesDatabaseStorage(is_test_env=True))
+    results = {}
+    try:
+        results['one_commit_per_expense'] = run_clients(
+            args.clients, args.expenses_per_client, create_directly)
+        delete_user_expenses(storage, user_id)
+
+        results['group_commit'] = run_clients(
+            args.clients, args.expenses_per_client,
+            lambda expense_data: writer.create_new_expense(user_id, **expense_data))
+        results['group_commit'].update(writer.stats())
+        delete_user_expenses(storage, user_id)
+    finally:
+        writer.stop()
+        with storage.connection:
+            with storage.connection.cursor() as cursor:
+                cursor.execute('DELETE FROM users WHERE id = %s', (user_id, ))
+        storage.close_connection()
+
+    print(json.dumps({
+        'commit': current_commit(),
+        'clients': args.clients,
+        'expenses': args.clients * args.expenses_per_client,
+        'batch_size': args.batch_size,
+        'max_wait_ms': args.max_wait_ms,
+        'results': results,
+        'speedup': round(results['group_commit']['inserts_per_sec']
+                         / results['one_commit_per_expense']['inserts_per_sec'], 1),
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
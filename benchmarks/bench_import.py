@@ -0,0 +1,66 @@
+"""
+Compares bulk import against one create_new_expense call per row.
+
+Runs against the local test database (see config.TEST_DB_NAME) with the
+schema and migrations applied:
+
+    python -m benchmarks.bench_import --rows 5000
+"""
+import argparse
+import json
+import time
+from secrets import token_hex
+from benchmarks.common import require_local_database
+from expense_tracker.db_storage import ExpensesDatabaseStorage
+
+def sample_expenses(count):
+    for i in range(count):
+        yield {
+            'transaction_date': f'2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}',
+            'transaction_time': f'{i % 24:02d}:{i % 60:02d}',
+            'amount_usd': f'{(i % 10000) / 100 + 1:.2f}',
+            'description': f'Imported expense {i}',
+            'category_id': str(i % 8 + 1),
+        }
+
+def delete_user_expenses(storage, user_id):
+    with storage.connection:
+        with storage.connection.cursor() as cursor:
+            cursor.execute('DELETE FROM expenses WHERE user_id = %s', (user_id, ))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    require_local_database()
+    storage = ExpensesDatabaseStorage(is_test_env=True)
+    user_id = storage.create_new_user(f'bench_{token_hex(6)}', 'x' * 60)
+    results = {'rows': args.rows}
+    try:
+        started = time.perf_counter()
+        for expense_data in sample_expenses(args.rows):
+            storage.create_new_expense(user_id, **expense_data)
+        elapsed = time.perf_counter() - started
+        results['one_at_a_time_rows_per_sec'] = round(args.rows / elapsed)
+        delete_user_expenses(storage, user_id)
+
+        started = time.perf_counter()
+        storage.import_expenses(user_id, sample_expenses(args.rows),
+                                batch_size=args.batch_size)
+        elapsed = time.perf_counter() - started
+        results['bulk_import_rows_per_sec'] = round(args.rows / elapsed)
+        delete_user_expenses(storage, user_id)
+    finally:
+        with storage.connection:
+            with storage.connection.cursor() as cursor:
+                cursor.execute('DELETE FROM users WHERE id = %s', (user_id, ))
+        storage.close_connection()
+
+    results['speedup'] = round(results['bulk_import_rows_per_sec']
+                               / results['one_at_a_time_rows_per_sec'], 1)
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""
+Measures list, search, export and analytics queries before and after
+partitioning expenses by month.
+
+Seeds --users benchmark users with --expenses-per-user expenses each over
+--days days (replacing previous benchmark data), times every query for
+one user as the median of --repeat runs and counts the expenses
+partitions in its plan, then converts the test database's expenses table
+with expenses_partition_by_month (migration 0010) and measures again.
+The conversion is not undone; on an already partitioned table only the
+partitioned numbers are reported:
+
+    python -m benchmarks.bench_partitions --users 50 --expenses-per-user 20000 \\
+        --hash-partitions 4
+"""
+import argparse
+import json
+import statistics
+import time
+from datetime import date, timedelta
+from unittest import mock
+from benchmarks import seed
+from benchmarks.common import current_commit, require_local_database
+from expense_tracker import config
+from expense_tracker.db_storage import ExpensesDatabaseStorage, export_query
+
+# Analytics over a date range straight from expenses, as the rollups
+# are built and as ad-hoc reports run
+RANGE_TOTALS_QUERY = """
+    SELECT DATE_TRUNC('day', transaction_datetime), COUNT(*), SUM(amount_cents_usd)
+    FROM expenses
+    WHERE user_id = %s
+        AND transaction_datetime >= %s
+        AND transaction_datetime < %s
+    GROUP BY 1
+"""
+
+def cases(storage, user_id):
+    today = date.today()
+    month_from = (today - timedelta(days=60)).isoformat()
+    month_to = (today - timedelta(days=30)).isoformat()
+    quarter_start = today - timedelta(days=90)
+    # A page about a year back, as reached through "Older expenses"
+    with storage.connection:
+        with storage.connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT transaction_datetime, id FROM expenses
+                WHERE user_id = %s AND transaction_datetime < %s
+                ORDER BY transaction_datetime DESC, id DESC LIMIT 1
+                """,
+                (user_id, today - timedelta(days=365))
+            )
+            year_back = cursor.fetchone()
+
+    def export_month():
+        for _ in storage.iter_expenses_for_export(user_id, month_from, month_to):
+            pass
+
+    def range_totals():
+        with storage.connection:
+            with storage.connection.cursor() as cursor:
+                cursor.execute(RANGE_TOTALS_QUERY, (user_id, quarter_start, today))
+                return cursor.fetchall()
+
+    return {
+        'list_first_page': (
+            lambda: storage.get_user_expenses_page(user_id, config.EXPENSES_PAGE_SIZE),
+            None,
+        ),
+        'list_page_year_back': (
+            lambda: storage.get_user_expenses_page(user_id, config.EXPENSES_PAGE_SIZE, year_back),
+            None,
+        ),
+        'search_month': (
+            lambda: storage.search_expenses(user_id, config.EXPENSES_PAGE_SIZE,
+                                            date_from=month_from, date_to=month_to),
+            None,
+        ),
+        'export_month': (export_month, export_query(user_id, month_from, month_to)),
+        'analytics_quarter_from_expenses': (
+            range_totals, (RANGE_TOTALS_QUERY, (user_id, quarter_start, today)),
+        ),
+        'analytics_grouped_month': (
+            lambda: storage.get_grouped_data(user_id, 'month', month_from, None),
+            None,
+        ),
+        'analytics_full_history_columns': (
+            lambda: storage.get_expense_columns(user_id),
+            None,
+        ),
+    }
+
+def plan_relations(plan):
+    names = [plan['Relation Name']] if 'Relation Name' in plan else []
+    for subplan in plan.get('Plans', []):
+        names.extend(plan_relations(subplan))
+    return names
+
+def expenses_partitions_scanned(storage, func, statement):
+    if statement is None:
+        # Take the statement from the storage call itself
+        statements = []
+        def remember_statement(method, seconds, rows, query):
+            statements.append(query)
+        with mock.patch('expense_tracker.db_storage.record_storage_call', remember_statement):
+            func()
+        query, params = statements[-1], None
+    else:
+        query, params = statement
+
+    with storage.connection:
+        with storage.connection.cursor() as cursor:
+            if params is not None:
+                query = cursor.mogrify(query, params)
+            if isinstance(query, str):
+                query = query.encode()
+            cursor.execute(b'EXPLAIN (FORMAT JSON) ' + query)
+            plan = cursor.fetchone()[0]
+    return len([name for name in plan_relations(plan[0]['Plan'])
+                if name.startswith('expenses')])
+
+def measure(storage, user_id, repeat):
+    results = {}
+    for name, (func, statement) in cases(storage, user_id).items():
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        results[name] = {
+            'median_ms': round(statistics.median(timings) * 1000, 2),
+            'expenses_relations_scanned': expenses_partitions_scanned(storage, func, statement),
+        }
+    return results
+
+def is_partitioned(storage):
+    with storage.connection:
+        with storage.connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM expenses_partitioning')
+            return cursor.fetchone()[0] > 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--expenses-per-user', type=int, default=20_000)
+    parser.add_argument('--days', type=int, default=5 * 365)
+    parser.add_argument('--hash-partitions', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--no-seed', action='store_true',
+                        help='Reuse the benchmark users already in the database')
+    args = parser.parse_args()
+
+    require_local_database()
+    storage = ExpensesDatabaseStorage(is_test_env=True)
+    try:
+        if args.no_seed:
+            user_id = storage.get_user_id(f'{seed.BENCH_USER_PREFIX}0')
+        else:
+            user_id = seed.seed(args.users, args.expenses_per_user, args.days)[0]
+
+        results = {}
+        if not is_partitioned(storage):
+            results['unpartitioned'] = measure(storage, user_id, args.repeat)
+            started = time.perf_counter()
+            partitions = storage.partition_expenses(args.hash_partitions,
+                                                    config.PARTITION_MONTHS_AHEAD)
+            results['conversion'] = {
+                'monthly_partitions': partitions,
+                'seconds': round(time.perf_counter() - started, 1),
+            }
+        results['partitioned'] = measure(storage, user_id, args.repeat)
+    finally:
+        storage.close_connection()
+
+    print(json.dumps({
+        'commit': current_commit(),
+        'rows': args.users * args.expenses_per_user,
+        'hash_partitions': args.hash_partitions,
+        'results': results,
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
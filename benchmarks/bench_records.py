@@ -0,0 +1,100 @@
+"""
+Micro-benchmark of building and formatting expense list rows.
+
+Compares, for --rows synthetic rows (no database needed), the former
+path, where DictCursor rows were copied with dict(row) and each copy was
+reformatted in Python (float amount, strftime), with ExpenseRecord built
+from plain tuple rows and formatted by the template filters. Reports the
+best time over --repeat runs and the memory allocated for the rows:
+
+    python -m benchmarks.bench_records --rows 10000
+"""
+import argparse
+import json
+import time
+import tracemalloc
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from psycopg2.extras import DictRow
+from benchmarks.common import current_commit
+from expense_tracker.db_storage import ExpenseRecord, expense_records
+from expense_tracker.utils import cents_to_currency, format_datetime, to_currency
+
+COLUMNS = ('id', 'transaction_datetime', 'amount_cents_usd', 'description',
+           'user_id', 'category_id', 'category_name')
+
+def tuple_rows(count):
+    started = datetime(2024, 1, 1)
+    return [
+        (i, started + timedelta(minutes=i), 100 + i % 10000,
+         f'Expense {i}', i % 8 or None, f'Category {i % 8}')
+        for i in range(count)
+    ]
+
+def dict_cursor_rows(rows):
+    # What DictCursor hands back for SELECT e.*, c.name as category_name
+    cursor = SimpleNamespace(index=OrderedDict((name, i) for i, name in enumerate(COLUMNS)),
+                             description=COLUMNS)
+    results = []
+    for expense_id, transaction_datetime, cents, description, category_id, name in rows:
+        row = DictRow(cursor)
+        row[:] = [expense_id, transaction_datetime, cents, description, 7,
+                  category_id, name]
+        results.append(row)
+    return results
+
+def former_path(cursor_rows):
+    expenses = [dict(row) for row in cursor_rows]
+    for expense in expenses:
+        expense['amount_usd'] = expense.pop('amount_cents_usd') / 100
+        expense['transaction_datetime'] = expense['transaction_datetime'].strftime('%Y-%m-%d %H:%M')
+    rendered = [(expense['transaction_datetime'], to_currency(expense['amount_usd']))
+                for expense in expenses]
+    return expenses, rendered
+
+def record_path(cursor_rows):
+    expenses = expense_records(cursor_rows)
+    rendered = [(format_datetime(expense.transaction_datetime),
+                 cents_to_currency(expense.amount_cents_usd))
+                for expense in expenses]
+    return expenses, rendered
+
+def measure(path, cursor_rows, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        path(cursor_rows)
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    expenses, _ = path(cursor_rows)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del expenses
+    return {
+        'best_ms': round(min(timings) * 1000, 2),
+        'rows_kib': round(retained / 1024, 1),
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    rows = tuple_rows(args.rows)
+    former = measure(former_path, dict_cursor_rows(rows), args.repeat)
+    records = measure(record_path, rows, args.repeat)
+    print(json.dumps({
+        'commit': current_commit(),
+        'rows': args.rows,
+        'former': former,
+        'records': records,
+        'time_saved_ms': round(former['best_ms'] - records['best_ms'], 2),
+        'memory_saved_kib': round(former['rows_kib'] - records['rows_kib'], 1),
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Checks search_expenses latency on a large synthetic dataset.
+
+Seeds --users benchmark users with --expenses-per-user expenses each
+(1M rows by default, replacing previous benchmark data), then runs each
+search case --repeat times for one user. Reports p50/p95 latency, the
+indexes in the query plan, and whether p95 is within --target-ms. Exits
+with status 1 if any case misses the target:
+
+    python -m benchmarks.bench_search --users 10 --expenses-per-user 100000
+"""
+import argparse
+import json
+import time
+from datetime import date, timedelta
+from benchmarks import seed
+from benchmarks.common import current_commit, percentile, require_local_database
+from expense_tracker import config
+from expense_tracker.db_storage import ExpensesDatabaseStorage, expenses_page_query
+from expense_tracker.migrations import plan_index_names
+
+def search_cases(categories):
+    recent = (date.today() - timedelta(days=90)).isoformat()
+    return {
+        'common_word': {'text': 'coffee'},
+        'rare_word': {'text': 'dentist'},
+        'prefix': {'text': 'sta'},
+        'two_words': {'text': 'pizza place'},
+        'text_and_amount': {'text': 'pizza', 'min_cents': 2000},
+        'category_and_dates': {'category_id': categories['Travel'], 'date_from': recent},
+        'amount_range': {'min_cents': 10000, 'max_cents': 20000},
+    }
+
+def explain_indexes(storage, user_id, filters):
+    # The statement comes from the builder search_expenses uses,
+    # so the plan is the one it really gets
+    query, params = expenses_page_query(user_id, config.EXPENSES_PAGE_SIZE, **filters)
+    with storage.connection:
+        with storage.connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + query, params)
+            plan = cursor.fetchone()[0]
+    return sorted(plan_index_names(plan[0]['Plan']))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--expenses-per-user', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--target-ms', type=float, default=50)
+    parser.add_argument('--no-seed', action='store_true',
+                        help='Reuse the benchmark users already in the database')
+    args = parser.parse_args()
+
+    require_local_database()
+    storage = ExpensesDatabaseStorage(is_test_env=True)
+    try:
+        if args.no_seed:
+            user_id = storage.get_user_id(f'{seed.BENCH_USER_PREFIX}0')
+        else:
+            user_id = seed.seed(args.users, args.expenses_per_user)[0]
+        categories = {category['name']: category['id']
+                      for category in storage.get_categories()}
+
+        results = {}
+        for name, filters in search_cases(categories).items():
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                storage.search_expenses(user_id, config.EXPENSES_PAGE_SIZE, **filters)
+                timings.append(time.perf_counter() - started)
+
+            timings.sort()
+            p95_ms = percentile(timings, 0.95) * 1000
+            results[name] = {
+                'p50_ms': round(percentile(timings, 0.5) * 1000, 2),
+                'p95_ms': round(p95_ms, 2),
+                'indexes': explain_indexes(storage, user_id, filters),
+                'within_target': p95_ms <= args.target_ms,
+            }
+    finally:
+        storage.close_connection()
+
+    print(json.dumps({
+        'commit': current_commit(),
+        'rows': args.users * args.expenses_per_user,
+        'target_ms': args.target_ms,
+        'cases': results,
+    }, indent=2))
+    if not all(result['within_target'] for result in results.values()):
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Load test for POST /sign_in.
+
+Creates a user in the local test database and signs in from --clients
+threads for --seconds, once hashing inline in the request thread and
+once on the bcrypt process pool. Reports sign-ins/sec, sign-ins/sec per
+core and how many requests were turned away with 429:
+
+    python -m benchmarks.bench_sign_in --clients 16 --seconds 10
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from secrets import token_hex
+from benchmarks.common import load_app
+from expense_tracker import config
+from expense_tracker.db_storage import ExpensesDatabaseStorage
+from expense_tracker.passwords import PasswordHasher
+
+PASSWORD = 'BenchPassword'
+
+def run_load(app, username, clients, seconds):
+    counts = {'ok': 0, 'busy': 0, 'other': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client_loop():
+        client = app.test_client()
+        while time.perf_counter() < deadline:
+            response = client.post('/sign_in', data={
+                'username': username,
+                'password': PASSWORD,
+            })
+            key = {302: 'ok', 429: 'busy'}.get(response.status_code, 'other')
+            with lock:
+                counts[key] += 1
+
+    threads = [threading.Thread(target=client_loop) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    cores = os.cpu_count() or 1
+    return {
+        'sign_ins_per_sec': round(counts['ok'] / seconds, 1),
+        'sign_ins_per_sec_per_core': round(counts['ok'] / seconds / cores, 2),
+        'rejected_429': counts['busy'],
+        'errors': counts['other'],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    app = load_app()
+    from expense_tracker import utils
+
+    storage = ExpensesDatabaseStorage(is_test_env=True)
+    username = f'bench_{token_hex(6)}'
+    user_id = storage.create_new_user(
+        username, PasswordHasher(config.BCRYPT_ROUNDS, 0, 1).hash(PASSWORD)
+    )
+
+    results = {'clients': args.clients, 'cores': os.cpu_count()}
+    try:
+        for name, pool_size in (('inline', 0), ('process_pool', config.HASH_POOL_SIZE)):
+            hasher = PasswordHasher(config.BCRYPT_ROUNDS, pool_size,
+                                    config.HASH_MAX_PENDING)
+            utils.password_hasher = hasher
+            try:
+                results[name] = run_load(app, username, args.clients, args.seconds)
+            finally:
+                hasher.shutdown()
+    finally:
+        with storage.connection:
+            with storage.connection.cursor() as cursor:
+                cursor.execute('DELETE FROM users WHERE id = %s', (user_id, ))
+        storage.close_connection()
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+import os
+import subprocess
+import sys
+from expense_tracker import config
+
+LOCAL_HOSTS = ('', 'localhost', '127.0.0.1', '::1')
+
+def require_local_database():
+    # Benchmarks create and delete data in bulk, so they refuse to run
+    # against anything but a PostgreSQL server on this machine
+    host = os.environ.get('PGHOST', '')
+    if host not in LOCAL_HOSTS and not host.startswith('/'):
+        sys.exit(f'Benchmarks only run against a local PostgreSQL server (PGHOST={host})')
+
+def load_app():
+    """Imports the Flask app pointed at the test database."""
+    require_local_database()
+    config.DB_NAME = config.TEST_DB_NAME
+    from app import app
+    return app
+
+def signed_in_client(app, username, user_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_signed_in'] = {'username': username, 'user_id': user_id}
+    return client
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
@@ -0,0 +1,211 @@
+"""
+Drives the app under concurrent load and reports comparable numbers.
+
+Seeds the local test database (unless --no-seed), then runs each
+scenario from --clients threads, each with its own signed-in test
+client. For every scenario it reports throughput, p50/p95/p99 latency
+and the average number of storage calls per request (from the
+Server-Timing header), plus the process peak RSS. Results are printed
+as JSON, or written to --output, tagged with the current commit:
+
+    python -m benchmarks.run --users 20 --expenses-per-user 5000 \\
+        --clients 8 --requests 200 --output bench_output.json
+"""
+import argparse
+import json
+import random
+import re
+import resource
+import threading
+import time
+from datetime import datetime
+from benchmarks import seed
+from benchmarks.common import (
+    current_commit,
+    load_app,
+    percentile,
+    signed_in_client,
+)
+from expense_tracker.db_storage import ExpensesDatabaseStorage
+
+QUERY_COUNT_PATTERN = re.compile(r'desc="(\d+) queries"')
+
+def expense_form(rng):
+    return {
+        'transaction_date': f'2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+        'transaction_time': f'{rng.randrange(24):02d}:{rng.randrange(60):02d}',
+        'amount_usd': f'{rng.uniform(1, 200):.2f}',
+        'description': 'Benchmark expense',
+        'category_id': str(rng.randint(1, 8)),
+    }
+
+def analytics_scenario(grouping_option):
+    def scenario(client, user, rng):
+        return client.get('/analytics', query_string={
+            'grouping_option': grouping_option,
+            'date_from': '2023-01-01',
+        })
+    return scenario
+
+def list_scenario(client, user, rng):
+    return client.get('/expenses')
+
+def create_scenario(client, user, rng):
+    return client.post('/expenses', data=expense_form(rng))
+
+def edit_scenario(client, user, rng):
+    expense_id = rng.choice(user['expense_ids'])
+    return client.post(f'/expenses/{expense_id}/edit', data=expense_form(rng))
+
+def delete_scenario(client, user, rng):
+    with user['lock']:
+        if not user['deletable_ids']:
+            return None
+        expense_id = user['deletable_ids'].pop()
+    return client.post(f'/expenses/{expense_id}/delete')
+
+def sign_in_scenario(client, user, rng):
+    return client.post('/sign_in', data={
+        'username': user['username'],
+        'password': seed.BENCH_PASSWORD,
+    })
+
+SCENARIOS = {
+    'list': list_scenario,
+    'analytics_day': analytics_scenario('day'),
+    'analytics_week': analytics_scenario('week'),
+    'analytics_month': analytics_scenario('month'),
+    'analytics_category': analytics_scenario('category'),
+    'create': create_scenario,
+    'edit': edit_scenario,
+    'delete': delete_scenario,
+    'sign_in': sign_in_scenario,
+}
+
+def load_users(user_ids):
+    storage = ExpensesDatabaseStorage(is_test_env=True)
+    users = []
+    try:
+        with storage.connection:
+            with storage.connection.cursor() as cursor:
+                for user_id in user_ids:
+                    cursor.execute('SELECT user_name FROM users WHERE id = %s', (user_id, ))
+                    username = cursor.fetchone()[0]
+                    cursor.execute(
+                        'SELECT id FROM expenses WHERE user_id = %s ORDER BY id',
+                        (user_id, )
+                    )
+                    expense_ids = [row[0] for row in cursor.fetchall()]
+                    half = len(expense_ids) // 2
+                    users.append({
+                        'user_id': user_id,
+                        'username': username,
+                        # Edits and deletes work on separate halves
+                        'expense_ids': expense_ids[:half] or expense_ids,
+                        'deletable_ids': expense_ids[half:],
+                        'lock': threading.Lock(),
+                    })
+    finally:
+        storage.close_connection()
+
+    return users
+
+def to_ms(seconds):
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+def run_scenario(app, scenario, users, clients, requests_per_client):
+    latencies = []
+    query_counts = []
+    errors = 0
+    lock = threading.Lock()
+
+    def client_loop(client_number):
+        nonlocal errors
+        rng = random.Random(client_number)
+        user = users[client_number % len(users)]
+        client = signed_in_client(app, user['username'], user['user_id'])
+        for _ in range(requests_per_client):
+            started = time.perf_counter()
+            response = scenario(client, user, rng)
+            elapsed = time.perf_counter() - started
+            if response is None:
+                break
+
+            match = QUERY_COUNT_PATTERN.search(response.headers.get('Server-Timing', ''))
+            with lock:
+                latencies.append(elapsed)
+                if match:
+                    query_counts.append(int(match.group(1)))
+                if response.status_code >= 400:
+                    errors += 1
+
+    threads = [threading.Thread(target=client_loop, args=(n, )) for n in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / wall_time, 1) if wall_time else None,
+        'p50_ms': to_ms(percentile(latencies, 0.50)),
+        'p95_ms': to_ms(percentile(latencies, 0.95)),
+        'p99_ms': to_ms(percentile(latencies, 0.99)),
+        'avg_queries': round(sum(query_counts) / len(query_counts), 2) if query_counts else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--expenses-per-user', type=int, default=2000)
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=100,
+                        help='Requests per client per scenario')
+    parser.add_argument('--scenarios', nargs='*', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--no-seed', action='store_true',
+                        help='Reuse the benchmark data from a previous run')
+    parser.add_argument('--output', help='Write the JSON report to this file')
+    args = parser.parse_args()
+
+    app = load_app()
+    if args.no_seed:
+        storage = ExpensesDatabaseStorage(is_test_env=True)
+        with storage.connection:
+            with storage.connection.cursor() as cursor:
+                cursor.execute('SELECT id FROM users WHERE user_name LIKE %s ORDER BY id',
+                               (seed.BENCH_USER_PREFIX + '%', ))
+                user_ids = [row[0] for row in cursor.fetchall()]
+        storage.close_connection()
+    else:
+        user_ids = seed.seed(args.users, args.expenses_per_user)
+
+    users = load_users(user_ids)
+    report = {
+        'commit': current_commit(),
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'users': len(users),
+        'expenses_per_user': args.expenses_per_user,
+        'clients': args.clients,
+        'requests_per_client': args.requests,
+        'scenarios': {},
+    }
+    for name in args.scenarios:
+        report['scenarios'][name] = run_scenario(
+            app, SCENARIOS[name], users, args.clients, args.requests
+        )
+
+    # ru_maxrss is in kilobytes on Linux
+    report['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3, 1)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as report_file:
+            report_file.write(output + '\n')
+    print(output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Seeds the local test database with synthetic users and expenses.
+
+Users are named bench_user_<n> and share the password BENCH_PASSWORD.
+Expenses are loaded with COPY and follow rough real-world shapes:
+log-normal amounts, a skewed category mix, more purchases in the
+daytime and on weekends, and about 10% without a category.
+
+    python -m benchmarks.seed --users 100 --expenses-per-user 10000
+"""
+import argparse
+import io
+import json
+import math
+import random
+import time
+from datetime import datetime, timedelta
+from psycopg2.extras import execute_values
+from benchmarks.common import require_local_database
+from expense_tracker import config
+from expense_tracker.db_storage import ExpensesDatabaseStorage
+from expense_tracker.passwords import PasswordHasher
+
+BENCH_USER_PREFIX = 'bench_user_'
+BENCH_PASSWORD = 'BenchPassword'
+
+# category name -> (weight, typical merchants)
+CATEGORY_PROFILES = {
+    'Groceries': (30, ('Whole Foods', 'Trader Joes', 'Local market', 'Costco')),
+    'Food & Drink': (25, ('Starbucks Coffee', 'Pizza place', 'Sushi bar', 'Pub')),
+    'Shopping': (12, ('Amazon', 'Clothing store', 'Bookshop', 'Electronics')),
+    'Utilities': (6, ('Electricity bill', 'Water bill', 'Internet', 'Phone plan')),
+    'Health': (5, ('Pharmacy', 'Dentist', 'Gym membership')),
+    'Travel': (5, ('Airline tickets', 'Hotel', 'Train tickets', 'Taxi')),
+    'Housing': (3, ('Rent', 'Home repairs', 'Furniture')),
+    'Other': (4, ('Gift', 'Donation', 'Miscellaneous')),
+}
+UNCATEGORIZED_SHARE = 0.1
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 2, 4, 8, 10, 10, 10, 12, 16, 12, 10, 10, 12, 16, 18, 16, 12, 8, 4, 2]
+COPY_CHUNK_ROWS = 100_000
+
+def expense_rows(rng, user_id, count, categories, days):
+    names = list(CATEGORY_PROFILES)
+    weights = [CATEGORY_PROFILES[name][0] for name in names]
+    end = datetime.now().replace(second=0, microsecond=0) - timedelta(days=1)
+
+    for _ in range(count):
+        name = rng.choices(names, weights)[0]
+        merchant = rng.choice(CATEGORY_PROFILES[name][1])
+        category_id = '\\N' if rng.random() < UNCATEGORIZED_SHARE else categories[name]
+
+        day = end - timedelta(days=rng.randrange(days))
+        if day.weekday() < 5 and rng.random() < 0.3:
+            # Move some weekday purchases to the weekend
+            day += timedelta(days=5 - day.weekday())
+            day = min(day, end)
+        hour = rng.choices(range(24), HOUR_WEIGHTS)[0]
+        transaction_datetime = day.replace(hour=hour, minute=rng.randrange(60))
+
+        amount_cents = max(1, min(int(math.exp(rng.gauss(2.8, 1.0)) * 100), 500_000))
+        yield f'{transaction_datetime.isoformat(sep=" ")}\t{amount_cents}\t{merchant}\t{user_id}\t{category_id}\n'
+
+def copy_expenses(cursor, rows):
+    columns = ('transaction_datetime', 'amount_cents_usd', 'description',
+               'user_id', 'category_id')
+    buffer = io.StringIO()
+    buffered = 0
+    for row in rows:
+        buffer.write(row)
+        buffered += 1
+        if buffered >= COPY_CHUNK_ROWS:
+            buffer.seek(0)
+            cursor.copy_from(buffer, 'expenses', columns=columns)
+            buffer = io.StringIO()
+            buffered = 0
+
+    if buffered:
+        buffer.seek(0)
+        cursor.copy_from(buffer, 'expenses', columns=columns)
+
+def clear_bench_data(cursor):
+    cursor.execute(
+        """
+        DELETE FROM expenses
+        WHERE user_id IN (SELECT id FROM users WHERE user_name LIKE %s)
+        """,
+        (BENCH_USER_PREFIX + '%', )
+    )
+    cursor.execute('DELETE FROM users WHERE user_name LIKE %s', (BENCH_USER_PREFIX + '%', ))
+
+def seed(users, expenses_per_user, days=3 * 365, random_seed=0):
+    """
+    Replaces any previous benchmark data with `users` users of
+    `expenses_per_user` expenses each. Returns the created user ids.
+    """
+    require_local_database()
+    rng = random.Random(random_seed)
+    password_hash = PasswordHasher(config.BCRYPT_ROUNDS, 0, 1).hash(BENCH_PASSWORD)
+
+    storage = ExpensesDatabaseStorage(is_test_env=True)
+    try:
+        with storage.connection:
+            with storage.connection.cursor() as cursor:
+                clear_bench_data(cursor)
+                cursor.execute('SELECT name, id FROM categories')
+                categories = dict(cursor.fetchall())
+
+                user_ids = [row[0] for row in execute_values(
+                    cursor,
+                    'INSERT INTO users (user_name, user_password) VALUES %s RETURNING id',
+                    [(f'{BENCH_USER_PREFIX}{n}', password_hash) for n in range(users)],
+                    fetch=True,
+                )]
+
+                for user_id in user_ids:
+                    copy_expenses(cursor, expense_rows(
+                        rng, user_id, expenses_per_user, categories, days
+                    ))
+
+        # Fresh statistics so the planner sees the new table sizes
+        storage.connection.autocommit = True
+        with storage.connection.cursor() as cursor:
+            cursor.execute('ANALYZE expenses')
+            cursor.execute('ANALYZE users')
+        storage.connection.autocommit = False
+    finally:
+        storage.close_connection()
+
+    return user_ids
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--expenses-per-user', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=3 * 365)
+    parser.add_argument('--random-seed', type=int, default=0)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    user_ids = seed(args.users, args.expenses_per_user, args.days, args.random_seed)
+    elapsed = time.perf_counter() - started
+    rows = len(user_ids) * args.expenses_per_user
+    print(json.dumps({
+        'users': len(user_ids),
+        'expenses': rows,
+        'seconds': round(elapsed, 1),
+        'rows_per_sec': round(rows / elapsed),
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,276 @@
+"""
+Vectorized analytics over a user's whole expense history.
+
+The expenses are loaded once per data version into an ExpenseFrame of
+NumPy columns. From it the analytics page computes the per-group
+count/total/average that get_grouped_data returns, plus the median and
+90th percentile amount, running totals, moving averages, the change
+from the previous period and a category-by-month pivot.
+
+Needs the optional numpy dependency: pip install numpy
+"""
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from expense_tracker import config
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+TIME_GROUPINGS = ('day', 'week', 'month')
+PERCENTILES = (50, 90)
+MOVING_AVERAGE_PERIODS = 3
+# Row values in cents, divided by 100 for display like total and average
+CENT_COLUMNS = ('p50_amount', 'p90_amount', 'running_total', 'moving_avg', 'delta')
+
+def enabled():
+    return config.ANALYTICS_ENGINE == 'numpy' and np is not None
+
+EPOCH = date(1970, 1, 1)
+
+def epoch_days(date_str):
+    return (datetime.strptime(date_str, '%Y-%m-%d').date() - EPOCH).days
+
+
+class ExpenseFrame:
+    """
+    Expenses as parallel columns: the day as int64 days since 1970-01-01,
+    the amount as int64 cents and the category id as int32 (0 for none).
+    """
+    __slots__ = ('days', 'amount_cents', 'category_ids')
+
+    def __init__(self, days, amount_cents, category_ids):
+        self.days = days
+        self.amount_cents = amount_cents
+        self.category_ids = category_ids
+
+    @classmethod
+    def parse(cls, packed):
+        """From the text returned by ExpensesDatabaseStorage.get_expense_columns."""
+        if not packed:
+            values = np.empty((0, 3), dtype=np.int64)
+        else:
+            values = np.fromstring(packed, dtype=np.int64, sep=' ').reshape(-1, 3)
+        return cls(values[:, 0].copy(), values[:, 1].copy(),
+                   values[:, 2].astype(np.int32))
+
+    def __len__(self):
+        return len(self.days)
+
+    def between(self, date_from=None, date_to=None):
+        mask = np.ones(len(self), dtype=bool)
+        if date_from:
+            mask &= self.days >= epoch_days(date_from)
+        if date_to:
+            mask &= self.days <= epoch_days(date_to)
+        if mask.all():
+            return self
+        return ExpenseFrame(self.days[mask], self.amount_cents[mask],
+                            self.category_ids[mask])
+
+    def period_index(self, grouping_option):
+        """
+        Each row's period as an offset on a gapless period axis, and the
+        first day of every period on that axis (as datetime64[D]).
+        """
+        if grouping_option == 'month':
+            months = self.days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+            first = months.min()
+            starts = np.arange(first, months.max() + 1).astype('datetime64[M]')
+            return months - first, starts.astype('datetime64[D]')
+
+        if grouping_option == 'week':
+            # Weeks start on Monday like DATE_TRUNC('week'); day 0 was a Thursday
+            periods = (self.days + 3) // 7
+            step = 7
+        else:
+            periods = self.days
+            step = 1
+
+        first = periods.min()
+        starts = np.arange(first, periods.max() + 1) * step
+        if grouping_option == 'week':
+            starts -= 3
+        return periods - first, starts.astype('datetime64[D]')
+
+
+def group_percentiles(group_index, values, group_count, percentiles):
+    """
+    Linear-interpolated percentiles of `values` within each group, as
+    np.percentile computes them, for all groups with one sort. Returns
+    an array per percentile; empty groups get 0.
+    """
+    order = np.lexsort((values, group_index))
+    sorted_values = values[order].astype(np.float64)
+    counts = np.bincount(group_index, minlength=group_count)
+    starts = np.cumsum(counts) - counts
+    present = counts > 0
+
+    results = []
+    for percentile in percentiles:
+        result = np.zeros(group_count)
+        position = starts[present] + (counts[present] - 1) * (percentile / 100)
+        low = np.floor(position).astype(np.int64)
+        high = np.ceil(position).astype(np.int64)
+        fraction = position - low
+        result[present] = (sorted_values[low]
+                           + (sorted_values[high] - sorted_values[low]) * fraction)
+        results.append(result)
+
+    return results
+
+def group_sums(group_index, values, group_count):
+    # bincount sums in float64, which is exact for any realistic cents total
+    return np.bincount(group_index, weights=values,
+                       minlength=group_count).astype(np.int64)
+
+def moving_average(values, periods):
+    totals = np.cumsum(values, dtype=np.float64)
+    window_totals = totals.copy()
+    window_totals[periods:] -= totals[:-periods]
+    sizes = np.minimum(np.arange(1, len(values) + 1), periods)
+    return window_totals / sizes
+
+
+def time_report(frame, grouping_option):
+    index, starts = frame.period_index(grouping_option)
+    period_count = len(starts)
+    counts = np.bincount(index, minlength=period_count)
+    totals = group_sums(index, frame.amount_cents, period_count)
+    p50, p90 = group_percentiles(index, frame.amount_cents, period_count, PERCENTILES)
+
+    # Over every period, so that empty ones count as zero spend
+    running = np.cumsum(totals)
+    moving = moving_average(totals, MOVING_AVERAGE_PERIODS)
+    delta = np.diff(totals, prepend=0)
+    previous = np.concatenate(([0], totals[:-1]))
+
+    rows = []
+    for i in np.flatnonzero(counts):
+        rows.append({
+            'group_value': starts[i].item(),
+            'txn_count': int(counts[i]),
+            'total_amount': int(totals[i]),
+            'avg_amount': totals[i] / counts[i],
+            'p50_amount': p50[i],
+            'p90_amount': p90[i],
+            'running_total': int(running[i]),
+            'moving_avg': moving[i],
+            'delta': int(delta[i]) if i > 0 else None,
+            'delta_pct': delta[i] / previous[i] * 100 if i > 0 and previous[i] else None,
+        })
+    return rows
+
+def category_report(frame, category_names):
+    categorized = frame.category_ids != 0
+    ids, index = np.unique(frame.category_ids[categorized], return_inverse=True)
+    amounts = frame.amount_cents[categorized]
+    counts = np.bincount(index, minlength=len(ids))
+    totals = group_sums(index, amounts, len(ids))
+    p50, p90 = group_percentiles(index, amounts, len(ids), PERCENTILES)
+
+    rows = [
+        {
+            'group_value': category_names.get(int(category_id), str(category_id)),
+            'txn_count': int(counts[i]),
+            'total_amount': int(totals[i]),
+            'avg_amount': totals[i] / counts[i],
+            'p50_amount': p50[i],
+            'p90_amount': p90[i],
+        }
+        for i, category_id in enumerate(ids)
+    ]
+    return sorted(rows, key=lambda row: row['group_value'])
+
+def category_month_pivot(frame, category_names):
+    """
+    Spending per category (rows) and month (columns) in cents, as
+    (category names, first days of the months, matrix).
+    """
+    categorized = frame.category_ids != 0
+    subset = ExpenseFrame(frame.days[categorized], frame.amount_cents[categorized],
+                          frame.category_ids[categorized])
+    if not len(subset):
+        return None
+
+    month_index, months = subset.period_index('month')
+    ids, category_index = np.unique(subset.category_ids, return_inverse=True)
+    cells = category_index * len(months) + month_index
+    matrix = group_sums(cells, subset.amount_cents, len(ids) * len(months))
+    matrix = matrix.reshape(len(ids), len(months))
+
+    names = [category_names.get(int(category_id), str(category_id)) for category_id in ids]
+    order = sorted(range(len(ids)), key=names.__getitem__)
+    return ([names[i] for i in order],
+            [month.item() for month in months],
+            matrix[order])
+
+def grouped_report(frame, grouping_option, category_names):
+    """
+    Rows like get_grouped_data's with the extra statistics, and for the
+    category grouping the category-by-month pivot. None for an unknown
+    grouping option, like get_grouped_data.
+    """
+    grouping_option = grouping_option.lower()
+    if grouping_option not in TIME_GROUPINGS + ('category', ):
+        return None
+    if not len(frame):
+        return {'groups': [], 'pivot': None}
+
+    if grouping_option == 'category':
+        return {'groups': category_report(frame, category_names),
+                'pivot': category_month_pivot(frame, category_names)}
+
+    return {'groups': time_report(frame, grouping_option), 'pivot': None}
+
+
+class FrameCache:
+    """
+    ExpenseFrames by user for the data version they were loaded at, least
+    recently used first out once they hold more than `max_rows` rows.
+    """
+    def __init__(self, max_rows):
+        self.max_rows = max_rows
+        self.size_rows = 0
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cached(self, user_id, data_version):
+        with self._lock:
+            entry = self._frames.get(user_id)
+            if entry is not None and entry[0] == data_version:
+                self._frames.move_to_end(user_id)
+                return entry[1]
+            return None
+
+    def _store(self, user_id, data_version, frame):
+        if data_version is None or len(frame) > self.max_rows:
+            return
+        with self._lock:
+            previous = self._frames.pop(user_id, None)
+            if previous is not None:
+                self.size_rows -= len(previous[1])
+            self._frames[user_id] = (data_version, frame)
+            self.size_rows += len(frame)
+            while self.size_rows > self.max_rows:
+                _, (_, evicted) = self._frames.popitem(last=False)
+                self.size_rows -= len(evicted)
+
+    def load(self, storage, user_id, data_version):
+        frame = self._cached(user_id, data_version)
+        if frame is None:
+            frame = ExpenseFrame.parse(storage.get_expense_columns(user_id))
+            self._store(user_id, data_version, frame)
+        return frame
+
+    async def load_async(self, storage, user_id, data_version):
+        frame = self._cached(user_id, data_version)
+        if frame is None:
+            frame = ExpenseFrame.parse(await storage.get_expense_columns(user_id))
+            self._store(user_id, data_version, frame)
+        return frame
+
+
+frame_cache = FrameCache(max_rows=config.ANALYTICS_FRAME_CACHE_MAX_ROWS)
@@ -0,0 +1,204 @@
+import threading
+from array import array
+from collections import OrderedDict
+from decimal import Decimal, ROUND_HALF_UP
+from expense_tracker import config
+from expense_tracker.currencies import exchange_rates
+
+CENT = Decimal('0.01')
+
+
+class GroupedColumns:
+    """
+    get_grouped_data results kept as parallel columns: group keys, and
+    transaction counts and totals in cents as packed 64-bit arrays.
+    """
+    __slots__ = ('group_values', 'txn_counts', 'total_cents')
+
+    def __init__(self, rows):
+        self.group_values = tuple(row['group_value'] for row in rows)
+        self.txn_counts = array('q', (row['txn_count'] for row in rows))
+        self.total_cents = array('q', (row['total_amount'] for row in rows))
+
+    def __len__(self):
+        return len(self.group_values)
+
+    def rows(self):
+        """The rows as get_grouped_data returns them, averages included."""
+        return [
+            {
+                'group_value': group_value,
+                'txn_count': txn_count,
+                'total_amount': total,
+                # Same rounding as ROUND(numeric, 2) in the query
+                'avg_amount': (Decimal(total) / txn_count).quantize(CENT, ROUND_HALF_UP),
+            }
+            for group_value, txn_count, total
+            in zip(self.group_values, self.txn_counts, self.total_cents)
+        ]
+
+    # What a cache hit returns, as for FrameReport
+    result = rows
+
+
+class FrameReport:
+    """
+    The NumPy engine's groups and category-by-month pivot. Groups are
+    copied in and out, as the page formats them in place.
+    """
+    __slots__ = ('groups', 'pivot')
+
+    def __init__(self, report):
+        groups, self.pivot = report
+        self.groups = [dict(group) for group in groups]
+
+    def __len__(self):
+        # Pivot cells count as rows
+        return len(self.groups) + (self.pivot[2].size if self.pivot is not None else 0)
+
+    def result(self):
+        return [dict(group) for group in self.groups], self.pivot
+
+
+class AnalyticsCache:
+    """
+    Analytics results of either engine by (engine, user, grouping,
+    date_from, date_to), plus the currency and exchange rates generation
+    for results in another currency than USD, least recently used first
+    out once they hold more than `max_rows` rows. Each result remembers
+    the user's data version it was computed at. When the version has
+    moved on, the result is still used if none of the writes since then
+    touched a day inside its date range.
+    """
+    def __init__(self, max_rows):
+        self.max_rows = max_rows
+        self.size_rows = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return tuple(entry) if entry else None
+
+    def _hit(self, key, data_version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[0] = max(entry[0], data_version)
+                self._entries.move_to_end(key)
+            self.hits += 1
+
+    def _miss(self, key, data_version, value):
+        with self._lock:
+            self.misses += 1
+            if data_version is None or len(value) > self.max_rows:
+                return
+
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size_rows -= len(previous[1])
+            self._entries[key] = [data_version, value]
+            self.size_rows += len(value)
+            while self.size_rows > self.max_rows:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size_rows -= len(evicted)
+
+    def cached(self, storage, engine, user_id, grouping_option, date_from,
+               date_to, data_version, currency, compute):
+        """
+        compute() through the cache: the SQL engine's grouped rows, or the
+        NumPy engine's (groups, pivot). `data_version` is the user's
+        current version; with None, or an unknown grouping, the cache is
+        bypassed.
+        """
+        if data_version is None or grouping_option.lower() not in GROUPINGS:
+            return compute()
+
+        key = (engine, user_id, grouping_option.lower(), date_from or None, date_to or None)
+        if currency != 'USD':
+            key += (currency, exchange_rates.refresh(storage))
+        entry = self._lookup(key)
+        if entry:
+            cached_version, value = entry
+            if (cached_version == data_version
+                    or not storage.writes_overlap(user_id, cached_version,
+                                                  date_from, date_to)):
+                self._hit(key, data_version)
+                return value.result()
+
+        result = compute()
+        self._miss(key, data_version, ENTRY_TYPES[engine](result))
+        return result
+
+    async def cached_async(self, storage, engine, user_id, grouping_option,
+                           date_from, date_to, data_version, currency, compute):
+        # Same as cached for the async storage, awaiting compute()
+        if data_version is None or grouping_option.lower() not in GROUPINGS:
+            return await compute()
+
+        key = (engine, user_id, grouping_option.lower(), date_from or None, date_to or None)
+        if currency != 'USD':
+            key += (currency, await exchange_rates.refresh_async(storage))
+        entry = self._lookup(key)
+        if entry:
+            cached_version, value = entry
+            if (cached_version == data_version
+                    or not await storage.writes_overlap(user_id, cached_version,
+                                                        date_from, date_to)):
+                self._hit(key, data_version)
+                return value.result()
+
+        result = await compute()
+        self._miss(key, data_version, ENTRY_TYPES[engine](result))
+        return result
+
+    def grouped_data(self, storage, user_id, grouping_option, date_from,
+                     date_to, data_version, currency='USD'):
+        """storage.get_grouped_data through the cache, converted to `currency`."""
+        def compute():
+            if currency == 'USD':
+                return storage.get_grouped_data(user_id, grouping_option, date_from, date_to)
+            rows = storage.get_grouped_data(user_id, grouping_option, date_from, date_to,
+                                            by_day=True)
+            return exchange_rates.convert_grouped(rows, currency) if rows is not None else None
+
+        return self.cached(storage, 'sql', user_id, grouping_option, date_from,
+                           date_to, data_version, currency, compute)
+
+    async def grouped_data_async(self, storage, user_id, grouping_option,
+                                 date_from, date_to, data_version, currency='USD'):
+        # Same as grouped_data for the async storage
+        async def compute():
+            if currency == 'USD':
+                return await storage.get_grouped_data(user_id, grouping_option,
+                                                      date_from, date_to)
+            rows = await storage.get_grouped_data(user_id, grouping_option,
+                                                  date_from, date_to, by_day=True)
+            return exchange_rates.convert_grouped(rows, currency) if rows is not None else None
+
+        return await self.cached_async(storage, 'sql', user_id, grouping_option, date_from,
+                                       date_to, data_version, currency, compute)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size_rows = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'rows': self.size_rows,
+                'hits_total': self.hits,
+                'misses_total': self.misses,
+            }
+
+
+ENTRY_TYPES = {'sql': GroupedColumns, 'numpy': FrameReport}
+# Groupings both engines know; others give None and aren't cached
+GROUPINGS = ('month', 'day', 'week', 'category')
+
+analytics_cache = AnalyticsCache(max_rows=config.ANALYTICS_CACHE_MAX_ROWS)
@@ -0,0 +1,275 @@
+import asyncio
+import time
+from itertools import islice
+from expense_tracker import config
+from expense_tracker.db_storage import (
+    ExpenseRecord,
+    ExpensesDatabaseStorage,
+    IMPORT_COLUMNS,
+    all_user_expenses_query,
+    budgets_query,
+    categories_query,
+    create_expense_query,
+    create_user_query,
+    data_version_query,
+    delete_expense_query,
+    exchange_rates_query,
+    expense_by_id_query,
+    expense_columns_query,
+    expense_record,
+    expense_records,
+    expenses_page_query,
+    export_query,
+    first_column,
+    grouped_data_query,
+    import_query,
+    import_row,
+    pop_budget_alerts_query,
+    sorted_alerts,
+    split_page,
+    update_expense_query,
+    update_password_query,
+    user_auth_query,
+    user_expenses_stream_query,
+    user_id_query,
+    writes_overlap_query,
+)
+from expense_tracker.instrumentation import record_storage_call
+
+# psycopg 3 is only needed for the 'psycopg' async backend
+try:
+    from psycopg.rows import dict_row, tuple_row
+    from psycopg_pool import AsyncConnectionPool
+except ImportError:
+    AsyncConnectionPool = dict_row = tuple_row = None
+
+
+_pools = {}
+
+async def get_async_pool(db_name):
+    # One pool per database per process (and per event loop)
+    if AsyncConnectionPool is None:
+        raise RuntimeError(
+            "The 'psycopg' async storage backend needs psycopg 3: "
+            "pip install 'psycopg[binary,pool]'"
+        )
+
+    if db_name not in _pools:
+        pool = AsyncConnectionPool(
+            f'{config.DB_PRIMARY_DSN} dbname={db_name}'.strip(),
+            min_size=config.DB_POOL_MIN_SIZE,
+            max_size=config.DB_POOL_MAX_SIZE,
+            timeout=config.DB_POOL_TIMEOUT,
+            check=AsyncConnectionPool.check_connection,
+            open=False,
+        )
+        await pool.open()
+        _pools[db_name] = pool
+
+    return _pools[db_name]
+
+async def close_async_pools():
+    while _pools:
+        _, pool = _pools.popitem()
+        await pool.close()
+
+
+class AsyncExpensesDatabaseStorage:
+    """
+    The ExpensesDatabaseStorage methods the ASGI views use, as coroutines
+    on an asyncio psycopg 3 pool. A connection is held only while a
+    statement runs, not for the whole request.
+    """
+    def __init__(self, pool):
+        self.pool = pool
+        self.query_count = 0
+        self.db_time = 0.0
+
+    async def _execute(self, name, query, params, row_factory=tuple_row):
+        # Runs one statement and returns its rows (none for statements
+        # without results), timed and recorded like db_transaction does
+        self.query_count += 1
+        started = time.perf_counter()
+        async with self.pool.connection() as connection:
+            async with connection.cursor(row_factory=row_factory) as cursor:
+                await cursor.execute(query, params)
+                rows = await cursor.fetchall() if cursor.description else []
+                rowcount = cursor.rowcount
+
+        elapsed = time.perf_counter() - started
+        self.db_time += elapsed
+        record_storage_call(name, elapsed, rowcount, query)
+        return rows
+
+    async def _fetchone(self, name, query, params, row_factory=tuple_row):
+        rows = await self._execute(name, query, params, row_factory)
+        return rows[0] if rows else None
+
+    # The methods below mirror ExpensesDatabaseStorage's, running the
+    # same statements and result helpers from db_storage
+
+    async def get_all_user_expenses(self, user_id):
+        return expense_records(await self._execute(
+            'get_all_user_expenses', *all_user_expenses_query(user_id)))
+
+    async def get_user_expenses_page(self, user_id, limit, after=None):
+        rows = await self._execute('get_user_expenses_page',
+                                   *expenses_page_query(user_id, limit, after))
+        return split_page(expense_records(rows), limit)
+
+    async def find_expense_by_id(self, user_id, expense_id):
+        return expense_record(await self._fetchone(
+            'find_expense_by_id', *expense_by_id_query(user_id, expense_id)))
+
+    async def find_user_auth(self, user_name):
+        return await self._fetchone('find_user_auth', *user_auth_query(user_name),
+                                    dict_row)
+
+    async def get_categories(self):
+        return await self._execute('get_categories', *categories_query(), dict_row)
+
+    async def get_exchange_rates(self):
+        return await self._execute('get_exchange_rates', *exchange_rates_query())
+
+    async def get_budgets(self, user_id, month):
+        return await self._execute('get_budgets', *budgets_query(user_id, month), dict_row)
+
+    async def pop_budget_alerts(self, user_id):
+        return sorted_alerts(await self._execute(
+            'pop_budget_alerts', *pop_budget_alerts_query(user_id), dict_row))
+
+    async def create_new_expense(self, user_id, transaction_date, transaction_time,
+                                 amount_usd, description, category_id, currency='USD'):
+        query, params = create_expense_query(user_id, transaction_date, transaction_time,
+                                             amount_usd, description, category_id, currency)
+        return first_column(await self._fetchone('create_new_expense', query, params))
+
+    async def update_expense(self, user_id, expense_id, transaction_date, transaction_time,
+                             amount_usd, description, category_id, currency='USD'):
+        query, params = update_expense_query(user_id, expense_id, transaction_date,
+                                             transaction_time, amount_usd, description,
+                                             category_id, currency)
+        await self._execute('update_expense', query, params)
+
+    async def delete_expense_by_id(self, user_id, expense_id):
+        await self._execute('delete_expense_by_id',
+                            *delete_expense_query(user_id, expense_id))
+
+    async def get_grouped_data(self, user_id, group_option, date_from=None, date_to=None,
+                               by_day=False):
+        built = grouped_data_query(user_id, group_option, date_from, date_to, by_day)
+        if built is None:
+            return None
+        return await self._execute('get_grouped_data', *built, dict_row)
+
+    async def get_user_id(self, username):
+        return first_column(await self._fetchone('get_user_id', *user_id_query(username)))
+
+    async def get_data_version(self, user_id):
+        return first_column(await self._fetchone('get_data_version',
+                                                 *data_version_query(user_id)))
+
+    async def writes_overlap(self, user_id, since_version, date_from=None, date_to=None):
+        query, params = writes_overlap_query(user_id, since_version, date_from, date_to)
+        return first_column(await self._fetchone('writes_overlap', query, params), True)
+
+    async def get_expense_columns(self, user_id):
+        return first_column(await self._fetchone('get_expense_columns',
+                                                 *expense_columns_query(user_id)))
+
+    async def create_new_user(self, username, password_hash):
+        return first_column(await self._fetchone(
+            'create_new_user', *create_user_query(username, password_hash)))
+
+    async def update_user_password(self, user_id, password_hash):
+        await self._execute('update_user_password',
+                            *update_password_query(user_id, password_hash))
+
+    async def import_expenses(self, user_id, expenses, batch_size=1000):
+        query = import_query(f"({', '.join(['%s'] * len(IMPORT_COLUMNS))})")
+        self.query_count += 1
+        inserted = 0
+        async with self.pool.connection() as connection:
+            async with connection.cursor() as cursor:
+                expenses = iter(expenses)
+                while batch := list(islice(expenses, batch_size)):
+                    rows = [import_row(user_id, expense_data) for expense_data in batch]
+                    # executemany is pipelined, one round trip per batch
+                    await cursor.executemany(query, rows)
+                    inserted += len(rows)
+
+        return inserted
+
+    async def _iter_server_side(self, name, query, params, row_factory, batch_size):
+        self.query_count += 1
+        async with self.pool.connection() as connection:
+            async with connection.cursor(name=name, row_factory=row_factory) as cursor:
+                cursor.itersize = batch_size
+                await cursor.execute(query, params)
+                async for row in cursor:
+                    yield row
+
+    async def iter_user_expenses(self, user_id, batch_size=2000):
+        query, params = user_expenses_stream_query(user_id)
+        rows = self._iter_server_side('iter_user_expenses', query, params,
+                                      tuple_row, batch_size)
+        async for row in rows:
+            yield ExpenseRecord._make(row)
+
+    def iter_expenses_for_export(self, user_id, date_from=None, date_to=None,
+                                 batch_size=5000):
+        query, params = export_query(user_id, date_from, date_to)
+        return self._iter_server_side('iter_expenses_for_export', query, params,
+                                      tuple_row, batch_size)
+
+    async def close_connection(self):
+        pass
+
+class ThreadedExpensesDatabaseStorage:
+    """
+    Async facade over the blocking ExpensesDatabaseStorage: every call runs
+    in a worker thread. Needs no extra dependencies, but each request still
+    holds a pooled psycopg2 connection like the WSGI app does.
+    """
+    def __init__(self):
+        self.storage = ExpensesDatabaseStorage()
+
+    @property
+    def query_count(self):
+        return self.storage.query_count
+
+    @property
+    def db_time(self):
+        return self.storage.db_time
+
+    def __getattr__(self, name):
+        method = getattr(self.storage, name)
+
+        async def call_in_thread(*args, **kwargs):
+            return await asyncio.to_thread(method, *args, **kwargs)
+
+        return call_in_thread
+
+    async def _iter_in_thread(self, rows, batch_size):
+        while batch := await asyncio.to_thread(list, islice(rows, batch_size)):
+            for row in batch:
+                yield row
+
+    def iter_user_expenses(self, user_id, batch_size=2000):
+        rows = self.storage.iter_user_expenses(user_id, batch_size)
+        return self._iter_in_thread(rows, batch_size)
+
+    def iter_expenses_for_export(self, user_id, date_from=None, date_to=None,
+                                 batch_size=5000):
+        rows = self.storage.iter_expenses_for_export(user_id, date_from, date_to,
+                                                     batch_size)
+        return self._iter_in_thread(rows, batch_size)
+
+
+async def create_async_storage():
+    if config.ASYNC_STORAGE_BACKEND == 'threaded':
+        return ThreadedExpensesDatabaseStorage()
+    if config.ASYNC_STORAGE_BACKEND == 'psycopg':
+        return AsyncExpensesDatabaseStorage(await get_async_pool(config.DB_NAME))
+
+    raise ValueError(f'Unknown async storage backend: {config.ASYNC_STORAGE_BACKEND}')
@@ -0,0 +1,134 @@
+import logging
+import select
+import threading
+import time
+import psycopg2
+from expense_tracker import config
+
+logger = logging.getLogger(__name__)
+
+# Notified by a trigger on categories (migration 0013)
+CATEGORIES_CHANNEL = 'categories_changed'
+
+
+class CategoryRegistry:
+    """
+    Process-wide cache of the categories table.
+
+    Categories almost never change, so they are loaded once and kept for
+    `ttl` seconds. `invalidate()` bumps the version so the next read
+    reloads them; `listen()` calls it whenever the table changes, from
+    whichever process or psql session changed it.
+    """
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.version = 0
+        self._lock = threading.Lock()
+        self._loaded_version = None
+        self._loaded_at = 0
+        self._ordered = []
+        self._by_id = {}
+        self._ids = frozenset()
+        self._stop_listening = threading.Event()
+
+    def _is_stale(self):
+        return (self._loaded_version != self.version
+                or time.monotonic() - self._loaded_at > self.ttl)
+
+    def _ensure_loaded(self, storage):
+        if not self._is_stale():
+            return
+
+        with self._lock:
+            if not self._is_stale():
+                return
+
+            version = self.version
+            self._store(storage.get_categories(), version)
+
+    async def _ensure_loaded_async(self, storage):
+        # Same as _ensure_loaded for the async storage. Two coroutines may
+        # both reload after expiry, which is harmless.
+        if self._is_stale():
+            version = self.version
+            rows = await storage.get_categories()
+            with self._lock:
+                self._store(rows, version)
+
+    def _store(self, rows, version):
+        ordered = [dict(row) for row in rows]
+        self._by_id = {category['id']: category['name'] for category in ordered}
+        self._ids = frozenset(self._by_id)
+        self._ordered = ordered
+        self._loaded_at = time.monotonic()
+        self._loaded_version = version
+
+    def ordered(self, storage):
+        self._ensure_loaded(storage)
+        return self._ordered
+
+    def by_id(self, storage):
+        self._ensure_loaded(storage)
+        return self._by_id
+
+    def ids(self, storage):
+        self._ensure_loaded(storage)
+        return self._ids
+
+    async def ordered_async(self, storage):
+        await self._ensure_loaded_async(storage)
+        return self._ordered
+
+    async def by_id_async(self, storage):
+        await self._ensure_loaded_async(storage)
+        return self._by_id
+
+    async def ids_async(self, storage):
+        await self._ensure_loaded_async(storage)
+        return self._ids
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+
+    def listen(self, connect, poll_seconds=1, retry_seconds=5):
+        """
+        Starts a daemon thread that LISTENs on CATEGORIES_CHANNEL on its
+        own connection from `connect()` and invalidates on every
+        notification. After a lost connection it reconnects and
+        invalidates, since notifications may have been missed meanwhile.
+        """
+        self._stop_listening.clear()
+        thread = threading.Thread(target=self._listen, daemon=True, name='category-listener',
+                                  args=(connect, poll_seconds, retry_seconds))
+        thread.start()
+        return thread
+
+    def stop_listening(self):
+        self._stop_listening.set()
+
+    def _listen(self, connect, poll_seconds, retry_seconds):
+        while not self._stop_listening.is_set():
+            connection = None
+            try:
+                connection = connect()
+                connection.autocommit = True
+                with connection.cursor() as cursor:
+                    cursor.execute(f'LISTEN {CATEGORIES_CHANNEL}')
+                self.invalidate()
+                while not self._stop_listening.is_set():
+                    if select.select([connection], [], [], poll_seconds)[0]:
+                        connection.poll()
+                        if connection.notifies:
+                            connection.notifies.clear()
+                            self.invalidate()
+            except (psycopg2.Error, OSError):
+                logger.warning('Category listener lost its connection, retrying in %ss',
+                               retry_seconds, exc_info=True)
+                self._stop_listening.wait(retry_seconds)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+
+category_registry = CategoryRegistry(ttl=config.CATEGORY_CACHE_TTL)
@@ -0,0 +1,126 @@
+import os
+
+# Settings are read from the environment so the same code runs
+# locally, in tests and behind a process manager without edits.
+def env_int(name, default):
+    return int(os.environ.get(name, default))
+
+def env_float(name, default):
+    return float(os.environ.get(name, default))
+
+def env_bool(name, default):
+    return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes')
+
+
+DB_NAME = os.environ.get('EXPENSES_DB_NAME', 'expenses')
+TEST_DB_NAME = os.environ.get('EXPENSES_TEST_DB_NAME', 'test_expenses')
+
+# Servers, as libpq connection strings without the database name
+# ('host=db1 port=5432 user=expenses'). Writes go to the primary (empty
+# connects to the local default server). Reads of expense lists,
+# analytics and categories are spread over the replicas, separated by
+# ';', when there are any.
+DB_PRIMARY_DSN = os.environ.get('EXPENSES_DB_PRIMARY_DSN', '')
+DB_REPLICA_DSNS = [dsn.strip() for dsn in os.environ.get('EXPENSES_DB_REPLICA_DSNS', '').split(';')
+                   if dsn.strip()]
+# Seconds a client reads from the primary after a write, long enough
+# for the replicas to catch up, so it sees its own changes
+DB_READ_YOUR_WRITES_SECONDS = env_int('EXPENSES_DB_READ_YOUR_WRITES_SECONDS', 5)
+
+# Connection pool
+DB_POOL_MIN_SIZE = env_int('EXPENSES_DB_POOL_MIN_SIZE', 1)
+DB_POOL_MAX_SIZE = env_int('EXPENSES_DB_POOL_MAX_SIZE', 10)
+# Seconds a request waits for a free connection before giving up
+DB_POOL_TIMEOUT = env_float('EXPENSES_DB_POOL_TIMEOUT', 5)
+# Connections idle for longer than this are pinged before being handed out
+DB_POOL_MAX_IDLE = env_float('EXPENSES_DB_POOL_MAX_IDLE', 30)
+
+# Group commit: expenses created by concurrent requests are inserted by
+# one writer thread, up to GROUP_COMMIT_BATCH_SIZE per INSERT and
+# commit. The writer waits up to GROUP_COMMIT_MAX_WAIT_MS for a batch to
+# fill, 0 commits whatever is queued at once.
+GROUP_COMMIT = env_bool('EXPENSES_GROUP_COMMIT', False)
+GROUP_COMMIT_BATCH_SIZE = env_int('EXPENSES_GROUP_COMMIT_BATCH_SIZE', 200)
+GROUP_COMMIT_MAX_WAIT_MS = env_float('EXPENSES_GROUP_COMMIT_MAX_WAIT_MS', 2)
+
+# Expense list
+EXPENSES_PAGE_SIZE = env_int('EXPENSES_PAGE_SIZE', 50)
+
+# Apply pending schema migrations when the app starts
+MIGRATE_ON_STARTUP = env_bool('EXPENSES_MIGRATE_ON_STARTUP', False)
+
+# Seconds before the cached categories are reloaded from the database
+CATEGORY_CACHE_TTL = env_float('EXPENSES_CATEGORY_CACHE_TTL', 300)
+# Reload them as soon as the table changes (LISTEN/NOTIFY, one extra
+# connection per worker), not only when the TTL expires
+CATEGORY_LISTEN = env_bool('EXPENSES_CATEGORY_LISTEN', True)
+
+# Currency the expense list and analytics report in unless the request
+# picks another (?currency=EUR), and seconds before the exchange rates
+# each worker holds are reloaded after `flask import-rates` elsewhere
+REPORT_CURRENCY = os.environ.get('EXPENSES_REPORT_CURRENCY', 'USD')
+EXCHANGE_RATE_CACHE_TTL = env_float('EXPENSES_EXCHANGE_RATE_CACHE_TTL', 300)
+
+# Password hashing
+BCRYPT_ROUNDS = env_int('EXPENSES_BCRYPT_ROUNDS', 12)
+# Worker processes for bcrypt, 0 hashes inline in the request thread
+HASH_POOL_SIZE = env_int('EXPENSES_HASH_POOL_SIZE', os.cpu_count() or 1)
+# Hashing jobs allowed in flight before sign-ins are answered with 429
+HASH_MAX_PENDING = env_int('EXPENSES_HASH_MAX_PENDING', 4 * (os.cpu_count() or 1))
+
+# Storage calls slower than this many milliseconds are logged,
+# 0 turns the slow query log off
+SLOW_QUERY_MS = env_float('EXPENSES_SLOW_QUERY_MS', 0)
+
+# Storage used by the ASGI app (asgi.py): 'psycopg' runs queries on an
+# asyncio psycopg 3 pool, 'threaded' runs ExpensesDatabaseStorage in threads
+ASYNC_STORAGE_BACKEND = os.environ.get('EXPENSES_ASYNC_STORAGE_BACKEND', 'psycopg')
+
+# Key that signs session cookies. Set it to the same value for every
+# worker, otherwise a session only works on the worker that created it.
+SECRET_KEY = os.environ.get('EXPENSES_SECRET_KEY')
+
+# Where sessions are kept: 'postgres' (the sessions table), 'redis'
+# (SESSION_REDIS_URL) or 'memory' (this process only)
+SESSION_BACKEND = os.environ.get('EXPENSES_SESSION_BACKEND', 'postgres')
+SESSION_REDIS_URL = os.environ.get('EXPENSES_SESSION_REDIS_URL', 'redis://localhost:6379/0')
+# Sessions each worker keeps in memory, and seconds before a cached one is re-read
+SESSION_CACHE_SIZE = env_int('EXPENSES_SESSION_CACHE_SIZE', 10000)
+SESSION_CACHE_TTL = env_float('EXPENSES_SESSION_CACHE_TTL', 60)
+
+# Memory for rendered expense list and analytics pages, per worker
+PAGE_CACHE_MAX_BYTES = env_int('EXPENSES_PAGE_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+
+# Analytics results of either engine (all together, in rows, and pivot
+# cells for the NumPy engine) kept per worker
+ANALYTICS_CACHE_MAX_ROWS = env_int('EXPENSES_ANALYTICS_CACHE_MAX_ROWS', 200000)
+
+# Analytics page engine: 'numpy' (expense_tracker.analytics, richer
+# statistics, falls back to 'sql' if numpy isn't installed) or 'sql'
+ANALYTICS_ENGINE = os.environ.get('EXPENSES_ANALYTICS_ENGINE', 'numpy')
+# Expense rows (all users together) each worker keeps loaded for it
+ANALYTICS_FRAME_CACHE_MAX_ROWS = env_int('EXPENSES_ANALYTICS_FRAME_CACHE_MAX_ROWS', 2_000_000)
+
+# Most expenses one bulk delete/recategorize/date shift may select
+BULK_MAX_EXPENSES = env_int('EXPENSES_BULK_MAX_EXPENSES', 1000)
+
+# Recurring expenses: run the scheduler thread in this process, every
+# RECURRING_INTERVAL seconds. Safe to enable on several nodes.
+RECURRING_SCHEDULER = env_bool('EXPENSES_RECURRING_SCHEDULER', False)
+RECURRING_INTERVAL = env_float('EXPENSES_RECURRING_INTERVAL', 60)
+# Rules per insert statement, and occurrences per rule in one statement
+RECURRING_BATCH_SIZE = env_int('EXPENSES_RECURRING_BATCH_SIZE', 500)
+RECURRING_MAX_OCCURRENCES = env_int('EXPENSES_RECURRING_MAX_OCCURRENCES', 400)
+# Backfill every occurrence missed while no scheduler ran (else only
+# the latest one is added)
+RECURRING_CATCH_UP = env_bool('EXPENSES_RECURRING_CATCH_UP', True)
+
+# Monthly expenses partitions kept ready past the current month, once
+# expenses is partitioned (`flask partition-expenses`)
+PARTITION_MONTHS_AHEAD = env_int('EXPENSES_PARTITION_MONTHS_AHEAD', 3)
+
+# Percents of a monthly budget at which a write that gets there raises
+# an alert, e.g. '80,100'. Applies to budgets saved afterwards.
+BUDGET_ALERT_PERCENTS = sorted({int(percent) for percent in
+                                os.environ.get('EXPENSES_BUDGET_ALERT_PERCENTS', '80,100').split(',')
+                                if percent.strip()})
@@ -0,0 +1,215 @@
+import threading
+import time
+import psycopg2
+from psycopg2 import extensions
+from expense_tracker import config
+
+
+class PoolError(Exception):
+    pass
+
+class PoolTimeout(PoolError):
+    pass
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of psycopg2 connections shared by the whole process.
+
+    - At most `max_size` connections are open at once. When all of them are
+      checked out, `getconn` waits up to `timeout` seconds for one to be
+      returned and then raises PoolTimeout.
+    - Connections that sat idle for longer than `max_idle` seconds are
+      pinged before being handed out, and replaced if the ping fails.
+    """
+    def __init__(self, min_size=1, max_size=10, timeout=5, max_idle=30,
+                 connect=psycopg2.connect, **connect_kwargs):
+        if not 0 <= min_size <= max_size:
+            raise ValueError('Pool size must satisfy 0 <= min_size <= max_size')
+
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._connect = connect
+        self._connect_kwargs = connect_kwargs
+
+        self._lock = threading.Condition()
+        # Idle connections as (connection, returned_at) pairs, newest last
+        self._idle = []
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+
+        self._checkouts = 0
+        self._timeouts = 0
+        self._discarded = 0
+        self._checkout_seconds_total = 0.0
+        self._checkout_seconds_max = 0.0
+
+        for _ in range(min_size):
+            self._idle.append((self._new_connection(), time.monotonic()))
+
+    def _new_connection(self):
+        return self._connect(**self._connect_kwargs)
+
+    def _is_healthy(self, conn, returned_at):
+        if conn.closed:
+            return False
+
+        if time.monotonic() - returned_at < self.max_idle:
+            return True
+
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        self._discarded += 1
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+
+        with self._lock:
+            if self._closed:
+                raise PoolError('Connection pool is closed')
+
+            self._waiting += 1
+            try:
+                while not self._idle and self._in_use >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(
+                            f'No database connection available after {self.timeout}s'
+                        )
+                    self._lock.wait(remaining)
+            finally:
+                self._waiting -= 1
+
+            # Reserve the slot before doing any I/O outside the lock
+            self._in_use += 1
+            conn, returned_at = self._idle.pop() if self._idle else (None, None)
+
+        try:
+            if conn is not None and not self._is_healthy(conn, returned_at):
+                self._discard(conn)
+                conn = None
+            if conn is None:
+                conn = self._new_connection()
+        except Exception:
+            with self._lock:
+                self._in_use -= 1
+                self._lock.notify()
+            raise
+
+        with self._lock:
+            elapsed = time.monotonic() - started
+            self._checkouts += 1
+            self._checkout_seconds_total += elapsed
+            self._checkout_seconds_max = max(self._checkout_seconds_max, elapsed)
+
+        return conn
+
+    def putconn(self, conn, close=False):
+        # Never hand a connection with an open or failed transaction
+        # to the next request
+        if not conn.closed and not close:
+            status = conn.get_transaction_status()
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                close = True
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    close = True
+
+        with self._lock:
+            self._in_use -= 1
+            if self._closed or close or conn.closed:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._lock.notify()
+
+    def closeall(self):
+        with self._lock:
+            self._closed = True
+            for conn, _ in self._idle:
+                conn.close()
+            self._idle = []
+            self._lock.notify_all()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._idle) + self._in_use,
+                'max_size': self.max_size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                'checkouts_total': self._checkouts,
+                'timeouts_total': self._timeouts,
+                'discarded_total': self._discarded,
+                'checkout_seconds_total': self._checkout_seconds_total,
+                'checkout_seconds_max': self._checkout_seconds_max,
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def connect_read_only(**connect_kwargs):
+    # Every transaction on the connection starts with BEGIN READ ONLY
+    conn = psycopg2.connect(**connect_kwargs)
+    conn.set_session(readonly=True)
+    return conn
+
+def pool_name(db_name, dsn):
+    # Label for the pool in /metrics: never the DSN itself, which may
+    # hold a password
+    if not dsn:
+        return db_name
+    params = extensions.parse_dsn(dsn)
+    return f"{db_name}@{params.get('host', 'localhost')}:{params.get('port', '5432')}"
+
+def connect(db_name, dsn=''):
+    # A connection of its own, outside the pools, for long-lived listeners
+    if dsn:
+        return psycopg2.connect(dsn=dsn, dbname=db_name)
+    return psycopg2.connect(dbname=db_name)
+
+def get_pool(db_name, dsn='', read_only=False):
+    """
+    One pool per server and database per process, created on first use.
+    `dsn` is a libpq connection string for the server (host, port,
+    user...), the database name is added to it.
+    """
+    name = pool_name(db_name, dsn)
+    with _pools_lock:
+        if name not in _pools:
+            connect_kwargs = {'dbname': db_name}
+            if dsn:
+                connect_kwargs['dsn'] = dsn
+            _pools[name] = ConnectionPool(
+                min_size=config.DB_POOL_MIN_SIZE,
+                max_size=config.DB_POOL_MAX_SIZE,
+                timeout=config.DB_POOL_TIMEOUT,
+                max_idle=config.DB_POOL_MAX_IDLE,
+                connect=connect_read_only if read_only else psycopg2.connect,
+                **connect_kwargs,
+            )
+        return _pools[name]
+
+def all_pools():
+    with _pools_lock:
+        return dict(_pools)
@@ -0,0 +1,208 @@
+"""
+Expenses in other currencies than USD, and reports in a chosen currency.
+
+An expense keeps its amount as entered along with its currency, and
+amount_cents_usd converted at the rate of its day (migration 0011), so
+totals, rollups and caches stay in USD. Reports in another currency
+convert USD amounts with the daily rates held in memory here, a whole
+result set at a time: the rate of every distinct day is looked up once,
+and analytics frames are converted with a single vectorized lookup.
+
+Rates come from CSV files of date,currency,units_per_usd lines loaded
+with `flask import-rates`; there is no live rate service. Amounts in
+every currency are kept in hundredths.
+"""
+import csv
+import re
+import threading
+import time
+from bisect import bisect_right
+from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from expense_tracker import analytics, config
+
+CURRENCY_PATTERN = re.compile(r'^[A-Z]{3}$')
+CENT = Decimal('0.01')
+EPOCH_ORDINAL = analytics.EPOCH.toordinal()
+
+
+def read_rates(lines):
+    """
+    (currency, day, units per USD) tuples from CSV lines with a
+    date,currency,units_per_usd header. Raises ValueError naming the
+    first bad line. A day given twice for a currency keeps the last rate.
+    """
+    reader = csv.DictReader(lines)
+    rates = {}
+    for line_number, row in enumerate(reader, start=2):
+        try:
+            day = datetime.strptime(row['date'].strip(), '%Y-%m-%d').date()
+            currency = row['currency'].strip().upper()
+            units_per_usd = Decimal(row['units_per_usd'].strip())
+        except (KeyError, AttributeError, ValueError, InvalidOperation):
+            raise ValueError(f'Line {line_number}: expected date,currency,units_per_usd')
+        if not CURRENCY_PATTERN.match(currency) or currency == 'USD':
+            raise ValueError(f'Line {line_number}: {currency!r} is not a currency code')
+        if units_per_usd <= 0:
+            raise ValueError(f'Line {line_number}: the rate must be positive')
+        rates[currency, day] = units_per_usd
+
+    return [(currency, day, units_per_usd)
+            for (currency, day), units_per_usd in rates.items()]
+
+
+class ExchangeRates:
+    """
+    Process-wide cache of the exchange_rates table, reloaded after `ttl`
+    seconds like the category registry. `generation` changes whenever a
+    reload brings different rates, so cached pages and analytics results
+    in a converted currency can be keyed on it.
+    """
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.version = 0
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._loaded_version = None
+        self._loaded_at = 0
+        # Per currency: day ordinals in ascending order and their rates
+        self._days = {}
+        self._rates = {}
+        # Rates already looked up, by currency and day ordinal
+        self._daily = {}
+
+    def _is_stale(self):
+        return (self._loaded_version != self.version
+                or time.monotonic() - self._loaded_at > self.ttl)
+
+    def _ensure_loaded(self, storage):
+        if not self._is_stale():
+            return
+
+        with self._lock:
+            if not self._is_stale():
+                return
+
+            version = self.version
+            self._store(storage.get_exchange_rates(), version)
+
+    async def _ensure_loaded_async(self, storage):
+        # Same as _ensure_loaded for the async storage
+        if self._is_stale():
+            version = self.version
+            rows = await storage.get_exchange_rates()
+            with self._lock:
+                self._store(rows, version)
+
+    def _store(self, rows, version):
+        days, rates = {}, {}
+        for currency, day, units_per_usd in rows:
+            days.setdefault(currency, []).append(day.toordinal())
+            rates.setdefault(currency, []).append(float(units_per_usd))
+
+        if (days, rates) != (self._days, self._rates):
+            self._days, self._rates = days, rates
+            self._daily = {}
+            self.generation += 1
+        self._loaded_version = version
+        self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        # After an import, so this process reads the new rates right away
+        self.version += 1
+
+    def refresh(self, storage):
+        """Reloads the rates if they expired. Returns the generation."""
+        self._ensure_loaded(storage)
+        return self.generation
+
+    async def refresh_async(self, storage):
+        await self._ensure_loaded_async(storage)
+        return self.generation
+
+    def currencies(self, storage):
+        self._ensure_loaded(storage)
+        return ['USD'] + sorted(self._days)
+
+    async def currencies_async(self, storage):
+        await self._ensure_loaded_async(storage)
+        return ['USD'] + sorted(self._days)
+
+    # The methods below use the rates as last loaded: call refresh() or
+    # currencies() first.
+
+    def rate(self, currency, ordinal):
+        """
+        Units of `currency` per USD on the day with this ordinal: the rate
+        of the latest day on or before it, or the earliest rate for days
+        before the first one, as exchange_rate() in SQL picks it.
+        """
+        if currency == 'USD':
+            return 1.0
+        daily = self._daily.setdefault(currency, {})
+        rate = daily.get(ordinal)
+        if rate is None:
+            days = self._days.get(currency)
+            if not days:
+                raise ValueError(f'No exchange rate for {currency}')
+            rate = self._rates[currency][max(bisect_right(days, ordinal) - 1, 0)]
+            daily[ordinal] = rate
+        return rate
+
+    def convert_records(self, records, currency):
+        """
+        Amounts in cents of `currency` for a list of ExpenseRecords:
+        the amount as entered for expenses in that currency, the USD
+        amount converted at its day's rate for the others.
+        """
+        if currency == 'USD':
+            return [record.amount_cents_usd for record in records]
+
+        rates = {ordinal: self.rate(currency, ordinal)
+                 for ordinal in {record.transaction_datetime.toordinal()
+                                 for record in records}}
+        return [
+            record.amount_cents if record.currency == currency
+            else round(record.amount_cents_usd * rates[record.transaction_datetime.toordinal()])
+            for record in records
+        ]
+
+    def convert_grouped(self, rows, currency):
+        """
+        get_grouped_data(by_day=True) rows converted to `currency` day by
+        day and summed per group, as get_grouped_data returns them.
+        """
+        groups = {}
+        for row in rows:
+            rate = self.rate(currency, row['day'].toordinal())
+            group = groups.setdefault(row['group_value'], [0, 0])
+            group[0] += row['txn_count']
+            group[1] += round(row['total_amount'] * rate)
+
+        return [
+            {
+                'group_value': group_value,
+                'txn_count': txn_count,
+                'total_amount': total,
+                # Same rounding as ROUND(numeric, 2) in get_grouped_data
+                'avg_amount': (Decimal(total) / txn_count).quantize(CENT, ROUND_HALF_UP),
+            }
+            for group_value, (txn_count, total) in groups.items()
+        ]
+
+    def convert_frame(self, frame, currency):
+        """An analytics.ExpenseFrame with its amounts converted to `currency`."""
+        if currency == 'USD' or not len(frame):
+            return frame
+
+        np = analytics.np
+        if currency not in self._days:
+            raise ValueError(f'No exchange rate for {currency}')
+        days = np.array(self._days[currency], dtype=np.int64) - EPOCH_ORDINAL
+        rates = np.array(self._rates[currency])
+        index = np.maximum(np.searchsorted(days, frame.days, side='right') - 1, 0)
+        amounts = np.rint(frame.amount_cents * rates[index]).astype(np.int64)
+        return analytics.ExpenseFrame(frame.days, amounts, frame.category_ids)
+
+
+exchange_rates = ExchangeRates(ttl=config.EXCHANGE_RATE_CACHE_TTL)
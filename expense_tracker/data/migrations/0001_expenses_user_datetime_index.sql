@@ -0,0 +1,4 @@
+-- Every expense query filters on user_id and orders or ranges on
+-- transaction_datetime (list pages, analytics date ranges)
+CREATE INDEX IF NOT EXISTS expenses_user_id_transaction_datetime_idx
+    ON expenses (user_id, transaction_datetime DESC, id DESC);
@@ -0,0 +1,3 @@
+-- Category joins and the ON DELETE RESTRICT check on categories
+CREATE INDEX IF NOT EXISTS expenses_category_id_idx
+    ON expenses (category_id);
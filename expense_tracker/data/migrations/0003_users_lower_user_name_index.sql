@@ -0,0 +1,4 @@
+-- User lookups compare LOWER(user_name), which can't use the
+-- plain unique index on user_name
+CREATE INDEX IF NOT EXISTS users_lower_user_name_idx
+    ON users (LOWER(user_name));
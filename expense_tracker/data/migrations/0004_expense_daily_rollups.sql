@@ -0,0 +1,65 @@
+-- Daily per-user, per-category totals for analytics. Kept current by a
+-- trigger on expenses, so every write path maintains it.
+-- category_id 0 stands for "no category".
+CREATE TABLE IF NOT EXISTS expense_daily_rollups(
+    user_id INT NOT NULL,
+    day DATE NOT NULL,
+    category_id INT NOT NULL DEFAULT 0,
+    txn_count INT NOT NULL,
+    total_cents BIGINT NOT NULL,
+    PRIMARY KEY (user_id, day, category_id)
+);
+
+CREATE OR REPLACE FUNCTION expense_daily_rollups_add(
+    p_user_id INT, p_day DATE, p_category_id INT,
+    p_txn_count INT, p_total_cents BIGINT
+) RETURNS void AS $$
+BEGIN
+    INSERT INTO expense_daily_rollups AS r
+        (user_id, day, category_id, txn_count, total_cents)
+    VALUES (p_user_id, p_day, p_category_id, p_txn_count, p_total_cents)
+    ON CONFLICT (user_id, day, category_id) DO UPDATE
+        SET txn_count = r.txn_count + EXCLUDED.txn_count,
+            total_cents = r.total_cents + EXCLUDED.total_cents;
+
+    IF p_txn_count < 0 THEN
+        DELETE FROM expense_daily_rollups
+        WHERE user_id = p_user_id
+            AND day = p_day
+            AND category_id = p_category_id
+            AND txn_count = 0;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION expenses_maintain_rollups() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM expense_daily_rollups_add(
+            OLD.user_id, OLD.transaction_datetime::date,
+            COALESCE(OLD.category_id, 0), -1, -OLD.amount_cents_usd::bigint
+        );
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM expense_daily_rollups_add(
+            NEW.user_id, NEW.transaction_datetime::date,
+            COALESCE(NEW.category_id, 0), 1, NEW.amount_cents_usd::bigint
+        );
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS expenses_maintain_rollups ON expenses;
+CREATE TRIGGER expenses_maintain_rollups
+    AFTER INSERT OR UPDATE OR DELETE ON expenses
+    FOR EACH ROW EXECUTE FUNCTION expenses_maintain_rollups();
+
+-- Backfill from the existing expenses
+DELETE FROM expense_daily_rollups;
+INSERT INTO expense_daily_rollups
+    (user_id, day, category_id, txn_count, total_cents)
+SELECT user_id, transaction_datetime::date, COALESCE(category_id, 0),
+       COUNT(*), SUM(amount_cents_usd)
+FROM expenses
+GROUP BY 1, 2, 3;
@@ -0,0 +1,10 @@
+-- Server-side sessions, shared by every app worker. The cookie only
+-- holds the signed id; `data` is the serialized session.
+CREATE TABLE IF NOT EXISTS sessions (
+    id text PRIMARY KEY,
+    data text NOT NULL,
+    expires_at timestamp with time zone NOT NULL
+);
+
+-- For `flask purge-sessions`
+CREATE INDEX IF NOT EXISTS sessions_expires_at_idx ON sessions (expires_at);
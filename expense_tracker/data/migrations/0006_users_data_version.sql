@@ -0,0 +1,36 @@
+-- Per-user data version for HTTP caching of the expense list and
+-- analytics pages. Bumped once per statement that writes a user's
+-- expenses, whichever code path runs it.
+ALTER TABLE users ADD COLUMN IF NOT EXISTS data_version BIGINT NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION expenses_bump_data_version() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        UPDATE users SET data_version = data_version + 1
+        WHERE id IN (SELECT user_id FROM old_rows);
+    ELSE
+        UPDATE users SET data_version = data_version + 1
+        WHERE id IN (SELECT user_id FROM new_rows);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Transition tables need one trigger per event
+DROP TRIGGER IF EXISTS expenses_bump_data_version_insert ON expenses;
+CREATE TRIGGER expenses_bump_data_version_insert
+    AFTER INSERT ON expenses
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION expenses_bump_data_version();
+
+DROP TRIGGER IF EXISTS expenses_bump_data_version_update ON expenses;
+CREATE TRIGGER expenses_bump_data_version_update
+    AFTER UPDATE ON expenses
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION expenses_bump_data_version();
+
+DROP TRIGGER IF EXISTS expenses_bump_data_version_delete ON expenses;
+CREATE TRIGGER expenses_bump_data_version_delete
+    AFTER DELETE ON expenses
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION expenses_bump_data_version();
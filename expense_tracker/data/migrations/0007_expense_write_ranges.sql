@@ -0,0 +1,88 @@
+-- Which days each data version bump touched, so cached analytics for a
+-- date range survive writes outside it. One row per user per write
+-- statement (two for updates: old and new dates). Only the latest 256
+-- versions per user are kept; older cache entries are recomputed.
+CREATE TABLE IF NOT EXISTS expense_write_ranges (
+    user_id INT NOT NULL,
+    data_version BIGINT NOT NULL,
+    first_day DATE NOT NULL,
+    last_day DATE NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS expense_write_ranges_user_id_data_version_idx
+    ON expense_write_ranges (user_id, data_version);
+
+CREATE OR REPLACE FUNCTION expenses_bump_data_version() RETURNS trigger AS $$
+DECLARE
+    kept_versions CONSTANT INT := 256;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        WITH ranges AS (
+            SELECT user_id, MIN(transaction_datetime)::date AS first_day,
+                   MAX(transaction_datetime)::date AS last_day
+            FROM new_rows
+            GROUP BY user_id
+        ), bumped AS (
+            UPDATE users SET data_version = data_version + 1
+            WHERE id IN (SELECT user_id FROM ranges)
+            RETURNING id, data_version
+        ), trimmed AS (
+            DELETE FROM expense_write_ranges w USING bumped b
+            WHERE w.user_id = b.id AND w.data_version <= b.data_version - kept_versions
+        )
+        INSERT INTO expense_write_ranges (user_id, data_version, first_day, last_day)
+        SELECT b.id, b.data_version, r.first_day, r.last_day
+        FROM bumped b JOIN ranges r ON r.user_id = b.id;
+
+    ELSIF TG_OP = 'DELETE' THEN
+        WITH ranges AS (
+            SELECT user_id, MIN(transaction_datetime)::date AS first_day,
+                   MAX(transaction_datetime)::date AS last_day
+            FROM old_rows
+            GROUP BY user_id
+        ), bumped AS (
+            UPDATE users SET data_version = data_version + 1
+            WHERE id IN (SELECT user_id FROM ranges)
+            RETURNING id, data_version
+        ), trimmed AS (
+            DELETE FROM expense_write_ranges w USING bumped b
+            WHERE w.user_id = b.id AND w.data_version <= b.data_version - kept_versions
+        )
+        INSERT INTO expense_write_ranges (user_id, data_version, first_day, last_day)
+        SELECT b.id, b.data_version, r.first_day, r.last_day
+        FROM bumped b JOIN ranges r ON r.user_id = b.id;
+
+    ELSE
+        -- An update touches the days the rows moved from and to
+        WITH ranges AS (
+            SELECT user_id, MIN(transaction_datetime)::date AS first_day,
+                   MAX(transaction_datetime)::date AS last_day
+            FROM old_rows
+            GROUP BY user_id
+            UNION ALL
+            SELECT user_id, MIN(transaction_datetime)::date,
+                   MAX(transaction_datetime)::date
+            FROM new_rows
+            GROUP BY user_id
+        ), bumped AS (
+            UPDATE users SET data_version = data_version + 1
+            WHERE id IN (SELECT user_id FROM ranges)
+            RETURNING id, data_version
+        ), trimmed AS (
+            DELETE FROM expense_write_ranges w USING bumped b
+            WHERE w.user_id = b.id AND w.data_version <= b.data_version - kept_versions
+        )
+        INSERT INTO expense_write_ranges (user_id, data_version, first_day, last_day)
+        SELECT b.id, b.data_version, r.first_day, r.last_day
+        FROM bumped b JOIN ranges r ON r.user_id = b.id;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS expenses_bump_data_version_update ON expenses;
+CREATE TRIGGER expenses_bump_data_version_update
+    AFTER UPDATE ON expenses
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION expenses_bump_data_version();
@@ -0,0 +1,5 @@
+-- Full-text search over descriptions (search_expenses). The 'simple'
+-- configuration doesn't stem or drop stop words, which suits merchant
+-- names; queries match word prefixes.
+CREATE INDEX IF NOT EXISTS expenses_description_search_idx
+    ON expenses USING gin (to_tsvector('simple', COALESCE(description, '')));
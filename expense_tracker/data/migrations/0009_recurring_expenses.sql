@@ -0,0 +1,65 @@
+-- Recurring expense rules (rent, subscriptions, ...). Occurrence n of a
+-- rule is at starts_on + n periods, always counted from starts_on so
+-- monthly rules starting on the 31st stay on the last day of the month.
+-- occurrence_count occurrences have been materialized into expenses;
+-- next_occurrence is the next one due.
+CREATE TABLE IF NOT EXISTS recurring_expenses (
+    id SERIAL PRIMARY KEY,
+    user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    amount_cents_usd INT NOT NULL,
+    description TEXT NOT NULL,
+    category_id INT REFERENCES categories(id) ON DELETE RESTRICT,
+    frequency TEXT NOT NULL
+        CHECK (frequency IN ('daily', 'weekly', 'monthly', 'yearly')),
+    starts_on timestamp NOT NULL,
+    ends_on DATE,
+    occurrence_count INT NOT NULL DEFAULT 0,
+    next_occurrence timestamp NOT NULL
+);
+
+-- The scheduler looks for due rules
+CREATE INDEX IF NOT EXISTS recurring_expenses_next_occurrence_idx
+    ON recurring_expenses (next_occurrence);
+CREATE INDEX IF NOT EXISTS recurring_expenses_user_id_idx
+    ON recurring_expenses (user_id);
+
+-- Materialized occurrences point back at their rule. The unique index
+-- makes inserting an occurrence twice a no-op (ON CONFLICT DO NOTHING).
+ALTER TABLE expenses ADD COLUMN IF NOT EXISTS recurring_expense_id INT
+    REFERENCES recurring_expenses(id) ON DELETE SET NULL;
+CREATE UNIQUE INDEX IF NOT EXISTS expenses_recurring_occurrence_idx
+    ON expenses (recurring_expense_id, transaction_datetime)
+    WHERE recurring_expense_id IS NOT NULL;
+
+CREATE OR REPLACE FUNCTION recurring_period(frequency TEXT) RETURNS interval AS $$
+    SELECT CASE frequency
+        WHEN 'daily' THEN interval '1 day'
+        WHEN 'weekly' THEN interval '1 week'
+        WHEN 'monthly' THEN interval '1 month'
+        WHEN 'yearly' THEN interval '1 year'
+    END
+$$ LANGUAGE sql IMMUTABLE;
+
+-- How many occurrences of a rule fall on or before `until`, without
+-- generating them: an estimate from the calendar difference, corrected
+-- by one when the estimated occurrence is still after `until`.
+CREATE OR REPLACE FUNCTION recurring_occurrence_count(
+    starts_on timestamp, frequency TEXT, until timestamp
+) RETURNS INT AS $$
+    WITH estimate AS (
+        SELECT (CASE frequency
+            WHEN 'daily' THEN FLOOR(EXTRACT(EPOCH FROM until - starts_on) / 86400)
+            WHEN 'weekly' THEN FLOOR(EXTRACT(EPOCH FROM until - starts_on) / 604800)
+            WHEN 'monthly' THEN
+                (EXTRACT(YEAR FROM until) - EXTRACT(YEAR FROM starts_on)) * 12
+                + EXTRACT(MONTH FROM until) - EXTRACT(MONTH FROM starts_on)
+            WHEN 'yearly' THEN EXTRACT(YEAR FROM until) - EXTRACT(YEAR FROM starts_on)
+        END)::INT AS n
+    )
+    SELECT CASE
+        WHEN until < starts_on THEN 0
+        WHEN starts_on + n * recurring_period(frequency) <= until THEN n + 1
+        ELSE n
+    END
+    FROM estimate
+$$ LANGUAGE sql IMMUTABLE;
@@ -0,0 +1,150 @@
+-- Opt-in partitioned layout for expenses: one partition per month of
+-- transaction_datetime, each optionally split into hash partitions by
+-- user_id. Nothing changes until `flask partition-expenses` calls
+-- expenses_partition_by_month(); until then expenses_create_partitions()
+-- does nothing.
+
+-- One row once expenses is partitioned
+CREATE TABLE IF NOT EXISTS expenses_partitioning (
+    hash_partitions INT NOT NULL
+);
+
+-- Creates the partition for the month starting on month_start unless it
+-- exists. Indexes and triggers on expenses are cloned to it.
+CREATE OR REPLACE FUNCTION expenses_create_partition(month_start DATE) RETURNS BOOLEAN AS $$
+DECLARE
+    partition_name TEXT := 'expenses_' || to_char(month_start, 'YYYY_MM');
+    hash_count INT;
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN FALSE;
+    END IF;
+
+    SELECT hash_partitions INTO hash_count FROM expenses_partitioning;
+    IF hash_count > 1 THEN
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF expenses FOR VALUES FROM (%L) TO (%L)'
+            ' PARTITION BY HASH (user_id)',
+            partition_name, month_start, month_start + 1 * interval '1 month'
+        );
+        FOR remainder IN 0 .. hash_count - 1 LOOP
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF %I FOR VALUES WITH (MODULUS %s, REMAINDER %s)',
+                partition_name || '_h' || remainder, partition_name, hash_count, remainder
+            );
+        END LOOP;
+    ELSE
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF expenses FOR VALUES FROM (%L) TO (%L)',
+            partition_name, month_start, month_start + 1 * interval '1 month'
+        );
+    END IF;
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Makes sure partitions exist from the current month to months_ahead
+-- months later. Returns how many were created (0 when expenses isn't
+-- partitioned). Expenses can't be dated in the future, so inserts never
+-- need a partition past the current month.
+CREATE OR REPLACE FUNCTION expenses_create_partitions(months_ahead INT) RETURNS INT AS $$
+DECLARE
+    month_start DATE := date_trunc('month', NOW())::date;
+    created INT := 0;
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM expenses_partitioning) THEN
+        RETURN 0;
+    END IF;
+
+    -- Several app processes may run this at once
+    PERFORM pg_advisory_xact_lock(7281003);
+    FOR i IN 0 .. months_ahead LOOP
+        IF expenses_create_partition((month_start + i * interval '1 month')::date) THEN
+            created := created + 1;
+        END IF;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Converts the plain expenses table into the partitioned layout, in the
+-- caller's transaction with expenses locked. Every month from the oldest
+-- expense on gets a partition. Columns, defaults, foreign keys, indexes
+-- and triggers are carried over from the current table, whatever later
+-- migrations added. Rows are copied before the triggers exist, so the
+-- rollups and data versions stay as they are. Returns the number of
+-- monthly partitions.
+CREATE OR REPLACE FUNCTION expenses_partition_by_month(hash_count INT, months_ahead INT) RETURNS INT AS $$
+DECLARE
+    id_sequence TEXT := pg_get_serial_sequence('expenses', 'id');
+    index_defs TEXT[];
+    trigger_defs TEXT[];
+    foreign_keys TEXT[];
+    statement TEXT;
+    month_start DATE;
+    partitions INT := 0;
+BEGIN
+    IF EXISTS (SELECT 1 FROM expenses_partitioning) THEN
+        RAISE EXCEPTION 'expenses is already partitioned';
+    END IF;
+    LOCK TABLE expenses IN ACCESS EXCLUSIVE MODE;
+
+    SELECT array_agg(pg_get_indexdef(indexrelid)) INTO index_defs
+    FROM pg_index
+    WHERE indrelid = 'expenses'::regclass AND NOT indisprimary;
+    SELECT array_agg(pg_get_triggerdef(oid)) INTO trigger_defs
+    FROM pg_trigger
+    WHERE tgrelid = 'expenses'::regclass AND NOT tgisinternal;
+    SELECT array_agg(format('ALTER TABLE expenses ADD CONSTRAINT %I %s',
+                            conname, pg_get_constraintdef(oid))) INTO foreign_keys
+    FROM pg_constraint
+    WHERE conrelid = 'expenses'::regclass AND contype = 'f';
+
+    -- The sequence would otherwise be dropped with the old table
+    EXECUTE format('ALTER SEQUENCE %s OWNED BY NONE', id_sequence);
+    ALTER TABLE expenses RENAME TO expenses_unpartitioned;
+    CREATE TABLE expenses (
+        LIKE expenses_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE
+    ) PARTITION BY RANGE (transaction_datetime);
+
+    INSERT INTO expenses_partitioning (hash_partitions) VALUES (hash_count);
+    month_start := COALESCE(
+        (SELECT date_trunc('month', MIN(transaction_datetime))::date FROM expenses_unpartitioned),
+        date_trunc('month', NOW())::date
+    );
+    WHILE month_start <= date_trunc('month', NOW()) + months_ahead * interval '1 month' LOOP
+        PERFORM expenses_create_partition(month_start);
+        partitions := partitions + 1;
+        month_start := (month_start + interval '1 month')::date;
+    END LOOP;
+
+    INSERT INTO expenses SELECT * FROM expenses_unpartitioned;
+    DROP TABLE expenses_unpartitioned;
+    EXECUTE format('ALTER SEQUENCE %s OWNED BY expenses.id', id_sequence);
+
+    -- Unique constraints on a partitioned table must include the
+    -- partition keys: transaction_datetime, and user_id with hashing
+    IF hash_count > 1 THEN
+        ALTER TABLE expenses ADD PRIMARY KEY (id, transaction_datetime, user_id);
+    ELSE
+        ALTER TABLE expenses ADD PRIMARY KEY (id, transaction_datetime);
+    END IF;
+
+    FOREACH statement IN ARRAY COALESCE(foreign_keys, '{}') LOOP
+        EXECUTE statement;
+    END LOOP;
+    -- The definitions were read before the rename, so they are on expenses
+    FOREACH statement IN ARRAY COALESCE(index_defs, '{}') LOOP
+        IF hash_count > 1 AND statement LIKE 'CREATE UNIQUE INDEX%' THEN
+            statement := regexp_replace(statement, '^(.*? USING \w+ \([^)]*)\)', '\1, user_id)');
+        END IF;
+        EXECUTE statement;
+    END LOOP;
+    FOREACH statement IN ARRAY COALESCE(trigger_defs, '{}') LOOP
+        EXECUTE statement;
+    END LOOP;
+
+    ANALYZE expenses;
+    RETURN partitions;
+END;
+$$ LANGUAGE plpgsql;
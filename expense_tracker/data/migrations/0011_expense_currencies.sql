@@ -0,0 +1,53 @@
+-- Expenses in other currencies than USD. The amount is kept as entered
+-- in amount_cents (NULL for USD expenses) with its currency, and
+-- amount_cents_usd holds it converted at the rate of its day, so
+-- totals, rollups and caches all stay in USD.
+
+-- Daily rates imported from a file (`flask import-rates`)
+CREATE TABLE IF NOT EXISTS exchange_rates (
+    currency CHAR(3) NOT NULL,
+    day DATE NOT NULL,
+    units_per_usd NUMERIC(20, 10) NOT NULL CHECK (units_per_usd > 0),
+    PRIMARY KEY (currency, day)
+);
+
+ALTER TABLE expenses ADD COLUMN IF NOT EXISTS currency CHAR(3) NOT NULL DEFAULT 'USD';
+ALTER TABLE expenses ADD COLUMN IF NOT EXISTS amount_cents BIGINT;
+
+-- The rate of the latest day on or before on_day, or the earliest one
+-- for days before the first imported rate. NULL for unknown currencies.
+CREATE OR REPLACE FUNCTION exchange_rate(for_currency TEXT, on_day DATE) RETURNS NUMERIC AS $$
+    SELECT units_per_usd FROM (
+        (SELECT units_per_usd, 0 AS preference
+         FROM exchange_rates
+         WHERE currency = for_currency AND day <= on_day
+         ORDER BY day DESC LIMIT 1)
+        UNION ALL
+        (SELECT units_per_usd, 1
+         FROM exchange_rates
+         WHERE currency = for_currency AND day > on_day
+         ORDER BY day ASC LIMIT 1)
+    ) candidates
+    ORDER BY preference
+    LIMIT 1
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION expenses_convert_to_usd() RETURNS trigger AS $$
+DECLARE
+    rate NUMERIC := exchange_rate(NEW.currency, NEW.transaction_datetime::date);
+BEGIN
+    IF rate IS NULL THEN
+        RAISE EXCEPTION 'No exchange rate for %', NEW.currency
+            USING ERRCODE = 'invalid_parameter_value';
+    END IF;
+    NEW.amount_cents_usd := ROUND(NEW.amount_cents / rate);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Runs before the rollups trigger sees the row. USD expenses skip it.
+DROP TRIGGER IF EXISTS expenses_convert_to_usd ON expenses;
+CREATE TRIGGER expenses_convert_to_usd
+    BEFORE INSERT OR UPDATE OF currency, amount_cents, transaction_datetime ON expenses
+    FOR EACH ROW WHEN (NEW.currency <> 'USD')
+    EXECUTE FUNCTION expenses_convert_to_usd();
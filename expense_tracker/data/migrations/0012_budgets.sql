@@ -0,0 +1,161 @@
+-- Monthly per-category budgets. Spend against them comes from
+-- expense_monthly_totals, kept current by a trigger on expenses like the
+-- daily rollups (migration 0004), so showing a budget never re-sums a
+-- month of expenses. Writes that take a month's total past one of a
+-- budget's alert percents add a row to budget_alerts.
+-- Amounts are in USD cents, category_id 0 stands for "no category".
+CREATE TABLE IF NOT EXISTS budgets (
+    user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    category_id INT NOT NULL REFERENCES categories(id) ON DELETE CASCADE,
+    amount_cents BIGINT NOT NULL CHECK (amount_cents > 0),
+    alert_percents INT[] NOT NULL DEFAULT '{80, 100}',
+    PRIMARY KEY (user_id, category_id)
+);
+
+CREATE TABLE IF NOT EXISTS expense_monthly_totals (
+    user_id INT NOT NULL,
+    month DATE NOT NULL,
+    category_id INT NOT NULL DEFAULT 0,
+    txn_count INT NOT NULL,
+    total_cents BIGINT NOT NULL,
+    PRIMARY KEY (user_id, month, category_id)
+);
+
+-- One alert per budget, month and percent. Shown once (seen_at).
+CREATE TABLE IF NOT EXISTS budget_alerts (
+    user_id INT NOT NULL,
+    category_id INT NOT NULL,
+    month DATE NOT NULL,
+    percent INT NOT NULL,
+    total_cents BIGINT NOT NULL,
+    budget_cents BIGINT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    seen_at TIMESTAMP,
+    PRIMARY KEY (user_id, category_id, month, percent),
+    FOREIGN KEY (user_id, category_id)
+        REFERENCES budgets (user_id, category_id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS budget_alerts_unseen_idx
+    ON budget_alerts (user_id) WHERE seen_at IS NULL;
+
+CREATE OR REPLACE FUNCTION expense_monthly_totals_add(
+    p_user_id INT, p_month DATE, p_category_id INT,
+    p_txn_count INT, p_total_cents BIGINT
+) RETURNS void AS $$
+DECLARE
+    new_total BIGINT;
+BEGIN
+    INSERT INTO expense_monthly_totals AS t
+        (user_id, month, category_id, txn_count, total_cents)
+    VALUES (p_user_id, p_month, p_category_id, p_txn_count, p_total_cents)
+    ON CONFLICT (user_id, month, category_id) DO UPDATE
+        SET txn_count = t.txn_count + EXCLUDED.txn_count,
+            total_cents = t.total_cents + EXCLUDED.total_cents
+    RETURNING total_cents INTO new_total;
+
+    IF p_txn_count < 0 THEN
+        DELETE FROM expense_monthly_totals
+        WHERE user_id = p_user_id
+            AND month = p_month
+            AND category_id = p_category_id
+            AND txn_count = 0;
+    END IF;
+
+    -- The alert percents this write went past, from below
+    IF p_total_cents > 0 THEN
+        INSERT INTO budget_alerts
+            (user_id, category_id, month, percent, total_cents, budget_cents)
+        SELECT b.user_id, b.category_id, p_month, percent, new_total, b.amount_cents
+        FROM budgets b, unnest(b.alert_percents) AS percent
+        WHERE b.user_id = p_user_id
+            AND b.category_id = p_category_id
+            AND (new_total - p_total_cents) * 100 < b.amount_cents * percent
+            AND new_total * 100 >= b.amount_cents * percent
+        ON CONFLICT DO NOTHING;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION expenses_maintain_monthly_totals() RETURNS trigger AS $$
+BEGIN
+    -- An edit within the same month and category adds the difference,
+    -- so raising an amount only alerts on percents it actually passes
+    IF TG_OP = 'UPDATE'
+            AND OLD.user_id = NEW.user_id
+            AND date_trunc('month', OLD.transaction_datetime) = date_trunc('month', NEW.transaction_datetime)
+            AND COALESCE(OLD.category_id, 0) = COALESCE(NEW.category_id, 0) THEN
+        IF NEW.amount_cents_usd <> OLD.amount_cents_usd THEN
+            PERFORM expense_monthly_totals_add(
+                NEW.user_id, date_trunc('month', NEW.transaction_datetime)::date,
+                COALESCE(NEW.category_id, 0), 0,
+                NEW.amount_cents_usd::bigint - OLD.amount_cents_usd
+            );
+        END IF;
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM expense_monthly_totals_add(
+            OLD.user_id, date_trunc('month', OLD.transaction_datetime)::date,
+            COALESCE(OLD.category_id, 0), -1, -OLD.amount_cents_usd::bigint
+        );
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM expense_monthly_totals_add(
+            NEW.user_id, date_trunc('month', NEW.transaction_datetime)::date,
+            COALESCE(NEW.category_id, 0), 1, NEW.amount_cents_usd::bigint
+        );
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS expenses_maintain_monthly_totals ON expenses;
+CREATE TRIGGER expenses_maintain_monthly_totals
+    AFTER INSERT OR UPDATE OR DELETE ON expenses
+    FOR EACH ROW EXECUTE FUNCTION expenses_maintain_monthly_totals();
+
+-- Pages showing budgets are cached on the data version too. The bump
+-- is recorded as touching no days (an empty range), so cached analytics
+-- survive budget changes.
+CREATE OR REPLACE FUNCTION budgets_bump_data_version() RETURNS trigger AS $$
+BEGIN
+    WITH bumped AS (
+        UPDATE users SET data_version = data_version + 1
+        WHERE id IN (SELECT user_id FROM changed_rows)
+        RETURNING id, data_version
+    )
+    INSERT INTO expense_write_ranges (user_id, data_version, first_day, last_day)
+    SELECT id, data_version, 'infinity', '-infinity'
+    FROM bumped;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS budgets_bump_data_version_insert ON budgets;
+CREATE TRIGGER budgets_bump_data_version_insert
+    AFTER INSERT ON budgets
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION budgets_bump_data_version();
+
+DROP TRIGGER IF EXISTS budgets_bump_data_version_update ON budgets;
+CREATE TRIGGER budgets_bump_data_version_update
+    AFTER UPDATE ON budgets
+    REFERENCING NEW TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION budgets_bump_data_version();
+
+DROP TRIGGER IF EXISTS budgets_bump_data_version_delete ON budgets;
+CREATE TRIGGER budgets_bump_data_version_delete
+    AFTER DELETE ON budgets
+    REFERENCING OLD TABLE AS changed_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION budgets_bump_data_version();
+
+-- Backfill from the existing expenses
+DELETE FROM expense_monthly_totals;
+INSERT INTO expense_monthly_totals
+    (user_id, month, category_id, txn_count, total_cents)
+SELECT user_id, date_trunc('month', transaction_datetime)::date,
+       COALESCE(category_id, 0), COUNT(*), SUM(amount_cents_usd)
+FROM expenses
+GROUP BY 1, 2, 3;
@@ -0,0 +1,14 @@
+-- Every worker caches the categories (expense_tracker.categories) and
+-- listens on this channel, so changes made to the table by hand are
+-- picked up right away instead of after the cache TTL.
+CREATE OR REPLACE FUNCTION categories_notify_change() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('categories_changed', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS categories_notify_change ON categories;
+CREATE TRIGGER categories_notify_change
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON categories
+    FOR EACH STATEMENT EXECUTE FUNCTION categories_notify_change();
@@ -0,0 +1,149 @@
+-- A partitioned expenses table (migration 0010) only has monthly
+-- partitions from its oldest expense on, so expenses dated before that
+-- (an older date on the form, an imported history, a date shift, a
+-- recurring rule starting earlier) had no partition to go to. They now
+-- land in a DEFAULT partition.
+
+-- Creates expenses_default unless it exists. Indexes and triggers on
+-- expenses are cloned to it.
+CREATE OR REPLACE FUNCTION expenses_create_default_partition() RETURNS BOOLEAN AS $$
+BEGIN
+    IF to_regclass('expenses_default') IS NOT NULL THEN
+        RETURN FALSE;
+    END IF;
+    CREATE TABLE expenses_default PARTITION OF expenses DEFAULT;
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+-- As in migration 0010, except that a month whose expenses already are
+-- in the default partition keeps them there: PostgreSQL refuses to
+-- create a partition for rows the default partition holds.
+CREATE OR REPLACE FUNCTION expenses_create_partition(month_start DATE) RETURNS BOOLEAN AS $$
+DECLARE
+    partition_name TEXT := 'expenses_' || to_char(month_start, 'YYYY_MM');
+    hash_count INT;
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN FALSE;
+    END IF;
+    -- Nested, as the EXISTS can only be planned once the table exists
+    IF to_regclass('expenses_default') IS NOT NULL THEN
+        IF EXISTS (
+            SELECT 1 FROM expenses_default
+            WHERE transaction_datetime >= month_start
+                AND transaction_datetime < month_start + interval '1 month'
+        ) THEN
+            RAISE NOTICE 'expenses for % stay in expenses_default', to_char(month_start, 'YYYY-MM');
+            RETURN FALSE;
+        END IF;
+    END IF;
+
+    SELECT hash_partitions INTO hash_count FROM expenses_partitioning;
+    IF hash_count > 1 THEN
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF expenses FOR VALUES FROM (%L) TO (%L)'
+            ' PARTITION BY HASH (user_id)',
+            partition_name, month_start, month_start + 1 * interval '1 month'
+        );
+        FOR remainder IN 0 .. hash_count - 1 LOOP
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF %I FOR VALUES WITH (MODULUS %s, REMAINDER %s)',
+                partition_name || '_h' || remainder, partition_name, hash_count, remainder
+            );
+        END LOOP;
+    ELSE
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF expenses FOR VALUES FROM (%L) TO (%L)',
+            partition_name, month_start, month_start + 1 * interval '1 month'
+        );
+    END IF;
+    RETURN TRUE;
+END;
+$$ LANGUAGE plpgsql;
+
+-- As in migration 0010, plus the default partition
+CREATE OR REPLACE FUNCTION expenses_partition_by_month(hash_count INT, months_ahead INT) RETURNS INT AS $$
+DECLARE
+    id_sequence TEXT := pg_get_serial_sequence('expenses', 'id');
+    index_defs TEXT[];
+    trigger_defs TEXT[];
+    foreign_keys TEXT[];
+    statement TEXT;
+    month_start DATE;
+    partitions INT := 0;
+BEGIN
+    IF EXISTS (SELECT 1 FROM expenses_partitioning) THEN
+        RAISE EXCEPTION 'expenses is already partitioned';
+    END IF;
+    LOCK TABLE expenses IN ACCESS EXCLUSIVE MODE;
+
+    SELECT array_agg(pg_get_indexdef(indexrelid)) INTO index_defs
+    FROM pg_index
+    WHERE indrelid = 'expenses'::regclass AND NOT indisprimary;
+    SELECT array_agg(pg_get_triggerdef(oid)) INTO trigger_defs
+    FROM pg_trigger
+    WHERE tgrelid = 'expenses'::regclass AND NOT tgisinternal;
+    SELECT array_agg(format('ALTER TABLE expenses ADD CONSTRAINT %I %s',
+                            conname, pg_get_constraintdef(oid))) INTO foreign_keys
+    FROM pg_constraint
+    WHERE conrelid = 'expenses'::regclass AND contype = 'f';
+
+    -- The sequence would otherwise be dropped with the old table
+    EXECUTE format('ALTER SEQUENCE %s OWNED BY NONE', id_sequence);
+    ALTER TABLE expenses RENAME TO expenses_unpartitioned;
+    CREATE TABLE expenses (
+        LIKE expenses_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING STORAGE
+    ) PARTITION BY RANGE (transaction_datetime);
+
+    INSERT INTO expenses_partitioning (hash_partitions) VALUES (hash_count);
+    month_start := COALESCE(
+        (SELECT date_trunc('month', MIN(transaction_datetime))::date FROM expenses_unpartitioned),
+        date_trunc('month', NOW())::date
+    );
+    WHILE month_start <= date_trunc('month', NOW()) + months_ahead * interval '1 month' LOOP
+        PERFORM expenses_create_partition(month_start);
+        partitions := partitions + 1;
+        month_start := (month_start + interval '1 month')::date;
+    END LOOP;
+    PERFORM expenses_create_default_partition();
+
+    INSERT INTO expenses SELECT * FROM expenses_unpartitioned;
+    DROP TABLE expenses_unpartitioned;
+    EXECUTE format('ALTER SEQUENCE %s OWNED BY expenses.id', id_sequence);
+
+    -- Unique constraints on a partitioned table must include the
+    -- partition keys: transaction_datetime, and user_id with hashing
+    IF hash_count > 1 THEN
+        ALTER TABLE expenses ADD PRIMARY KEY (id, transaction_datetime, user_id);
+    ELSE
+        ALTER TABLE expenses ADD PRIMARY KEY (id, transaction_datetime);
+    END IF;
+
+    FOREACH statement IN ARRAY COALESCE(foreign_keys, '{}') LOOP
+        EXECUTE statement;
+    END LOOP;
+    -- The definitions were read before the rename, so they are on expenses
+    FOREACH statement IN ARRAY COALESCE(index_defs, '{}') LOOP
+        IF hash_count > 1 AND statement LIKE 'CREATE UNIQUE INDEX%' THEN
+            statement := regexp_replace(statement, '^(.*? USING \w+ \([^)]*)\)', '\1, user_id)');
+        END IF;
+        EXECUTE statement;
+    END LOOP;
+    FOREACH statement IN ARRAY COALESCE(trigger_defs, '{}') LOOP
+        EXECUTE statement;
+    END LOOP;
+
+    ANALYZE expenses;
+    RETURN partitions;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Tables partitioned before this migration
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM expenses_partitioning) THEN
+        PERFORM expenses_create_default_partition();
+    END IF;
+END;
+$$;
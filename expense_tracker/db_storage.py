@@ -1,261 +1,1184 @@
+import re
 import psycopg2
-from psycopg2.extras import DictCursor
+from psycopg2.extras import DictCursor, execute_values
 from textwrap import dedent
 from functools import wraps
-from datetime import datetime
+from datetime import date, datetime, timedelta
+import time
+import random
+import logging
+from collections import namedtuple
+from decimal import Decimal
+from expense_tracker import config
+from expense_tracker.instrumentation import record_storage_call
+from expense_tracker.connection_pool import get_pool
 
-# Wrapping database queries with connection and cursor as context managers
-def db_transaction(cursor_type=None):
+logger = logging.getLogger(__name__)
+
+# Wrapping database queries with connection and cursor as context managers.
+# Every call is timed and recorded for the request profile and /metrics.
+# read_only methods may run on a replica (see read_connection).
+def db_transaction(cursor_type=None, read_only=False):
     def decorator(meth):
         @wraps(meth)
         def wrapper(self, *args, **kwargs):
-            with self.connection:
+            self.query_count += 1
+            started = time.perf_counter()
+            connection = self.read_connection if read_only else self.connection
+            with connection:
                 if cursor_type:
-                    with self.connection.cursor(cursor_factory=cursor_type) as cursor:
+                    with connection.cursor(cursor_factory=cursor_type) as cursor:
                         result = meth(self, cursor, *args, **kwargs)
+                        rows, statement = cursor.rowcount, cursor.query
                 else:
-                    with self.connection.cursor() as cursor:
+                    with connection.cursor() as cursor:
                         result = meth(self, cursor, *args, **kwargs)
-                return result
+                        rows, statement = cursor.rowcount, cursor.query
+
+            elapsed = time.perf_counter() - started
+            self.db_time += elapsed
+            record_storage_call(meth.__name__, elapsed, rows, statement)
+            return result
         return wrapper
     return decorator
 
+# Converts validated form values to the column values stored in expenses
+def expense_values(transaction_date, transaction_time,
+                   amount_usd, description, category_id):
+    amount_cents = int(Decimal(amount_usd) * 100)
+    if transaction_time:
+        transaction_datetime = datetime.strptime(f'{transaction_date}T{transaction_time}','%Y-%m-%dT%H:%M')
+    else:
+        transaction_datetime = datetime.strptime(f'{transaction_date}','%Y-%m-%d')
+    category_id = int(category_id) if category_id else None
+    description = description if description else None
+
+    return transaction_datetime, amount_cents, description, category_id
+
+# Amounts in other currencies are also stored as entered, in
+# amount_cents. amount_cents_usd gets the same value, which the
+# expenses_convert_to_usd trigger (migration 0011) then converts.
+def currency_values(currency, amount_cents):
+    return currency, (None if currency == 'USD' else amount_cents)
+
+# An expense as the list, search and edit pages read it, built straight
+# from a plain tuple row. Templates format it with the cents_to_currency
+# and format_datetime filters.
+ExpenseRecord = namedtuple('ExpenseRecord', (
+    'id', 'transaction_datetime', 'amount_cents_usd', 'description',
+    'category_id', 'category_name', 'currency', 'amount_cents',
+))
+EXPENSE_RECORD_COLUMNS = (
+    'e.id, e.transaction_datetime, e.amount_cents_usd, e.description,'
+    ' e.category_id, c.name, e.currency, e.amount_cents'
+)
+
+def expense_records(rows):
+    return list(map(ExpenseRecord._make, rows))
+
+# Arbitrary key: one process at a time materializes recurring expenses
+RECURRING_LOCK_KEY = 7281002
+
+# Queries read through server-side cursors, shared with the async storage
+def user_expenses_stream_query(user_id):
+    query = (
+        f"""
+        SELECT {EXPENSE_RECORD_COLUMNS}
+        FROM expenses e
+        LEFT JOIN categories c ON e.category_id = c.id
+        WHERE e.user_id = %s
+        ORDER BY e.transaction_datetime DESC, e.id DESC
+        """
+    )
+    return query, (user_id, )
+
+def export_query(user_id, date_from=None, date_to=None):
+    query = (
+        """
+        SELECT e.id, e.transaction_datetime, e.amount_cents_usd,
+               e.description, c.name, e.currency, e.amount_cents
+        FROM expenses e
+        LEFT JOIN categories c ON e.category_id = c.id
+        WHERE e.user_id = %s
+        """
+    )
+    params = [user_id, ]
+
+    if date_from:
+        query += '\n AND e.transaction_datetime >= %s'
+        params.append(datetime.strptime(date_from, '%Y-%m-%d'))
+    if date_to:
+        query += '\n AND e.transaction_datetime <= %s'
+        params.append(datetime.strptime(date_to + 'T23:59:59', '%Y-%m-%dT%H:%M:%S'))
+
+    query += '\n ORDER BY e.transaction_datetime ASC, e.id ASC'
+    return query, params
+
+# The INSERT of imported expenses, shared with the async storage, and
+# its row for one validated expense data dict. `values` is what follows
+# VALUES: '%s' for execute_values, a row of placeholders for executemany.
+IMPORT_COLUMNS = ('transaction_datetime', 'amount_cents_usd', 'description',
+                  'user_id', 'category_id')
+
+def import_query(values='%s'):
+    return f"INSERT INTO expenses ({', '.join(IMPORT_COLUMNS)}) VALUES {values}"
+
+def import_row(user_id, expense_data):
+    transaction_datetime, amount_cents, description, category_id = (
+        expense_values(**expense_data)
+    )
+    return (transaction_datetime, amount_cents, description, user_id, category_id)
+
+# Keyset pages are fetched with one row past `limit`,
+# which tells whether there is a next page
+def split_page(rows, limit):
+    next_key = None
+    if len(rows) > limit:
+        rows.pop()
+        last = rows[-1]
+        next_key = (last.transaction_datetime, last.id)
+
+    return rows, next_key
+
+# Search text as a tsquery matching every word as a prefix:
+# 'star coff' -> 'star:* & coff:*'. None if there are no words.
+def search_tsquery(text):
+    words = re.findall(r'\w+', text or '')
+    return ' & '.join(f'{word.lower()}:*' for word in words) or None
+
+# A keyset page of the user's expenses, newest first, optionally
+# filtered (see search_expenses). Fetches one row past `limit`.
+def expenses_page_query(user_id, limit, after=None, text=None, min_cents=None,
+                        max_cents=None, category_id=None, date_from=None, date_to=None):
+    query = (
+        f"""
+        SELECT {EXPENSE_RECORD_COLUMNS}
+        FROM expenses e
+        LEFT JOIN categories c ON e.category_id = c.id
+        WHERE e.user_id = %s
+        """
+    )
+    params = [user_id, ]
+
+    tsquery = search_tsquery(text)
+    if tsquery:
+        # Must match the indexed expression exactly
+        query += ("\n AND to_tsvector('simple', COALESCE(e.description, ''))"
+                  " @@ to_tsquery('simple', %s)")
+        params.append(tsquery)
+    if min_cents is not None:
+        query += '\n AND e.amount_cents_usd >= %s'
+        params.append(min_cents)
+    if max_cents is not None:
+        query += '\n AND e.amount_cents_usd <= %s'
+        params.append(max_cents)
+    if category_id is not None:
+        query += '\n AND e.category_id = %s'
+        params.append(category_id)
+    if date_from:
+        query += '\n AND e.transaction_datetime >= %s'
+        params.append(datetime.strptime(date_from, '%Y-%m-%d'))
+    if date_to:
+        query += '\n AND e.transaction_datetime < %s'
+        params.append(datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1))
+    if after:
+        # The plain bound lets a partitioned expenses table skip
+        # the newer months, which the row comparison doesn't
+        query += ('\n AND e.transaction_datetime <= %s'
+                  '\n AND (e.transaction_datetime, e.id) < (%s, %s)')
+        params.extend((after[0], *after))
+
+    # One extra row tells whether there is a next page
+    query += '\n ORDER BY e.transaction_datetime DESC, e.id DESC LIMIT %s'
+    params.append(limit + 1)
+    return query, params
+
+# Groups of the user's expenses from the daily rollups, or None for an
+# unknown group_option
+def grouped_data_query(user_id, group_option, date_from=None, date_to=None, by_day=False):
+    # Aggregates are computed from the daily rollups maintained by the
+    # expenses trigger (see migration 0004) instead of scanning expenses.
+    # by_day splits every group into its days (a `day` column), which
+    # currency conversion needs.
+    day_column, day_group = ('r.day,', ', r.day') if by_day else ('', '')
+    if group_option.lower() in ('month', 'day', 'week'):
+        query = f"""
+                SELECT DATE_TRUNC(%s, r.day::timestamp) as group_value, {day_column}
+                        SUM(r.txn_count)::bigint as txn_count,
+                        SUM(r.total_cents)::bigint as total_amount,
+                        ROUND(SUM(r.total_cents)::numeric / SUM(r.txn_count), 2) as avg_amount
+                        FROM expense_daily_rollups r
+                        WHERE r.user_id = %s
+                """
+
+        params = [group_option.lower(), user_id, ]
+        group_by = f'\n GROUP BY 1{day_group} ORDER BY 1 ASC'
+
+    elif group_option.lower() == 'category':
+        query = f"""
+                SELECT c.name as group_value, {day_column}
+                        SUM(r.txn_count)::bigint as txn_count,
+                        SUM(r.total_cents)::bigint as total_amount,
+                        ROUND(SUM(r.total_cents)::numeric / SUM(r.txn_count), 2) as avg_amount
+                        FROM expense_daily_rollups r
+                            JOIN categories c ON r.category_id = c.id
+                        WHERE r.user_id = %s
+                """
+
+        params = [user_id, ]
+        group_by = f'\n GROUP BY c.name{day_group} ORDER BY 1 ASC'
+
+    else:
+        return None
+
+    if date_from:
+        query += '\n AND r.day >= %s'
+        params.append(datetime.strptime(date_from, '%Y-%m-%d').date())
+    if date_to:
+        query += '\n AND r.day <= %s'
+        params.append(datetime.strptime(date_to, '%Y-%m-%d').date())
+
+    query += group_by
+    return query, params
+
+def user_id_query(username):
+    query = """
+            SELECT id
+            FROM users
+            WHERE LOWER(user_name) = %s
+            """
+    return query, (username.lower(), )
+
+# The statement behind ExpensesDatabaseStorage.materialize_recurring_expenses
+def materialize_recurring_query(now, recurring_expense_id, batch_size, catch_up,
+                                max_occurrences):
+    query = (
+        """
+        WITH due AS (
+            SELECT r.id, r.user_id, r.amount_cents_usd, r.description,
+                   r.category_id, r.frequency, r.starts_on,
+                   r.occurrence_count,
+                   recurring_occurrence_count(
+                       r.starts_on, r.frequency,
+                       LEAST(%(now)s, r.ends_on + TIME '23:59:59.999999')
+                   ) AS due_count
+            FROM recurring_expenses r
+            WHERE r.next_occurrence <= %(now)s
+                AND (r.ends_on IS NULL OR r.next_occurrence < r.ends_on + 1)
+                AND (%(rule_id)s::int IS NULL OR r.id = %(rule_id)s)
+            ORDER BY r.next_occurrence
+            LIMIT %(batch_size)s
+            FOR UPDATE
+        ), occurrences AS (
+            SELECT d.id, d.user_id, d.amount_cents_usd, d.description,
+                   d.category_id, n,
+                   d.starts_on + n * recurring_period(d.frequency)
+                       AS transaction_datetime
+            FROM due d
+            CROSS JOIN LATERAL generate_series(
+                CASE WHEN %(catch_up)s THEN d.occurrence_count
+                     ELSE GREATEST(d.occurrence_count, d.due_count - 1) END,
+                CASE WHEN %(catch_up)s
+                     THEN LEAST(d.due_count, d.occurrence_count + %(max_occurrences)s)
+                     ELSE d.due_count END - 1
+            ) AS n
+        ), inserted AS (
+            INSERT INTO expenses
+            (transaction_datetime, amount_cents_usd, description,
+            user_id, category_id, recurring_expense_id)
+            SELECT transaction_datetime, amount_cents_usd, description,
+                   user_id, category_id, id
+            FROM occurrences
+            ON CONFLICT DO NOTHING
+            RETURNING id
+        ), advanced AS (
+            UPDATE recurring_expenses r
+            SET occurrence_count = o.next_count,
+                next_occurrence = r.starts_on
+                    + o.next_count * recurring_period(r.frequency)
+            FROM (
+                SELECT id, MAX(n) + 1 AS next_count
+                FROM occurrences
+                GROUP BY id
+            ) o
+            WHERE r.id = o.id
+            RETURNING r.id
+        )
+        SELECT (SELECT COUNT(*) FROM advanced), (SELECT COUNT(*) FROM inserted)
+        """
+    )
+    params = {
+        'now': now,
+        'rule_id': recurring_expense_id,
+        'batch_size': batch_size,
+        'catch_up': catch_up,
+        'max_occurrences': max_occurrences,
+    }
+    return query, params
+
+# Statements of the single-statement storage methods, as (query, params).
+# AsyncExpensesDatabaseStorage runs the same ones, with the same result
+# helpers below.
+def all_user_expenses_query(user_id):
+    query = (
+        f"""
+        SELECT {EXPENSE_RECORD_COLUMNS}
+        FROM expenses e
+        LEFT JOIN categories c ON e.category_id = c.id
+        WHERE e.user_id = %s
+        ORDER BY e.transaction_datetime DESC
+        """
+    )
+    return query, (user_id, )
+
+def expense_by_id_query(user_id, expense_id):
+    query = (
+        f"""
+        SELECT {EXPENSE_RECORD_COLUMNS}
+        FROM expenses e
+        LEFT JOIN categories c ON e.category_id = c.id
+        WHERE e.user_id = %s
+            AND e.id = %s
+        """
+    )
+    return query, (user_id, expense_id, )
+
+def user_auth_query(user_name):
+    query = (
+        """
+        SELECT id, user_name, user_password
+        FROM users
+        WHERE LOWER(user_name) = %s
+        """
+    )
+    return query, (user_name.lower(), )
+
+def categories_query():
+    query = (
+        """
+        SELECT *
+        FROM categories
+        ORDER BY name ASC
+        """
+    )
+    return query, ()
+
+# (currency, day, units per USD) rows, by currency then day
+def exchange_rates_query():
+    query = (
+        """
+        SELECT currency, day, units_per_usd
+        FROM exchange_rates
+        ORDER BY currency, day
+        """
+    )
+    return query, ()
+
+def budgets_query(user_id, month):
+    query = (
+        """
+        SELECT b.category_id, c.name as category_name,
+               b.amount_cents as budget_cents,
+               COALESCE(t.total_cents, 0) as spent_cents,
+               COALESCE(t.txn_count, 0) as txn_count
+        FROM budgets b
+            JOIN categories c ON b.category_id = c.id
+            LEFT JOIN expense_monthly_totals t
+                ON t.user_id = b.user_id
+                AND t.category_id = b.category_id
+                AND t.month = %s
+        WHERE b.user_id = %s
+        ORDER BY c.name
+        """
+    )
+    return query, (month, user_id, )
+
+def pop_budget_alerts_query(user_id):
+    query = (
+        """
+        UPDATE budget_alerts
+        SET seen_at = NOW()
+        WHERE user_id = %s
+            AND seen_at IS NULL
+        RETURNING category_id, month, percent, total_cents, budget_cents
+        """
+    )
+    return query, (user_id, )
+
+def create_expense_query(user_id, transaction_date, transaction_time,
+                         amount_usd, description, category_id, currency='USD'):
+    transaction_datetime, amount_cents, description, category_id = (
+        expense_values(transaction_date, transaction_time,
+                       amount_usd, description, category_id)
+    )
+
+    query = (
+        """
+        INSERT INTO expenses
+        (transaction_datetime, amount_cents_usd, description,
+        user_id, category_id, currency, amount_cents)
+        VALUES
+        (%s, %s, %s, %s, %s, %s, %s)
+        RETURNING id
+        """
+    )
+    params = (transaction_datetime, amount_cents, description,
+              user_id, category_id, *currency_values(currency, amount_cents), )
+    return query, params
+
+def update_expense_query(user_id, expense_id, transaction_date, transaction_time,
+                         amount_usd, description, category_id, currency='USD'):
+    transaction_datetime, amount_cents, description, category_id = (
+        expense_values(transaction_date, transaction_time,
+                       amount_usd, description, category_id)
+    )
+    query = (
+        """
+        UPDATE expenses
+        SET transaction_datetime = %s,
+            amount_cents_usd = %s,
+            description = %s,
+            category_id = %s,
+            currency = %s,
+            amount_cents = %s
+        WHERE user_id = %s
+            AND id = %s
+        """
+    )
+    params = (
+        transaction_datetime, amount_cents,
+        description, category_id,
+        *currency_values(currency, amount_cents),
+        user_id, expense_id,
+    )
+    return query, params
+
+def delete_expense_query(user_id, expense_id):
+    query = (
+        """
+        DELETE FROM expenses
+        WHERE user_id = %s
+            AND id = %s
+        """
+    )
+    return query, (user_id, expense_id, )
+
+def data_version_query(user_id):
+    query = """
+            SELECT data_version
+            FROM users
+            WHERE id = %s
+            """
+    return query, (user_id, )
+
+def writes_overlap_query(user_id, since_version, date_from=None, date_to=None):
+    query = """
+            SELECT COUNT(DISTINCT w.data_version) < u.data_version - %s
+                   OR COALESCE(BOOL_OR(w.last_day >= %s AND w.first_day <= %s), FALSE)
+            FROM users u
+                LEFT JOIN expense_write_ranges w
+                    ON w.user_id = u.id AND w.data_version > %s
+            WHERE u.id = %s
+            GROUP BY u.data_version
+            """
+    first_day = datetime.strptime(date_from, '%Y-%m-%d').date() if date_from else date.min
+    last_day = datetime.strptime(date_to, '%Y-%m-%d').date() if date_to else date.max
+    return query, (since_version, first_day, last_day, since_version, user_id)
+
+def expense_columns_query(user_id):
+    query = """
+            SELECT string_agg(
+                (transaction_datetime::date - DATE '1970-01-01') || ' '
+                || amount_cents_usd || ' ' || COALESCE(category_id, 0),
+                ' ')
+            FROM expenses
+            WHERE user_id = %s
+            """
+    return query, (user_id, )
+
+def create_user_query(username, password_hash):
+    query = """
+            INSERT INTO users (user_name, user_password)
+            VALUES (%s, %s)
+            RETURNING id
+            """
+    return query, (username, password_hash)
+
+def update_password_query(user_id, password_hash):
+    query = """
+            UPDATE users
+            SET user_password = %s
+            WHERE id = %s
+            """
+    return query, (password_hash, user_id)
+
+def first_column(row, default=None):
+    return row[0] if row else default
+
+def expense_record(row):
+    return ExpenseRecord._make(row) if row else None
+
+def sorted_alerts(rows):
+    return sorted(rows, key=lambda alert: (alert['month'], alert['percent']))
+
 
 class ExpensesDatabaseStorage:
     def __init__(self, is_test_env=False):
-        db_name = 'test_expenses' if is_test_env else 'expenses'
-        self.connection = psycopg2.connect(dbname=db_name)
+        self.db_name = config.TEST_DB_NAME if is_test_env else config.DB_NAME
+        self.pool = get_pool(self.db_name, config.DB_PRIMARY_DSN)
+        self._connection = None
+        self._read_connection = None
+        # Off unless the caller knows stale reads are fine, as the app
+        # does for requests of clients that haven't written lately
+        self.replica_reads = False
+        # Storage calls (database round trips) made through this instance.
+        # The app creates one instance per request, so this is per request.
+        self.query_count = 0
+        self.db_time = 0.0
 
-    @db_transaction(DictCursor)
+    # The connection is checked out of the shared pool on first use,
+    # so requests that never touch the database don't hold one
+    @property
+    def connection(self):
+        if self._connection is None:
+            self._connection = self.pool.getconn()
+        return self._connection
+
+    # Connection for read_only methods: one replica for the whole
+    # instance, so a request reads consistent data. The primary when
+    # replica reads are off or no replica can be reached.
+    @property
+    def read_connection(self):
+        if not self.replica_reads or not config.DB_REPLICA_DSNS:
+            return self.connection
+        if self._read_connection is None:
+            try:
+                pool = get_pool(self.db_name, random.choice(config.DB_REPLICA_DSNS),
+                                read_only=True)
+                self._read_connection = (pool, pool.getconn())
+            except psycopg2.OperationalError:
+                logger.warning('Replica unavailable, reading from the primary',
+                               exc_info=True)
+                self.replica_reads = False
+                return self.connection
+        return self._read_connection[1]
+
+    @db_transaction(read_only=True)
     def get_all_user_expenses(self, cursor, user_id):
+        cursor.execute(*all_user_expenses_query(user_id))
+        return expense_records(cursor.fetchall())
+
+    @db_transaction(read_only=True)
+    def get_user_expenses_page(self, cursor, user_id, limit, after=None):
+        """
+        Keyset pagination over (transaction_datetime, id), newest first.
+        `after` is the (transaction_datetime, id) of the last row on the
+        previous page. Returns the rows and the key to pass as `after`
+        for the next page (None on the last page).
+        """
+        cursor.execute(*expenses_page_query(user_id, limit, after))
+        return split_page(expense_records(cursor.fetchmany(limit + 1)), limit)
+
+    @db_transaction(read_only=True)
+    def search_expenses(self, cursor, user_id, limit, text=None,
+                        min_cents=None, max_cents=None, category_id=None,
+                        date_from=None, date_to=None, after=None):
+        """
+        The user's expenses matching every given filter, paginated like
+        get_user_expenses_page. `text` is matched against the description
+        through the full-text index (migration 0008), amounts are
+        inclusive bounds in cents and dates inclusive 'YYYY-MM-DD' strings.
+        """
+        cursor.execute(*expenses_page_query(
+            user_id, limit, after, text=text, min_cents=min_cents, max_cents=max_cents,
+            category_id=category_id, date_from=date_from, date_to=date_to,
+        ))
+        return split_page(expense_records(cursor.fetchmany(limit + 1)), limit)
+
+    def iter_user_expenses(self, user_id, batch_size=2000):
+        """
+        Yields every expense of the user, newest first, through a named
+        (server-side) cursor so only `batch_size` rows are held in memory.
+        """
+        query, params = user_expenses_stream_query(user_id)
+        self.query_count += 1
+        connection = self.read_connection
+        with connection:
+            with connection.cursor(name='iter_user_expenses') as cursor:
+                cursor.itersize = batch_size
+                cursor.execute(query, params)
+                yield from map(ExpenseRecord._make, cursor)
+
+    def iter_expenses_for_export(self, user_id, date_from=None, date_to=None,
+                                 batch_size=5000):
+        """
+        Yields (id, transaction_datetime, amount_cents_usd, description,
+        category_name) tuples, oldest first, through a named cursor.
+        date_from and date_to are inclusive 'YYYY-MM-DD' strings.
+        """
+        query, params = export_query(user_id, date_from, date_to)
+        self.query_count += 1
+        connection = self.read_connection
+        with connection:
+            with connection.cursor(name='iter_expenses_for_export') as cursor:
+                cursor.itersize = batch_size
+                cursor.execute(query, params)
+                yield from cursor
+
+    @db_transaction(read_only=True)
+    def find_expense_by_id(self, cursor, user_id, expense_id):
+        cursor.execute(*expense_by_id_query(user_id, expense_id))
+        return expense_record(cursor.fetchone())
+
+    @db_transaction(DictCursor)
+    def find_user_auth(self, cursor, user_name):
+        """
+        Everything sign-in needs in one round trip: id, canonical
+        user name and password hash, or None if there is no such user.
+        """
+        cursor.execute(*user_auth_query(user_name))
+        result = cursor.fetchone()
+        return dict(result) if result else None
+
+    @db_transaction(DictCursor, read_only=True)
+    def get_categories(self, cursor):
+        cursor.execute(*categories_query())
+        return cursor.fetchall()
+
+    @db_transaction(read_only=True)
+    def get_exchange_rates(self, cursor):
+        cursor.execute(*exchange_rates_query())
+        return cursor.fetchall()
+
+    @db_transaction()
+    def import_exchange_rates(self, cursor, rates, batch_size=1000):
+        """
+        Adds or replaces (currency, day, units per USD) rates. Expenses
+        already stored keep the USD amount they were converted to.
+        Returns the number of rates written.
+        """
         query = (
             """
-            SELECT e.*, c.name as category_name
-            FROM expenses e
-            LEFT JOIN categories c ON e.category_id = c.id
-            JOIN users u ON u.id = e.user_id
-            WHERE u.id = %s
-            ORDER BY e.transaction_datetime DESC
+            INSERT INTO exchange_rates (currency, day, units_per_usd)
+            VALUES %s
+            ON CONFLICT (currency, day)
+            DO UPDATE SET units_per_usd = EXCLUDED.units_per_usd
             """
         )
-        cursor.execute(query, (user_id, ))
+        rates = list(rates)
+        execute_values(cursor, query, rates, page_size=batch_size)
+        return len(rates)
 
-        rows = cursor.fetchall()
-        results = [dict(row) for row in rows]
+    def close_connection(self):
+        if self._connection is not None:
+            self.pool.putconn(self._connection)
+            self._connection = None
+        if self._read_connection is not None:
+            pool, connection = self._read_connection
+            pool.putconn(connection)
+            self._read_connection = None
 
-        return results
+    @db_transaction()
+    def create_new_expense(self, cursor, user_id,
+                           transaction_date, transaction_time,
+                           amount_usd, description, category_id, currency='USD'):
+        cursor.execute(*create_expense_query(user_id, transaction_date, transaction_time,
+                                             amount_usd, description, category_id,
+                                             currency))
+        return first_column(cursor.fetchone())
+
+    @db_transaction()
+    def create_new_expenses(self, cursor, rows):
+        """
+        Inserts (transaction_datetime, amount_cents, description, user_id,
+        category_id, currency, entered amount_cents) rows, as
+        expense_values() and currency_values() build them for the group
+        commit writer, with one multi-row INSERT. Returns their ids in order:
+        they are taken from the sequence up front, since the order of
+        RETURNING rows isn't guaranteed.
+        """
+        cursor.execute(
+            """
+            SELECT nextval(pg_get_serial_sequence('expenses', 'id'))
+            FROM generate_series(1, %s)
+            """,
+            (len(rows), )
+        )
+        ids = [expense_id for expense_id, in cursor.fetchall()]
 
-    @db_transaction(DictCursor)
-    def find_expense_by_id(self, cursor, user_id, expense_id):
         query = (
             """
-            SELECT e.*, c.name as category_name
-            FROM expenses e
-            LEFT JOIN categories c ON e.category_id = c.id
-            JOIN users u ON u.id = e.user_id
-            WHERE u.id = %s
-                AND e.id = %s
+            INSERT INTO expenses
+            (id, transaction_datetime, amount_cents_usd, description,
+            user_id, category_id, currency, amount_cents)
+            VALUES %s
             """
         )
-        params = (user_id, expense_id,)
+        execute_values(cursor, query,
+                       [(expense_id, *row) for expense_id, row in zip(ids, rows)],
+                       page_size=len(rows))
+        return ids
 
-        cursor.execute(query, params)
-        result = cursor.fetchone()
-        return dict(result) if result else None
+    @db_transaction()
+    def import_expenses(self, cursor, user_id, expenses, batch_size=1000):
+        """
+        Inserts an iterable of validated expense data dicts (as produced by
+        utils.extract_expense_data) in multi-row INSERT batches, all in one
+        transaction. Returns the number of inserted rows.
+        """
+        query = import_query()
+        inserted = 0
+        batch = []
+        for expense_data in expenses:
+            batch.append(import_row(user_id, expense_data))
+
+            if len(batch) >= batch_size:
+                execute_values(cursor, query, batch, page_size=batch_size)
+                inserted += len(batch)
+                batch = []
+
+        if batch:
+            execute_values(cursor, query, batch, page_size=batch_size)
+            inserted += len(batch)
+
+        return inserted
 
     @db_transaction()
-    def find_user_by_username(self, cursor, user_name):
+    def update_expense(self, cursor, user_id, expense_id,
+                       transaction_date, transaction_time,
+                        amount_usd, description, category_id, currency='USD'):
+        cursor.execute(*update_expense_query(user_id, expense_id, transaction_date,
+                                             transaction_time, amount_usd, description,
+                                             category_id, currency))
+        return
+
+    @db_transaction()
+    def delete_expense_by_id(self, cursor, user_id, expense_id):
+        cursor.execute(*delete_expense_query(user_id, expense_id))
+        return
+
+    # Bulk operations run as one statement over the whole id set. The
+    # expenses triggers keep the rollups, data version and write ranges
+    # current, which the page and analytics caches rely on. Each returns
+    # {expense id: status} for every requested id.
+
+    @db_transaction()
+    def delete_expenses(self, cursor, user_id, expense_ids):
+        """Statuses: 'deleted' or 'not_found' (missing or another user's)."""
         query = (
             """
-            SELECT id
-            FROM users
-            WHERE LOWER(user_name) = %s
+            WITH requested AS (
+                SELECT DISTINCT unnest(%s::int[]) AS id
+            ), deleted AS (
+                DELETE FROM expenses e
+                WHERE e.user_id = %s
+                    AND e.id IN (SELECT id FROM requested)
+                RETURNING e.id
+            )
+            SELECT r.id,
+                   CASE WHEN d.id IS NOT NULL THEN 'deleted' ELSE 'not_found' END
+            FROM requested r
+                LEFT JOIN deleted d ON d.id = r.id
             """
         )
-        cursor.execute(query, (user_name.lower(), ))
-
-        result = cursor.fetchone()
-        return result[0] if result else None
+        cursor.execute(query, (list(expense_ids), user_id))
+        return dict(cursor.fetchall())
 
-    @db_transaction(DictCursor)
-    def get_categories(self, cursor):
+    @db_transaction()
+    def recategorize_expenses(self, cursor, user_id, expense_ids, category_id):
+        """
+        Sets the category (None for no category). Statuses: 'updated'
+        or 'not_found'.
+        """
         query = (
             """
-            SELECT *
-            FROM categories
-            ORDER BY name ASC
+            WITH requested AS (
+                SELECT DISTINCT unnest(%s::int[]) AS id
+            ), updated AS (
+                UPDATE expenses e
+                SET category_id = %s
+                WHERE e.user_id = %s
+                    AND e.id IN (SELECT id FROM requested)
+                RETURNING e.id
+            )
+            SELECT r.id,
+                   CASE WHEN u.id IS NOT NULL THEN 'updated' ELSE 'not_found' END
+            FROM requested r
+                LEFT JOIN updated u ON u.id = r.id
             """
         )
-        cursor.execute(query)
-        return cursor.fetchall()
-
-    def close_connection(self):
-        self.connection.close()
+        cursor.execute(query, (list(expense_ids), category_id, user_id))
+        return dict(cursor.fetchall())
 
     @db_transaction()
-    def create_new_expense(self, cursor, user_id,
-                           transaction_date, transaction_time,
-                           amount_usd, description, category_id):
-        amount_cents = int(float(amount_usd) * 100)
-        if transaction_time:
-            transaction_datetime = datetime.strptime(f'{transaction_date}T{transaction_time}','%Y-%m-%dT%H:%M')
-        else:
-            transaction_datetime = datetime.strptime(f'{transaction_date}','%Y-%m-%d')
-        category_id = int(category_id) if category_id else None
-        description = description if description else None
+    def shift_expense_dates(self, cursor, user_id, expense_ids, days):
+        """
+        Moves the expenses `days` days (negative for earlier). Expenses
+        that would move into the future are left alone. Statuses:
+        'updated', 'future' or 'not_found'.
+        """
+        query = (
+            """
+            WITH requested AS (
+                SELECT DISTINCT unnest(%s::int[]) AS id
+            ), updated AS (
+                UPDATE expenses e
+                SET transaction_datetime = e.transaction_datetime + %s * INTERVAL '1 day'
+                WHERE e.user_id = %s
+                    AND e.id IN (SELECT id FROM requested)
+                    AND e.transaction_datetime + %s * INTERVAL '1 day' <= NOW()
+                RETURNING e.id
+            )
+            SELECT r.id,
+                   CASE WHEN u.id IS NOT NULL THEN 'updated'
+                        WHEN e.id IS NOT NULL THEN 'future'
+                        ELSE 'not_found' END
+            FROM requested r
+                LEFT JOIN updated u ON u.id = r.id
+                LEFT JOIN expenses e ON e.id = r.id AND e.user_id = %s
+            """
+        )
+        cursor.execute(query, (list(expense_ids), days, user_id, days, user_id))
+        return dict(cursor.fetchall())
 
+    @db_transaction()
+    def create_recurring_expense(self, cursor, user_id,
+                                 transaction_date, transaction_time,
+                                 amount_usd, description, category_id,
+                                 frequency, ends_on):
+        """
+        Adds a rule whose first occurrence is at the transaction date and
+        time. Returns its id.
+        """
+        starts_on, amount_cents, description, category_id = (
+            expense_values(transaction_date, transaction_time,
+                           amount_usd, description, category_id)
+        )
         query = (
             """
-            INSERT INTO expenses
-            (transaction_datetime, amount_cents_usd, description,
-            user_id, category_id)
+            INSERT INTO recurring_expenses
+            (user_id, amount_cents_usd, description, category_id,
+            frequency, starts_on, ends_on, next_occurrence)
             VALUES
-            (%s, %s, %s, %s, %s)
+            (%s, %s, %s, %s, %s, %s, %s, %s)
             RETURNING id
             """
         )
-        params = (transaction_datetime, amount_cents, description,
-                  user_id, category_id, )
+        params = (user_id, amount_cents, description, category_id,
+                  frequency, starts_on, ends_on or None, starts_on, )
 
         cursor.execute(query, params)
-        result = cursor.fetchone()
-        return result[0] if result else None
+        return cursor.fetchone()[0]
+
+    @db_transaction(DictCursor, read_only=True)
+    def get_recurring_expenses(self, cursor, user_id):
+        query = (
+            """
+            SELECT r.id, r.amount_cents_usd, r.description, r.frequency,
+                   r.starts_on, r.ends_on, r.occurrence_count,
+                   r.next_occurrence, c.name as category_name
+            FROM recurring_expenses r
+            LEFT JOIN categories c ON r.category_id = c.id
+            WHERE r.user_id = %s
+            ORDER BY r.next_occurrence, r.id
+            """
+        )
+        cursor.execute(query, (user_id, ))
+        return cursor.fetchall()
 
     @db_transaction()
-    def update_expense(self, cursor, user_id, expense_id,
-                       transaction_date, transaction_time,
-                        amount_usd, description, category_id):
-        amount_cents = int(float(amount_usd) * 100)
-        if transaction_time:
-            transaction_datetime = datetime.strptime(f'{transaction_date}T{transaction_time}','%Y-%m-%dT%H:%M')
-        else:
-            transaction_datetime = datetime.strptime(f'{transaction_date}','%Y-%m-%d')
-        category_id = int(category_id) if category_id else None
-        description = description if description else None
+    def delete_recurring_expense(self, cursor, user_id, recurring_expense_id):
+        """
+        Stops a rule. Expenses it already created are kept. Returns
+        whether the rule existed.
+        """
         query = (
             """
-            UPDATE expenses
-            SET transaction_datetime = %s,
-                amount_cents_usd = %s,
-                description = %s,
-                category_id = %s
+            DELETE FROM recurring_expenses
             WHERE user_id = %s
                 AND id = %s
             """
         )
-        params = (
-            transaction_datetime, amount_cents,
-            description, category_id,
-            user_id, expense_id,
+        cursor.execute(query, (user_id, recurring_expense_id, ))
+        return cursor.rowcount > 0
+
+    @db_transaction()
+    def materialize_recurring_expenses(self, cursor, now, batch_size,
+                                       max_occurrences, catch_up=True,
+                                       recurring_expense_id=None):
+        """
+        Inserts the occurrences due by `now` of up to `batch_size` rules
+        with one statement and moves the rules past them. With catch_up,
+        every missed occurrence is inserted, at most `max_occurrences`
+        per rule (the rule stays due for the rest); without, only the
+        latest due one is and the missed ones are skipped.
+
+        Occurrences already in expenses are skipped (through the unique
+        expenses_recurring_occurrence_idx, which has user_id added once
+        expenses is hash partitioned), so running this
+        twice inserts nothing new. Runs for all users take an advisory
+        lock and return None without doing anything when another process
+        holds it. Otherwise returns (rules advanced, expenses inserted).
+        """
+        if recurring_expense_id is None:
+            cursor.execute('SELECT pg_try_advisory_xact_lock(%s)',
+                           (RECURRING_LOCK_KEY, ))
+            if not cursor.fetchone()[0]:
+                return None
+
+        cursor.execute(*materialize_recurring_query(now, recurring_expense_id, batch_size,
+                                                    catch_up, max_occurrences))
+        return cursor.fetchone()
+
+    @db_transaction()
+    def partition_expenses(self, cursor, hash_partitions, months_ahead):
+        """
+        Converts expenses to monthly partitions (migration 0010), hash
+        partitioned by user_id too when hash_partitions > 1. Returns the
+        number of monthly partitions.
+        """
+        cursor.execute('SELECT expenses_partition_by_month(%s, %s)',
+                       (hash_partitions, months_ahead))
+        return cursor.fetchone()[0]
+
+    @db_transaction()
+    def create_expense_partitions(self, cursor, months_ahead):
+        """
+        Creates the missing monthly partitions up to months_ahead months
+        from now. Returns how many were created; always 0 while expenses
+        isn't partitioned.
+        """
+        cursor.execute('SELECT expenses_create_partitions(%s)', (months_ahead, ))
+        return cursor.fetchone()[0]
+
+    @db_transaction(DictCursor, read_only=True)
+    def get_grouped_data(self, cursor, user_id, group_option, date_from=None, date_to=None,
+                         by_day=False):
+        built = grouped_data_query(user_id, group_option, date_from, date_to, by_day)
+        if built is None:
+            return None
+
+        cursor.execute(*built)
+        return [dict(row) for row in cursor.fetchall()]
+
+    @db_transaction(DictCursor)
+    def diff_rollups(self, cursor):
+        """
+        Compares expense_daily_rollups with a fresh aggregation of expenses.
+        Returns the mismatching rows; an empty list means they are consistent.
+        """
+        query = """
+                WITH expected AS (
+                    SELECT user_id, transaction_datetime::date as day,
+                           COALESCE(category_id, 0) as category_id,
+                           COUNT(*) as txn_count,
+                           SUM(amount_cents_usd) as total_cents
+                    FROM expenses
+                    GROUP BY 1, 2, 3
+                )
+                SELECT COALESCE(e.user_id, r.user_id) as user_id,
+                       COALESCE(e.day, r.day) as day,
+                       COALESCE(e.category_id, r.category_id) as category_id,
+                       e.txn_count as expected_count,
+                       r.txn_count as rollup_count,
+                       e.total_cents as expected_cents,
+                       r.total_cents as rollup_cents
+                FROM expected e
+                    FULL OUTER JOIN expense_daily_rollups r
+                        ON r.user_id = e.user_id
+                        AND r.day = e.day
+                        AND r.category_id = e.category_id
+                WHERE e.txn_count IS DISTINCT FROM r.txn_count
+                    OR e.total_cents IS DISTINCT FROM r.total_cents
+                ORDER BY 1, 2, 3
+                """
+        cursor.execute(query)
+        return [dict(row) for row in cursor.fetchall()]
+
+    @db_transaction()
+    def rebuild_rollups(self, cursor):
+        # Block concurrent writes so no trigger update lands between
+        # the delete and the re-aggregation
+        cursor.execute('LOCK TABLE expenses IN SHARE MODE')
+        cursor.execute('DELETE FROM expense_daily_rollups')
+        query = """
+                INSERT INTO expense_daily_rollups
+                    (user_id, day, category_id, txn_count, total_cents)
+                SELECT user_id, transaction_datetime::date,
+                       COALESCE(category_id, 0),
+                       COUNT(*), SUM(amount_cents_usd)
+                FROM expenses
+                GROUP BY 1, 2, 3
+                """
+        cursor.execute(query)
+        return cursor.rowcount
+
+    @db_transaction(DictCursor)
+    def diff_monthly_totals(self, cursor):
+        """
+        Compares expense_monthly_totals, which budgets read, with a fresh
+        aggregation of expenses, like diff_rollups.
+        """
+        query = """
+                WITH expected AS (
+                    SELECT user_id, date_trunc('month', transaction_datetime)::date as month,
+                           COALESCE(category_id, 0) as category_id,
+                           COUNT(*) as txn_count,
+                           SUM(amount_cents_usd) as total_cents
+                    FROM expenses
+                    GROUP BY 1, 2, 3
+                )
+                SELECT COALESCE(e.user_id, t.user_id) as user_id,
+                       COALESCE(e.month, t.month) as month,
+                       COALESCE(e.category_id, t.category_id) as category_id,
+                       e.txn_count as expected_count,
+                       t.txn_count as total_count,
+                       e.total_cents as expected_cents,
+                       t.total_cents as total_cents
+                FROM expected e
+                    FULL OUTER JOIN expense_monthly_totals t
+                        ON t.user_id = e.user_id
+                        AND t.month = e.month
+                        AND t.category_id = e.category_id
+                WHERE e.txn_count IS DISTINCT FROM t.txn_count
+                    OR e.total_cents IS DISTINCT FROM t.total_cents
+                ORDER BY 1, 2, 3
+                """
+        cursor.execute(query)
+        return [dict(row) for row in cursor.fetchall()]
+
+    @db_transaction()
+    def rebuild_monthly_totals(self, cursor):
+        cursor.execute('LOCK TABLE expenses IN SHARE MODE')
+        cursor.execute('DELETE FROM expense_monthly_totals')
+        query = """
+                INSERT INTO expense_monthly_totals
+                    (user_id, month, category_id, txn_count, total_cents)
+                SELECT user_id, date_trunc('month', transaction_datetime)::date,
+                       COALESCE(category_id, 0),
+                       COUNT(*), SUM(amount_cents_usd)
+                FROM expenses
+                GROUP BY 1, 2, 3
+                """
+        cursor.execute(query)
+        return cursor.rowcount
+
+    @db_transaction(DictCursor, read_only=True)
+    def get_budgets(self, cursor, user_id, month):
+        """
+        The user's budgets with what was spent in each category in the
+        month starting on `month`, from the monthly totals (migration 0012).
+        """
+        cursor.execute(*budgets_query(user_id, month))
+        return cursor.fetchall()
+
+    @db_transaction()
+    def set_budget(self, cursor, user_id, category_id, amount_cents, alert_percents):
+        query = (
+            """
+            INSERT INTO budgets (user_id, category_id, amount_cents, alert_percents)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (user_id, category_id) DO UPDATE
+                SET amount_cents = EXCLUDED.amount_cents,
+                    alert_percents = EXCLUDED.alert_percents
+            """
         )
-        cursor.execute(query, params)
-        return
+        cursor.execute(query, (user_id, category_id, amount_cents, list(alert_percents), ))
 
     @db_transaction()
-    def delete_expense_by_id(self, cursor, user_id, expense_id):
+    def delete_budget(self, cursor, user_id, category_id):
+        # Returns whether there was a budget. Its alerts go with it.
         query = (
             """
-            DELETE FROM expenses
+            DELETE FROM budgets
             WHERE user_id = %s
-                AND id = %s
+                AND category_id = %s
             """
         )
-        params = (user_id, expense_id, )
-        cursor.execute(query, params)
-        return
+        cursor.execute(query, (user_id, category_id, ))
+        return cursor.rowcount > 0
 
     @db_transaction(DictCursor)
-    def get_grouped_data(self, cursor, user_id, group_option, date_from=None, date_to=None):
-        if group_option.lower() in ('month', 'day', 'week'):
-            query = """
-                    SELECT DATE_TRUNC(%s, transaction_datetime) as group_value,
-                            COUNT(id) as txn_count,
-                            SUM(amount_cents_usd) as total_amount,
-                            ROUND(AVG(amount_cents_usd),2) as avg_amount
-                            FROM expenses
-                            WHERE user_id = %s
-                    """
-
-            params = [group_option.lower(), user_id, ]
-
-            if date_from:
-                    query += '\n AND transaction_datetime >= %s'
-                    date_from = datetime.strptime(date_from, '%Y-%m-%d')
-                    params.append(date_from)
-            if date_to:
-                    date_to = datetime.strptime(date_to + 'T23:59:59', '%Y-%m-%dT%H:%M:%S')
-                    query += '\n AND transaction_datetime <= %s'
-                    params.append(date_to)
-
-            query += '\n GROUP BY 1 ORDER BY 1 ASC'
-
-
-        elif group_option.lower() == 'category':
-            query = """
-                    SELECT c.name as group_value,
-                            COUNT(e.id) as txn_count,
-                            SUM(amount_cents_usd) as total_amount,
-                            ROUND(AVG(amount_cents_usd),2) as avg_amount
-                            FROM expenses e
-                                JOIN categories c ON e.category_id = c.id
-                            WHERE user_id = %s
-                    """
-
-            params = [user_id, ]
-
-            if date_from:
-                    query += '\n AND transaction_datetime >= %s'
-                    date_from = datetime.strptime(date_from, '%Y-%m-%d')
-                    params.append(date_from)
-            if date_to:
-                    date_to = datetime.strptime(date_to + 'T23:59:59', '%Y-%m-%dT%H:%M:%S')
-                    query += '\n AND transaction_datetime <= %s'
-                    params.append(date_to)
-
-            query += '\n GROUP BY c.name ORDER BY 1 ASC'
-
-        if query and params:
-            cursor.execute(query, params)
-            rows = cursor.fetchall()
-
-            results = [dict(row) for row in rows]
-            return results
-        else:
-            return None
+    def pop_budget_alerts(self, cursor, user_id):
+        """
+        Budget alerts raised by the user's writes that weren't shown yet,
+        marked as seen.
+        """
+        cursor.execute(*pop_budget_alerts_query(user_id))
+        return sorted_alerts(cursor.fetchall())
 
     @db_transaction()
     def get_user_id(self, cursor, username):
-        query = """
-                SELECT id
-                FROM users
-                WHERE LOWER(user_name) = %s
-                """
-        params = (username.lower(), )
-        cursor.execute(query, params)
-        result = cursor.fetchone()
-        return result[0] if result else None
+        cursor.execute(*user_id_query(username))
+        return first_column(cursor.fetchone())
+
+    @db_transaction(read_only=True)
+    def get_data_version(self, cursor, user_id):
+        """
+        Counter bumped by every statement that writes the user's expenses
+        (see migration 0006). Pages built from them are cached on it.
+        """
+        cursor.execute(*data_version_query(user_id))
+        return first_column(cursor.fetchone())
+
+    @db_transaction(read_only=True)
+    def writes_overlap(self, cursor, user_id, since_version,
+                       date_from=None, date_to=None):
+        """
+        Whether any write after data version `since_version` touched a day
+        between date_from and date_to (None is unbounded). Also True when
+        expense_write_ranges no longer covers every version since then.
+        """
+        cursor.execute(*writes_overlap_query(user_id, since_version, date_from, date_to))
+        return first_column(cursor.fetchone(), True)
+
+    @db_transaction(read_only=True)
+    def get_expense_columns(self, cursor, user_id):
+        """
+        All of the user's expenses for analytics.ExpenseFrame, packed into
+        one string of "<day> <amount cents> <category id>" triples: days
+        since 1970-01-01 and category 0 for none. A single text value
+        parses far faster than a row tuple per expense.
+        """
+        cursor.execute(*expense_columns_query(user_id))
+        return first_column(cursor.fetchone())
 
     @db_transaction()
     def create_new_user(self, cursor, username, password_hash):
+        cursor.execute(*create_user_query(username, password_hash))
+        return first_column(cursor.fetchone())
+
+    @db_transaction()
+    def update_user_password(self, cursor, user_id, password_hash):
+        cursor.execute(*update_password_query(user_id, password_hash))
+        return
+
+    @db_transaction()
+    def get_session(self, cursor, session_id):
         query = """
-                INSERT INTO users (user_name, user_password)
-                VALUES (%s, %s)
-                RETURNING id
+                SELECT data
+                FROM sessions
+                WHERE id = %s AND expires_at > NOW()
                 """
-        params = (username, password_hash)
-        cursor.execute(query, params)
+        cursor.execute(query, (session_id, ))
         result = cursor.fetchone()
         return result[0] if result else None
 
-    @db_transaction(DictCursor)
-    def get_user_credentials(self, cursor, user_id):
+    @db_transaction()
+    def save_session(self, cursor, session_id, data, lifetime_seconds):
         query = """
-                SELECT user_name, user_password
-                FROM users
-                WHERE id = %s
+                INSERT INTO sessions (id, data, expires_at)
+                VALUES (%s, %s, NOW() + %s * INTERVAL '1 second')
+                ON CONFLICT (id) DO UPDATE
+                SET data = EXCLUDED.data, expires_at = EXCLUDED.expires_at
                 """
-        params = (user_id, )
-        cursor.execute(query, params)
+        cursor.execute(query, (session_id, data, lifetime_seconds))
 
-        result = cursor.fetchone()
-        return result
\ No newline at end of file
+    @db_transaction()
+    def delete_session(self, cursor, session_id):
+        cursor.execute('DELETE FROM sessions WHERE id = %s', (session_id, ))
+
+    @db_transaction()
+    def purge_expired_sessions(self, cursor):
+        cursor.execute('DELETE FROM sessions WHERE expires_at <= NOW()')
+        return cursor.rowcount
@@ -0,0 +1,66 @@
+import csv
+import io
+import json
+from expense_tracker.utils import cents_to_currency
+
+EXPORT_COLUMNS = (
+    'id',
+    'transaction_datetime',
+    'amount_usd',
+    'description',
+    'category',
+    # As entered, before conversion to USD (the same as amount_usd for USD)
+    'currency',
+    'original_amount',
+)
+
+# Rows are written to the response in chunks of about this many bytes,
+# rather than one tiny write per row
+CHUNK_SIZE = 64 * 1024
+
+def export_values(row):
+    (expense_id, transaction_datetime, amount_cents_usd, description, category,
+     currency, amount_cents) = row
+    return (
+        expense_id,
+        transaction_datetime.isoformat(timespec='minutes'),
+        cents_to_currency(amount_cents_usd),
+        description,
+        category,
+        currency,
+        cents_to_currency(amount_cents_usd if amount_cents is None else amount_cents),
+    )
+
+def csv_chunks(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        writer.writerow(export_values(row))
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+def jsonl_chunks(rows):
+    lines = []
+    size = 0
+    for row in rows:
+        line = json.dumps(dict(zip(EXPORT_COLUMNS, export_values(row))))
+        lines.append(line)
+        size += len(line) + 1
+        if size >= CHUNK_SIZE:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+            size = 0
+
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+# format -> (chunk generator, mimetype)
+EXPORT_FORMATS = {
+    'csv': (csv_chunks, 'text/csv'),
+    'jsonl': (jsonl_chunks, 'application/x-ndjson'),
+}
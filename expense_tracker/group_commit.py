@@ -0,0 +1,148 @@
+"""
+Group commit for created expenses (EXPENSES_GROUP_COMMIT). Request
+threads queue their expense and wait on a future; one writer thread
+inserts whatever has queued up with a single multi-row INSERT and
+commit, so a burst of creates (offline queues syncing) pays for one
+commit per batch instead of one per expense.
+
+If a batch fails, its expenses are retried one per transaction, so
+each request gets its own id or its own error.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import psycopg2
+from expense_tracker import config
+from expense_tracker.db_storage import (
+    ExpensesDatabaseStorage,
+    currency_values,
+    expense_values,
+)
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class GroupCommitWriter:
+    def __init__(self, batch_size, max_wait, storage_factory=ExpensesDatabaseStorage):
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.storage_factory = storage_factory
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._batches = 0
+        self._expenses = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True,
+                                                name='group-commit')
+                self._thread.start()
+
+    def stop(self):
+        # Expenses queued before stop() are still committed
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(_STOP)
+                self._thread.join()
+                self._thread = None
+
+    def submit(self, user_id, transaction_date, transaction_time,
+               amount_usd, description, category_id, currency='USD'):
+        """
+        Queues an expense (validated form values, as create_new_expense
+        takes them) and returns a future for its id. Values that don't
+        convert raise here, in the caller's thread.
+        """
+        transaction_datetime, amount_cents, description, category_id = (
+            expense_values(transaction_date, transaction_time,
+                           amount_usd, description, category_id)
+        )
+        future = Future()
+        self.start()
+        self._queue.put(((transaction_datetime, amount_cents, description, user_id,
+                          category_id, *currency_values(currency, amount_cents)), future))
+        return future
+
+    def create_new_expense(self, user_id, **expense_data):
+        # Drop-in for ExpensesDatabaseStorage.create_new_expense
+        return self.submit(user_id, **expense_data).result()
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'batches_total': self._batches,
+            'expenses_total': self._expenses,
+        }
+
+    def _next_batch(self):
+        item = self._queue.get()
+        if item is _STOP:
+            return None
+
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            try:
+                item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # Commit this batch, then stop
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                storage = self.storage_factory()
+            except Exception as error:
+                logger.exception('Group commit writer has no database')
+                for _, future in batch:
+                    future.set_exception(error)
+                continue
+            try:
+                self._commit(storage, batch)
+            finally:
+                # Only hold a pooled connection while writing
+                storage.close_connection()
+
+    def _commit(self, storage, batch):
+        rows = [row for row, _ in batch]
+        try:
+            ids = storage.create_new_expenses(rows)
+        except (psycopg2.IntegrityError, psycopg2.DataError):
+            # One bad row (a category deleted meanwhile) fails the whole
+            # INSERT: find it by inserting the rows one by one
+            logger.info('Group commit of %d expenses failed, retrying one by one',
+                        len(batch), exc_info=True)
+            for row, future in batch:
+                try:
+                    future.set_result(storage.create_new_expenses([row])[0])
+                except Exception as error:
+                    future.set_exception(error)
+            return
+        except Exception as error:
+            logger.exception('Group commit of %d expenses failed', len(batch))
+            for _, future in batch:
+                future.set_exception(error)
+            return
+
+        self._batches += 1
+        self._expenses += len(batch)
+        for (_, future), expense_id in zip(batch, ids):
+            future.set_result(expense_id)
+
+
+writer = GroupCommitWriter(batch_size=config.GROUP_COMMIT_BATCH_SIZE,
+                           max_wait=config.GROUP_COMMIT_MAX_WAIT_MS / 1000)
@@ -0,0 +1,117 @@
+import csv
+import io
+import re
+from datetime import datetime
+
+# Accepted CSV header names for each expense attribute
+CSV_COLUMNS = {
+    'transaction_date': ('date', 'transaction_date'),
+    'transaction_time': ('time', 'transaction_time'),
+    'amount_usd': ('amount', 'amount_usd'),
+    'description': ('description', 'name', 'memo'),
+    'category': ('category', 'category_id'),
+}
+
+OFX_TAG_PATTERN = re.compile(r'<(/?)([A-Z0-9.]+)>([^<\r\n]*)')
+
+def text_stream(binary_stream):
+    return io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
+
+def category_id_for(category, category_ids_by_name):
+    """
+    Maps a category given as an id or a (case-insensitive) name to its id.
+    Unknown names are returned as is, so validation reports them.
+    """
+    if not category or category.isdigit():
+        return category
+
+    return category_ids_by_name.get(category.lower(), category)
+
+def parse_csv(stream, categories_by_id):
+    """
+    Yields (line_number, expense_data) for each CSV row. expense_data has
+    the same shape as utils.extract_expense_data so it can be validated
+    with utils.expense_data_errors.
+    """
+    reader = csv.DictReader(stream)
+    category_ids_by_name = {
+        name.lower(): str(category_id)
+        for category_id, name in categories_by_id.items()
+    }
+    header = {name.strip().lower(): name for name in reader.fieldnames or []}
+
+    columns = {}
+    for attribute, names in CSV_COLUMNS.items():
+        columns[attribute] = next(
+            (header[name] for name in names if name in header), None
+        )
+
+    for row in reader:
+        expense_data = {
+            attribute: (row.get(column) or '').strip() if column else ''
+            for attribute, column in columns.items()
+        }
+        expense_data['category_id'] = category_id_for(
+            expense_data.pop('category'), category_ids_by_name
+        )
+        yield reader.line_num, expense_data
+
+def parse_ofx_datetime(value):
+    # OFX dates look like 20240131, 20240131120000 or 20240131120000.000[-5:EST]
+    digits = value[:14]
+    if len(digits) >= 12:
+        parsed = datetime.strptime(digits[:12], '%Y%m%d%H%M')
+        return parsed.strftime('%Y-%m-%d'), parsed.strftime('%H:%M')
+
+    return datetime.strptime(digits[:8], '%Y%m%d').strftime('%Y-%m-%d'), ''
+
+def ofx_expense_data(transaction):
+    try:
+        transaction_date, transaction_time = parse_ofx_datetime(
+            transaction.get('DTPOSTED', '')
+        )
+    except ValueError:
+        transaction_date, transaction_time = transaction.get('DTPOSTED', ''), ''
+
+    # Debits are negative in OFX, expenses are stored as positive amounts.
+    # Credits keep their sign and are rejected by validation.
+    amount = transaction.get('TRNAMT', '')
+    amount = amount[1:] if amount.startswith('-') else f'-{amount}' if amount else ''
+
+    return {
+        'transaction_date': transaction_date,
+        'transaction_time': transaction_time,
+        'amount_usd': amount,
+        'description': transaction.get('NAME') or transaction.get('MEMO', ''),
+        'category_id': '',
+    }
+
+def parse_ofx(stream, categories_by_id=None):
+    """
+    Yields (line_number, expense_data) for each <STMTTRN> block,
+    reading the file line by line. Handles both SGML (OFX 1.x, unclosed
+    tags) and XML (OFX 2.x) files.
+    """
+    transaction = None
+    start_line = 0
+    for line_number, line in enumerate(stream, start=1):
+        for closing, tag, value in OFX_TAG_PATTERN.findall(line):
+            if tag == 'STMTTRN':
+                if closing and transaction is not None:
+                    yield start_line, ofx_expense_data(transaction)
+                    transaction = None
+                elif not closing:
+                    transaction = {}
+                    start_line = line_number
+            elif transaction is not None and not closing and value.strip():
+                transaction[tag] = value.strip()
+
+PARSERS = {
+    'csv': parse_csv,
+    'ofx': parse_ofx,
+    'qfx': parse_ofx,
+}
+
+def parser_for(filename):
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    return PARSERS.get(extension)
@@ -0,0 +1,119 @@
+import bisect
+import logging
+import re
+import threading
+from expense_tracker import config
+
+slow_query_logger = logging.getLogger('expense_tracker.slow_queries')
+
+# Bucket upper bounds in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    """Prometheus-style histogram with one series per label value."""
+    def __init__(self, name, help_text, label, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # label value -> [bucket counts..., sum, count]
+        self._series = {}
+
+    def observe(self, label_value, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.help_text}',
+            f'# TYPE {self.name} histogram',
+        ]
+        with self._lock:
+            series = {label: list(values) for label, values in self._series.items()}
+
+        for label_value, values in sorted(series.items()):
+            label = f'{self.label}="{label_value}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {values[-1]}')
+            lines.append(f'{self.name}_sum{{{label}}} {values[-2]}')
+            lines.append(f'{self.name}_count{{{label}}} {values[-1]}')
+
+        return lines
+
+
+request_duration = Histogram(
+    'expenses_request_duration_seconds',
+    'Time to handle a request, by route',
+    'route',
+)
+request_db_duration = Histogram(
+    'expenses_request_db_duration_seconds',
+    'Time a request spent in storage calls, by route',
+    'route',
+)
+storage_call_duration = Histogram(
+    'expenses_storage_call_duration_seconds',
+    'Time spent in ExpensesDatabaseStorage methods, by method',
+    'method',
+)
+storage_call_rows = Histogram(
+    'expenses_storage_call_rows',
+    'Rows returned or affected by ExpensesDatabaseStorage methods, by method',
+    'method',
+    buckets=(0, 1, 10, 100, 1000, 10000, 100000),
+)
+
+HISTOGRAMS = (
+    request_duration,
+    request_db_duration,
+    storage_call_duration,
+    storage_call_rows,
+)
+
+STRING_LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'")
+NUMBER_PATTERN = re.compile(r'\b\d+(?:\.\d+)?\b')
+IN_LIST_PATTERN = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+def fingerprint(statement):
+    """
+    Normalizes a SQL statement so that runs of the same query with
+    different parameters look the same: literals become ? and
+    whitespace is collapsed.
+    """
+    if isinstance(statement, bytes):
+        statement = statement.decode('utf-8', 'replace')
+    statement = STRING_LITERAL_PATTERN.sub('?', statement)
+    statement = NUMBER_PATTERN.sub('?', statement)
+    statement = IN_LIST_PATTERN.sub('(?...)', statement)
+    return WHITESPACE_PATTERN.sub(' ', statement).strip()
+
+def record_storage_call(method, seconds, rows, statement):
+    storage_call_duration.observe(method, seconds)
+    if rows is not None and rows >= 0:
+        storage_call_rows.observe(method, rows)
+
+    threshold = config.SLOW_QUERY_MS
+    if threshold and seconds * 1000 >= threshold and statement:
+        slow_query_logger.warning(
+            'slow query: %s took %.1fms (%s rows): %s',
+            method, seconds * 1000, rows, fingerprint(statement)
+        )
+
+def render_histograms():
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    return lines
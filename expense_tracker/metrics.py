@@ -0,0 +1,82 @@
+from expense_tracker.connection_pool import all_pools
+from expense_tracker.instrumentation import render_histograms
+from expense_tracker.sessions import session_store
+from expense_tracker.page_cache import page_cache
+from expense_tracker.analytics_cache import analytics_cache
+from expense_tracker.group_commit import writer
+
+# Prometheus text exposition format
+# https://prometheus.io/docs/instrumenting/exposition_formats/
+POOL_METRICS = (
+    ('size', 'gauge', 'Open connections in the pool'),
+    ('max_size', 'gauge', 'Maximum number of connections in the pool'),
+    ('in_use', 'gauge', 'Connections currently checked out'),
+    ('idle', 'gauge', 'Connections waiting in the pool'),
+    ('waiting', 'gauge', 'Requests waiting for a free connection'),
+    ('checkouts_total', 'counter', 'Connections handed out'),
+    ('timeouts_total', 'counter', 'Checkouts that gave up waiting'),
+    ('discarded_total', 'counter', 'Broken or stale connections closed'),
+    ('checkout_seconds_total', 'counter', 'Time spent checking out connections'),
+    ('checkout_seconds_max', 'gauge', 'Slowest checkout so far'),
+)
+
+def render_pool_metrics():
+    pools = all_pools()
+    lines = []
+    for name, metric_type, help_text in POOL_METRICS:
+        metric = f'expenses_db_pool_{name}'
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} {metric_type}')
+        for db_name, pool in pools.items():
+            value = pool.stats()[name]
+            lines.append(f'{metric}{{database="{db_name}"}} {value}')
+
+    return lines
+
+SESSION_CACHE_METRICS = (
+    ('size', 'gauge', 'Sessions held in the local cache'),
+    ('hits_total', 'counter', 'Sessions served from the local cache'),
+    ('misses_total', 'counter', 'Sessions read from the session store'),
+)
+
+PAGE_CACHE_METRICS = (
+    ('entries', 'gauge', 'Rendered pages held in the page cache'),
+    ('bytes', 'gauge', 'Size of the rendered pages in the page cache'),
+    ('hits_total', 'counter', 'Pages served from the page cache'),
+    ('misses_total', 'counter', 'Pages rendered because they were not cached'),
+)
+
+ANALYTICS_CACHE_METRICS = (
+    ('entries', 'gauge', 'Grouped analytics results held in the cache'),
+    ('rows', 'gauge', 'Rows of the cached analytics results'),
+    ('hits_total', 'counter', 'Analytics results served from the cache'),
+    ('misses_total', 'counter', 'Analytics results computed by the database'),
+)
+
+GROUP_COMMIT_METRICS = (
+    ('queued', 'gauge', 'Created expenses waiting for the group commit writer'),
+    ('batches_total', 'counter', 'Batches of expenses committed together'),
+    ('expenses_total', 'counter', 'Expenses committed in those batches'),
+)
+
+def render_stats(prefix, metric_definitions, stats):
+    lines = []
+    for name, metric_type, help_text in metric_definitions:
+        metric = f'{prefix}_{name}'
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} {metric_type}')
+        lines.append(f'{metric} {stats[name]}')
+
+    return lines
+
+def render_metrics():
+    lines = (
+        render_pool_metrics()
+        + render_stats('expenses_session_cache', SESSION_CACHE_METRICS, session_store.stats())
+        + render_stats('expenses_page_cache', PAGE_CACHE_METRICS, page_cache.stats())
+        + render_stats('expenses_analytics_cache', ANALYTICS_CACHE_METRICS,
+                       analytics_cache.stats())
+        + render_stats('expenses_group_commit', GROUP_COMMIT_METRICS, writer.stats())
+        + render_histograms()
+    )
+    return '\n'.join(lines) + '\n'
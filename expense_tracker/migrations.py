@@ -0,0 +1,167 @@
+import json
+import re
+from datetime import datetime
+from pathlib import Path
+from expense_tracker import config
+from expense_tracker.db_storage import (expenses_page_query, grouped_data_query,
+                                        materialize_recurring_query, user_id_query)
+
+MIGRATIONS_DIR = Path(__file__).parent / 'data' / 'migrations'
+MIGRATION_FILE_PATTERN = re.compile(r'^(\d{4})_(\w+)\.sql$')
+
+# Arbitrary key so that several processes starting at once
+# don't apply the same migration twice
+MIGRATIONS_LOCK_KEY = 7281001
+
+def available_migrations():
+    migrations = []
+    for path in MIGRATIONS_DIR.iterdir():
+        match = MIGRATION_FILE_PATTERN.match(path.name)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), path))
+
+    return sorted(migrations)
+
+def applied_versions(cursor):
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations(
+            version INT PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at timestamp NOT NULL DEFAULT NOW()
+        )
+        """
+    )
+    cursor.execute('SELECT version FROM schema_migrations')
+    return {row[0] for row in cursor.fetchall()}
+
+def apply_migrations(connection):
+    """
+    Applies the pending migrations in version order, all in one transaction.
+    Returns the names of the migrations that were applied.
+    """
+    applied = []
+    with connection:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', (MIGRATIONS_LOCK_KEY, ))
+            done = applied_versions(cursor)
+
+            for version, name, path in available_migrations():
+                if version in done:
+                    continue
+
+                cursor.execute(path.read_text())
+                cursor.execute(
+                    """
+                    INSERT INTO schema_migrations (version, name)
+                    VALUES (%s, %s)
+                    """,
+                    (version, name, )
+                )
+                applied.append(f'{version:04d}_{name}')
+
+    return applied
+
+
+# Queries issued by ExpensesDatabaseStorage on the hot paths, with the
+# index each of them is expected to use. They come from the same
+# builders as the storage methods, so the check covers the real SQL.
+INDEX_CHECKS = (
+    (
+        'get_user_expenses_page',
+        *expenses_page_query(1, config.EXPENSES_PAGE_SIZE),
+        'expenses_user_id_transaction_datetime_idx',
+    ),
+    (
+        'get_user_expenses_page after a cursor',
+        *expenses_page_query(1, config.EXPENSES_PAGE_SIZE, after=(datetime(2024, 1, 1), 1)),
+        'expenses_user_id_transaction_datetime_idx',
+    ),
+    (
+        # The full-text index only wins for rare words on a large table
+        # (see benchmarks/bench_search.py); the user's index bounds the
+        # scan in every case
+        'search_expenses',
+        *expenses_page_query(1, config.EXPENSES_PAGE_SIZE, text='coffee'),
+        'expenses_user_id_transaction_datetime_idx',
+    ),
+    (
+        'get_grouped_data',
+        *grouped_data_query(1, 'month', date_from='2024-01-01'),
+        'expense_daily_rollups_pkey',
+    ),
+    (
+        'get_user_id',
+        *user_id_query('admin'),
+        'users_lower_user_name_idx',
+    ),
+    (
+        'materialize_recurring_expenses',
+        *materialize_recurring_query(datetime(2024, 1, 1), None, config.RECURRING_BATCH_SIZE,
+                                     True, config.RECURRING_MAX_OCCURRENCES),
+        'recurring_expenses_next_occurrence_idx',
+    ),
+    (
+        # The lookup PostgreSQL itself runs when a category is deleted
+        'categories ON DELETE RESTRICT check',
+        """
+        SELECT 1
+        FROM expenses
+        WHERE category_id = %s
+        """,
+        (1, ),
+        'expenses_category_id_idx',
+    ),
+)
+
+def plan_index_names(plan):
+    names = set()
+    if 'Index Name' in plan:
+        names.add(plan['Index Name'])
+    for subplan in plan.get('Plans', []):
+        names |= plan_index_names(subplan)
+
+    return names
+
+def with_parent_indexes(cursor, names):
+    # On a partitioned table plans use the partitions' own indexes,
+    # which are children of the index created on the table
+    cursor.execute(
+        """
+        WITH RECURSIVE indexes(oid, name) AS (
+            SELECT oid, relname
+            FROM pg_class
+            WHERE relname = ANY(%s)
+            UNION
+            SELECT p.oid, p.relname
+            FROM indexes i
+            JOIN pg_inherits h ON h.inhrelid = i.oid
+            JOIN pg_class p ON p.oid = h.inhparent
+        )
+        SELECT name FROM indexes
+        """,
+        (sorted(names), )
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+def check_index_usage(connection):
+    """
+    EXPLAINs every query in INDEX_CHECKS and returns (name, expected index,
+    used indexes, ok) tuples. Sequential scans are disabled for the check,
+    so small development tables still report whether the index is usable.
+    A partition's index counts as the index it was created from.
+    """
+    results = []
+    with connection:
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            for name, query, params, expected_index in INDEX_CHECKS:
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + query, params)
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                used = plan_index_names(plan[0]['Plan'])
+                ok = expected_index in with_parent_indexes(cursor, used)
+                results.append((name, expected_index, used, ok))
+
+    return results
@@ -0,0 +1,95 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from expense_tracker import config
+
+TEMPLATES_DIR = Path(__file__).parent.parent / 'templates'
+
+def templates_fingerprint(directory=TEMPLATES_DIR):
+    # Part of every ETag, so a deploy with changed templates
+    # doesn't answer 304 for pages rendered by the old ones
+    digest = hashlib.sha1()
+    for path in sorted(directory.glob('*.html')):
+        digest.update(path.name.encode('utf-8'))
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:12]
+
+TEMPLATES_FINGERPRINT = templates_fingerprint()
+
+
+def page_key(user_id, data_version, path, args):
+    """
+    Identifies one rendering of a page: a user's page only changes when
+    their data version does. Query args are sorted so that equivalent
+    URLs share an entry.
+    """
+    return (user_id, data_version, path, tuple(sorted(args.items(multi=True))))
+
+def page_etag(key):
+    digest = hashlib.sha1(repr(key).encode('utf-8'))
+    digest.update(TEMPLATES_FINGERPRINT.encode('utf-8'))
+    return digest.hexdigest()
+
+def add_cache_headers(response, etag):
+    # Browsers keep the page but check back with its ETag every time
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+class PageCache:
+    """
+    Rendered pages by page_key, least recently used first out once they
+    take more than `max_bytes`. Entries for old data versions are never
+    read again and age out.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._pages.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+
+            self._pages.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def set(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._pages.pop(key, None)
+            if previous is not None:
+                self.size_bytes -= len(previous)
+            self._pages[key] = body
+            self.size_bytes += len(body)
+            while self.size_bytes > self.max_bytes:
+                _, evicted = self._pages.popitem(last=False)
+                self.size_bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._pages.clear()
+            self.size_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._pages),
+                'bytes': self.size_bytes,
+                'hits_total': self.hits,
+                'misses_total': self.misses,
+            }
+
+
+page_cache = PageCache(max_bytes=config.PAGE_CACHE_MAX_BYTES)
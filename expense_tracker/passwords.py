@@ -0,0 +1,97 @@
+import asyncio
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import bcrypt
+from expense_tracker import config
+
+
+class HashingBusy(Exception):
+    """Raised when too many hashing jobs are already queued."""
+    pass
+
+
+# Module-level so they can be sent to the worker processes
+def _hash_password(password, rounds):
+    salt = bcrypt.gensalt(rounds=rounds)
+    return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+
+def _check_password(password, password_hash):
+    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a bounded process pool so hashing doesn't hold the GIL
+    in the web workers. At most `max_pending` jobs may be queued or running;
+    further calls raise HashingBusy instead of waiting without bound.
+    With `pool_size` 0 hashing runs inline (handy in tests).
+    """
+    def __init__(self, rounds, pool_size, max_pending):
+        self.rounds = rounds
+        self.pool_size = pool_size
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self):
+        # Created on first use so that forking servers start
+        # the pool in each worker rather than in the parent
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.pool_size)
+            return self._executor
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy('Too many password checks in progress')
+
+        try:
+            if self.pool_size == 0:
+                return func(*args)
+            return self._get_executor().submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+    async def _run_async(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy('Too many password checks in progress')
+
+        try:
+            if self.pool_size == 0:
+                return func(*args)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(_hash_password, password, self.rounds)
+
+    def check(self, password, password_hash):
+        return self._run(_check_password, password, password_hash)
+
+    async def hash_async(self, password):
+        return await self._run_async(_hash_password, password, self.rounds)
+
+    async def check_async(self, password, password_hash):
+        return await self._run_async(_check_password, password, password_hash)
+
+    def needs_rehash(self, password_hash):
+        # bcrypt hashes look like $2b$12$<salt and hash>
+        try:
+            return int(password_hash.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def shutdown(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+password_hasher = PasswordHasher(
+    rounds=config.BCRYPT_ROUNDS,
+    pool_size=config.HASH_POOL_SIZE,
+    max_pending=config.HASH_MAX_PENDING,
+)
@@ -0,0 +1,89 @@
+"""
+Recurring expenses: rules in the recurring_expenses table (migration
+0009) whose due occurrences are added to expenses by
+materialize_due(), from the scheduler thread or `flask
+materialize-recurring`.
+
+Each storage call handles a batch of rules in one INSERT ... SELECT, so
+a scheduler that was down for a year adds the missed months of every
+rule in a few statements rather than one per month per user.
+"""
+import logging
+import threading
+from datetime import datetime
+from expense_tracker import config
+from expense_tracker.db_storage import ExpensesDatabaseStorage
+
+FREQUENCIES = ('daily', 'weekly', 'monthly', 'yearly')
+
+logger = logging.getLogger(__name__)
+
+def materialize_due(storage, now=None, catch_up=None, recurring_expense_id=None):
+    """
+    Adds every occurrence due by `now` (default: current time), batch
+    after batch until no rule is due. Returns (rules advanced, expenses
+    inserted), or None if another process was already doing this.
+    """
+    now = now or datetime.now()
+    if catch_up is None:
+        catch_up = config.RECURRING_CATCH_UP
+
+    rules = expenses = 0
+    while True:
+        result = storage.materialize_recurring_expenses(
+            now, config.RECURRING_BATCH_SIZE, config.RECURRING_MAX_OCCURRENCES,
+            catch_up, recurring_expense_id,
+        )
+        if result is None:
+            return (rules, expenses) if rules else None
+
+        advanced, inserted = result
+        if not advanced:
+            return rules, expenses
+        rules += advanced
+        expenses += inserted
+
+
+class RecurringScheduler:
+    """
+    Runs materialize_due every `interval` seconds on a daemon thread.
+    It first creates any missing monthly expenses partitions, which the
+    occurrences it inserts may need.
+    """
+    def __init__(self, interval):
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True,
+                                            name='recurring-expenses')
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self.run_once()
+            self._stopped.wait(self.interval)
+
+    def run_once(self):
+        storage = ExpensesDatabaseStorage()
+        try:
+            storage.create_expense_partitions(config.PARTITION_MONTHS_AHEAD)
+            return materialize_due(storage)
+        except Exception:
+            # The next run retries; rules only advance with their inserts
+            logger.exception('Materializing recurring expenses failed')
+            return None
+        finally:
+            storage.close_connection()
+
+
+scheduler = RecurringScheduler(interval=config.RECURRING_INTERVAL)
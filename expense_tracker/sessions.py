@@ -0,0 +1,290 @@
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from flask import g, has_app_context
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from itsdangerous import BadSignature, Signer
+from werkzeug.datastructures import CallbackDict
+from expense_tracker import config
+from expense_tracker.db_storage import ExpensesDatabaseStorage
+
+# redis is only needed for the 'redis' session backend
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+def new_session_id():
+    return secrets.token_urlsafe(32)
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    """
+    Session data kept in a session store. The cookie only carries the
+    signed session id and `version`, a token that changes on every save.
+    """
+    def __init__(self, initial=None, sid=None, version=None):
+        def on_update(session):
+            session.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.version = version
+        self.previous_sid = None
+        self.modified = False
+
+    def regenerate(self):
+        # Called on sign-in so a session id planted before it is worthless
+        if self.previous_sid is None:
+            self.previous_sid = self.sid
+        self.sid = new_session_id()
+        self.modified = True
+
+
+class MemorySessionStore:
+    """
+    Sessions in a dict. Only shared by the threads of one process, so it
+    suits development, tests and single-worker deployments.
+    """
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            data, expires_at = self._sessions.get(sid, (None, 0))
+            if data is not None and expires_at < time.time():
+                del self._sessions[sid]
+                return None
+            return data
+
+    def set(self, sid, data, lifetime):
+        with self._lock:
+            self._sessions[sid] = (data, time.time() + lifetime)
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+
+class PostgresSessionStore:
+    """
+    Sessions in the sessions table, shared by every worker. Saves at the
+    end of a Flask request go through the request's storage (g.storage),
+    so a request never holds two pooled connections.
+    """
+    def _run(self, method_name, *args):
+        storage = g.get('storage') if has_app_context() else None
+        if isinstance(storage, ExpensesDatabaseStorage):
+            return getattr(storage, method_name)(*args)
+
+        storage = ExpensesDatabaseStorage()
+        try:
+            return getattr(storage, method_name)(*args)
+        finally:
+            storage.close_connection()
+
+    def get(self, sid):
+        return self._run('get_session', sid)
+
+    def set(self, sid, data, lifetime):
+        self._run('save_session', sid, data, lifetime)
+
+    def delete(self, sid):
+        self._run('delete_session', sid)
+
+
+class RedisSessionStore:
+    """Sessions in Redis or any server speaking its protocol."""
+    key_prefix = 'expenses:session:'
+
+    def __init__(self, url):
+        if redis is None:
+            raise RuntimeError("The 'redis' session backend needs redis: pip install redis")
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, sid):
+        data = self.client.get(self.key_prefix + sid)
+        return data.decode('utf-8') if data is not None else None
+
+    def set(self, sid, data, lifetime):
+        self.client.set(self.key_prefix + sid, data, ex=max(1, int(lifetime)))
+
+    def delete(self, sid):
+        self.client.delete(self.key_prefix + sid)
+
+
+class CachedSessionStore:
+    """
+    Process-local LRU cache of up to `max_size` sessions in front of a
+    shared store. A cached session is only used while its version matches
+    the one in the request's cookie, so a save made by another worker is
+    never hidden by a stale copy. Entries older than `ttl` seconds are
+    re-read, which bounds how long a session deleted directly from the
+    shared store keeps working in this process.
+    """
+    def __init__(self, store, max_size, ttl):
+        self.store = store
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def cached(self, sid, version):
+        with self._lock:
+            entry = self._entries.get(sid)
+            if entry is not None:
+                cached_version, data, cached_at = entry
+                if cached_version == version and time.monotonic() - cached_at <= self.ttl:
+                    self._entries.move_to_end(sid)
+                    self.hits += 1
+                    return data
+                del self._entries[sid]
+
+            self.misses += 1
+            return None
+
+    def _remember(self, sid, version, data):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[sid] = (version, data, time.monotonic())
+            self._entries.move_to_end(sid)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def load(self, sid, version):
+        # Reads through to the shared store, skipping the cache
+        data = self.store.get(sid)
+        if data is not None:
+            self._remember(sid, version, data)
+        return data
+
+    def get(self, sid, version):
+        data = self.cached(sid, version)
+        if data is None:
+            data = self.load(sid, version)
+        return data
+
+    def set(self, sid, version, data, lifetime):
+        self.store.set(sid, data, lifetime)
+        self._remember(sid, version, data)
+
+    def delete(self, sid):
+        with self._lock:
+            self._entries.pop(sid, None)
+        self.store.delete(sid)
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        return {'size': size, 'hits_total': self.hits, 'misses_total': self.misses}
+
+
+class ServerSideSessionMixin:
+    """
+    Session handling shared by the Flask app and the ASGI app (asgi.py),
+    so both read and write the same sessions.
+    """
+    salt = 'expense-tracker-session'
+    serializer = session_json_serializer
+
+    def __init__(self, store):
+        self.store = store
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt=self.salt)
+
+    def _session_key(self, app, request):
+        # (session id, version) from a validly signed cookie, else (None, None)
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                value = self._signer(app).unsign(cookie).decode('utf-8')
+            except BadSignature:
+                return None, None
+            sid, _, version = value.partition('.')
+            return sid, version
+
+        return None, None
+
+    def _make_session(self, sid, version, data):
+        if data is None:
+            # Unknown or expired ids are never reused
+            return ServerSideSession(sid=new_session_id())
+        return ServerSideSession(self.serializer.loads(data), sid, version)
+
+    def _save(self, app, session):
+        """
+        Writes a modified session to the store. Returns the new cookie
+        value, '' if the cookie should be deleted, or None to leave it.
+        """
+        if session.previous_sid:
+            self.store.delete(session.previous_sid)
+            session.previous_sid = None
+
+        if not session:
+            if session.modified and session.version:
+                self.store.delete(session.sid)
+                return ''
+            return None
+
+        if session.modified:
+            session.version = secrets.token_hex(4)
+            lifetime = app.permanent_session_lifetime.total_seconds()
+            self.store.set(session.sid, session.version,
+                           self.serializer.dumps(dict(session)), lifetime)
+        elif not self.should_set_cookie(app, session):
+            return None
+
+        return self._signer(app).sign(f'{session.sid}.{session.version}').decode('utf-8')
+
+    def _write_cookie(self, app, session, response, cookie_value):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+
+        if cookie_value == '':
+            response.delete_cookie(name, domain=domain, path=path, secure=secure,
+                                   samesite=samesite, httponly=httponly)
+        elif cookie_value:
+            response.set_cookie(name, cookie_value,
+                                expires=self.get_expiration_time(app, session),
+                                domain=domain, path=path, secure=secure,
+                                samesite=samesite, httponly=httponly)
+        response.vary.add('Cookie')
+
+
+class ServerSideSessionInterface(ServerSideSessionMixin, SessionInterface):
+    def open_session(self, app, request):
+        sid, version = self._session_key(app, request)
+        data = self.store.get(sid, version) if sid else None
+        return self._make_session(sid, version, data)
+
+    def save_session(self, app, session, response):
+        cookie_value = self._save(app, session)
+        self._write_cookie(app, session, response, cookie_value)
+
+
+def create_session_store():
+    if config.SESSION_BACKEND == 'postgres':
+        store = PostgresSessionStore()
+    elif config.SESSION_BACKEND == 'redis':
+        store = RedisSessionStore(config.SESSION_REDIS_URL)
+    elif config.SESSION_BACKEND == 'memory':
+        store = MemorySessionStore()
+    else:
+        raise ValueError(f'Unknown session backend: {config.SESSION_BACKEND}')
+
+    return CachedSessionStore(store, max_size=config.SESSION_CACHE_SIZE,
+                              ttl=config.SESSION_CACHE_TTL)
+
+
+session_store = create_session_store()
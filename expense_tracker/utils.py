@@ -1,9 +1,15 @@
 
-from datetime import datetime
+import asyncio
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
 from expense_tracker.db_storage import ExpensesDatabaseStorage
+from expense_tracker.categories import category_registry
+from expense_tracker.currencies import exchange_rates
 from flask import g
 import re
-import bcrypt
+from expense_tracker.passwords import HashingBusy, password_hasher
+from expense_tracker import config
+from expense_tracker.recurring import FREQUENCIES
 
 def extract_expense_data(form_data):
     # Define a list of attribute names
@@ -21,7 +27,7 @@ def extract_expense_data(form_data):
     return expense_data
 
 
-def errors_for_transaction_datetime(transaction_date, transaction_time):
+def errors_for_transaction_datetime(transaction_date, transaction_time, allow_future=False):
     """
     Rules:
     1. Attributes come in string format.
@@ -42,23 +48,33 @@ def errors_for_transaction_datetime(transaction_date, transaction_time):
         except ValueError:
             return ['Wrong format for Transaction Date']
 
-    if transaction_datetime > datetime.now():
+    if not allow_future and transaction_datetime > datetime.now():
         return ['Transaction Date / Time cannot be in the future']
 
     return []
 
+# Amounts are stored in INT cents columns
+MAX_AMOUNT_CENTS = 2 ** 31 - 1
+MAX_AMOUNT = Decimal(MAX_AMOUNT_CENTS) / 100
+
 def errors_for_transaction_amount(amount_str):
     if not amount_str:
         return ['Transaction Amount is mandatory']
 
     try:
-        amount = float(amount_str)
-    except ValueError:
+        amount = Decimal(amount_str)
+    except InvalidOperation:
+        return ['Transaction Amount must be a number']
+
+    if not amount.is_finite():
         return ['Transaction Amount must be a number']
 
     if amount < 0:
         return ['Transaction Amount must be positive']
 
+    if amount > MAX_AMOUNT:
+        return [f'Transaction Amount must be at most {MAX_AMOUNT}']
+
     return []
 
 def errors_for_expense_description(description):
@@ -73,27 +89,55 @@ def errors_for_expense_description(description):
 
     return []
 
-def errors_for_expense_category(category_id_str):
+def errors_for_expense_category(category_id_str, category_ids=None):
     if category_id_str:
         try:
             category_id = int(category_id_str)
         except ValueError:
             return ['Category value is not supported. Make sure you selected a value from the list']
 
-        categories = [cat['id'] for cat in g.storage.get_categories()]
-        if category_id not in categories:
+        if category_ids is None:
+            category_ids = category_registry.ids(g.storage)
+        if category_id not in category_ids:
             return ['Category value is not supported. Make sure you selected a value from the list']
 
     return []
 
-def expense_data_errors(expense_data):
+def extract_currency(form_data):
+    return form_data.get('currency', '').strip().upper() or 'USD'
+
+def errors_for_currency(currency, currencies):
+    if currency not in currencies:
+        return ['Currency is not supported. Make sure you selected a value from the list']
+    return []
+
+def errors_for_converted_amount(expense_data, currency):
+    # The expenses_convert_to_usd trigger stores the USD amount in the
+    # INT amount_cents_usd column, so it's capped like entered amounts.
+    # Uses the rates as last loaded; call once the rest is valid.
+    if currency == 'USD':
+        return []
+
+    amount_cents = amount_to_cents(expense_data['amount_usd'])
+    day = datetime.strptime(expense_data['transaction_date'], '%Y-%m-%d').date()
+    if round(amount_cents / exchange_rates.rate(currency, day.toordinal())) > MAX_AMOUNT_CENTS:
+        return [f'Transaction Amount must be at most {MAX_AMOUNT} USD once converted']
+    return []
+
+def report_currency(args, currencies):
+    # The currency asked for in the query string, if there are rates for it
+    currency = args.get('currency', '').strip().upper() or config.REPORT_CURRENCY
+    return currency if currency in currencies else 'USD'
+
+def expense_data_errors(expense_data, category_ids=None, allow_future=False):
     errors = []
 
     # Error checking for datetime is specific
     # because it's based on 2 form fields attributes
     datetime_errors = errors_for_transaction_datetime(
         expense_data['transaction_date'],
-        expense_data['transaction_time']
+        expense_data['transaction_time'],
+        allow_future,
     )
 
     errors.extend(datetime_errors)
@@ -103,21 +147,60 @@ def expense_data_errors(expense_data):
     error_checkers = {
         'amount_usd': errors_for_transaction_amount,
         'description': errors_for_expense_description,
-        'category_id': errors_for_expense_category,
     }
 
     for attribute_name, error_checker in error_checkers.items():
         input_data = expense_data[attribute_name]
         errors.extend(error_checker(input_data))
 
+    # Category ids can be passed in by callers that don't use g.storage
+    errors.extend(errors_for_expense_category(expense_data['category_id'], category_ids))
+
+    return errors
+
+def extract_recurring_expense_data(form_data):
+    expense_data = extract_expense_data(form_data)
+    expense_data['frequency'] = form_data.get('frequency', '').strip()
+    expense_data['ends_on'] = form_data.get('ends_on', '').strip()
+    return expense_data
+
+def recurring_expense_errors(expense_data, category_ids=None):
+    """
+    Like expense_data_errors, but the first occurrence may be in the
+    future and the frequency and optional end date are checked too.
+    """
+    errors = expense_data_errors(expense_data, category_ids, allow_future=True)
+
+    if expense_data['frequency'] not in FREQUENCIES:
+        errors.append('Choose how often the expense repeats')
+
+    ends_on = expense_data['ends_on']
+    if ends_on:
+        if not is_valid_date(ends_on):
+            errors.append('End date must be in YYYY-MM-DD format')
+        elif is_valid_date(expense_data['transaction_date']) and ends_on < expense_data['transaction_date']:
+            errors.append('End date cannot be before the first occurrence')
+
     return errors
 
-def errors_for_username(username):
+def validated_expenses(parsed_rows, row_errors, category_ids=None):
+    # Yields the valid expense data of (line_number, expense_data) pairs,
+    # collecting the errors of the invalid ones in row_errors
+    for line_number, expense_data in parsed_rows:
+        errors = expense_data_errors(expense_data, category_ids)
+        if errors:
+            row_errors.append((line_number, errors))
+        else:
+            yield expense_data
+
+def errors_for_username(username, is_taken=None):
     errors = []
     if not username:
         return ['Username is required.']
 
-    if g.storage.get_user_id(username):
+    if is_taken is None:
+        is_taken = bool(g.storage.get_user_id(username))
+    if is_taken:
         errors.append('Username already exists. Try a different one.')
 
     if not 3 <= len(username) <= 20:
@@ -140,29 +223,228 @@ def errors_for_password(password):
 
     return errors
 
-def sign_up_credentials_errors(username, password):
+def sign_up_credentials_errors(username, password, username_taken=None):
     errors = []
-    errors.extend(errors_for_username(username))
+    errors.extend(errors_for_username(username, username_taken))
     errors.extend(errors_for_password(password))
 
     return errors
 
 def get_hashed_password(password):
-    salt = bcrypt.gensalt()
-    password_bytes = password.encode('utf-8')
-    password_hash = bcrypt.hashpw(password_bytes, salt).decode('utf-8')
-    return password_hash
-
-def valid_credentials(username, password):
-    user_id = g.storage.find_user_by_username(username)
-    if not user_id:
+    return password_hasher.hash(password)
+
+async def authenticate_async(storage, username, password):
+    """
+    Returns the user record ({'id', 'user_name', 'user_password'})
+    if the credentials are valid, otherwise None. `storage` has coroutine
+    methods, as the ASGI app's does. HashingBusy from the password check
+    propagates (both apps answer it with a 429).
+    """
+    user = await storage.find_user_auth(username)
+    if not user or not await password_hasher.check_async(password, user['user_password']):
+        return None
+
+    # Upgrade hashes made with an outdated cost factor while we
+    # have the plain password at hand. When the hashing pool is
+    # saturated the upgrade waits for a later sign-in.
+    if password_hasher.needs_rehash(user['user_password']):
+        try:
+            await storage.update_user_password(user['id'],
+                                               await password_hasher.hash_async(password))
+        except HashingBusy:
+            pass
+
+    return user
+
+
+class _InlineAsyncStorage:
+    # The blocking storage's methods as coroutines that run inline
+    def __init__(self, storage):
+        self.storage = storage
+
+    def __getattr__(self, name):
+        method = getattr(self.storage, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+
+        return call
+
+
+def authenticate(username, password):
+    """authenticate_async for the Flask app and its blocking storage."""
+    return asyncio.run(authenticate_async(_InlineAsyncStorage(g.storage),
+                                          username, password))
+
+def is_valid_date(date_str):
+    try:
+        datetime.strptime(date_str, '%Y-%m-%d')
+        return True
+    except ValueError:
         return False
 
-    stored_credentials = g.storage.get_user_credentials(user_id)
-    stored_password = stored_credentials['user_password'].encode('utf-8')
-    entered_password = password.encode('utf-8')
+def amount_to_cents(amount_str):
+    # Exact for amounts with up to two decimals, unlike float(amount) * 100.
+    # Amounts past what the INT cents columns hold are rejected too.
+    try:
+        cents = Decimal(amount_str) * 100
+    except ArithmeticError:
+        # InvalidOperation for non-numbers, Overflow for huge exponents
+        raise ValueError(f'Not an amount: {amount_str}') from None
+    if not cents.is_finite() or abs(cents) > MAX_AMOUNT_CENTS:
+        raise ValueError(f'Not an amount: {amount_str}')
+    return int(cents)
+
+def search_filters(args):
+    """
+    Keyword arguments for ExpensesDatabaseStorage.search_expenses from
+    the search form's query args, and a list of errors for invalid ones.
+    """
+    filters = {}
+    errors = []
+
+    text = args.get('q', '').strip()
+    if text:
+        filters['text'] = text
+
+    for arg_name, filter_name, label in (
+        ('min_amount', 'min_cents', 'Minimum amount'),
+        ('max_amount', 'max_cents', 'Maximum amount'),
+    ):
+        amount_str = args.get(arg_name, '').strip()
+        if amount_str:
+            try:
+                filters[filter_name] = amount_to_cents(amount_str)
+            except ValueError:
+                errors.append(f'{label} must be a number up to {MAX_AMOUNT}')
+
+    category_id_str = args.get('category_id', '').strip()
+    category_errors = errors_for_expense_category(category_id_str)
+    errors.extend(category_errors)
+    if category_id_str and not category_errors:
+        filters['category_id'] = int(category_id_str)
+
+    for arg_name in ('date_from', 'date_to'):
+        date_str = args.get(arg_name, '').strip()
+        if date_str:
+            if is_valid_date(date_str):
+                filters[arg_name] = date_str
+            else:
+                errors.append('Dates must be in YYYY-MM-DD format')
+
+    return filters, errors
+
+BULK_ACTIONS = ('delete', 'recategorize', 'shift_dates')
+# Expense ids are SERIAL (INT) values
+MAX_EXPENSE_ID = 2 ** 31 - 1
+
+def bulk_request(form):
+    """
+    The action, expense ids and action arguments of a bulk edit form,
+    and a list of errors for invalid ones.
+    """
+    errors = []
+    action = form.get('action', '')
+    if action not in BULK_ACTIONS:
+        errors.append('Choose delete, recategorize or shift dates')
+
+    try:
+        expense_ids = sorted({int(id_str) for id_str in form.getlist('expense_ids')})
+    except ValueError:
+        expense_ids = []
+        errors.append('Expense ids must be numbers')
+    if expense_ids and not 0 < expense_ids[0] <= expense_ids[-1] <= MAX_EXPENSE_ID:
+        expense_ids = []
+        errors.append('Expense ids are out of range')
+    if not expense_ids and not errors:
+        errors.append('Select at least one expense')
+    if len(expense_ids) > config.BULK_MAX_EXPENSES:
+        errors.append(f'Select at most {config.BULK_MAX_EXPENSES} expenses at a time')
+
+    arguments = {}
+    if action == 'recategorize':
+        category_id_str = form.get('category_id', '').strip()
+        category_errors = errors_for_expense_category(category_id_str)
+        errors.extend(category_errors)
+        if not category_errors:
+            arguments['category_id'] = int(category_id_str) if category_id_str else None
+    elif action == 'shift_dates':
+        try:
+            days = int(form.get('days', ''))
+        except ValueError:
+            days = 0
+        if not days or abs(days) > 36500:
+            errors.append('Days must be a whole number other than 0')
+        else:
+            arguments['days'] = days
+
+    return action, expense_ids, arguments, errors
+
+def budget_request(form, category_ids=None):
+    """
+    The category id and monthly amount in cents of a budget form, and a
+    list of errors for invalid ones.
+    """
+    errors = []
+    category_id_str = form.get('category_id', '').strip()
+    if not category_id_str:
+        errors.append('Choose a category for the budget')
+    else:
+        errors.extend(errors_for_expense_category(category_id_str, category_ids))
+
+    amount_cents = None
+    # Capped like expense amounts, which also keeps the alert arithmetic
+    # in the monthly totals trigger (amount_cents * percent) in BIGINT range
+    try:
+        amount_cents = amount_to_cents(form.get('amount_usd', '').strip())
+    except ValueError:
+        errors.append(f'Budget amount must be a number up to {MAX_AMOUNT}')
+    else:
+        if amount_cents <= 0:
+            errors.append('Budget amount must be positive')
+
+    category_id = None if errors else int(category_id_str)
+    return category_id, amount_cents, errors
 
-    return bcrypt.checkpw(entered_password, stored_password)
+def current_month():
+    # Budgets are shown for the month in progress
+    return date.today().replace(day=1)
+
+def budget_alert_message(alert, category_names):
+    return (f"{category_names.get(alert['category_id'], 'Budget')}: {alert['percent']}% of the "
+            f"{alert['month']:%B %Y} budget spent ({cents_to_currency(alert['total_cents'])} "
+            f"of {cents_to_currency(alert['budget_cents'])} USD)")
+
+def budget_alert_messages(alerts, category_names):
+    return [budget_alert_message(alert, category_names) for alert in alerts]
+
+def encode_page_cursor(page_key):
+    transaction_datetime, expense_id = page_key
+    return f'{transaction_datetime.isoformat()}~{expense_id}'
+
+def decode_page_cursor(cursor_str):
+    """
+    The (transaction_datetime, id) key of a page cursor, or None without
+    one. Raises ValueError for a malformed or tampered cursor.
+    """
+    if not cursor_str:
+        return None
+    datetime_str, expense_id_str = cursor_str.split('~')
+    transaction_datetime = datetime.fromisoformat(datetime_str)
+    expense_id = int(expense_id_str)
+    # encode_page_cursor only sees naive datetimes and SERIAL ids
+    if transaction_datetime.tzinfo is not None or not 0 < expense_id <= MAX_EXPENSE_ID:
+        raise ValueError(f'Invalid page cursor: {cursor_str}')
+    return transaction_datetime, expense_id
 
 def to_currency(amount):
-    return f'{amount:.2f}'
\ No newline at end of file
+    return f'{amount:.2f}'
+
+def cents_to_currency(cents):
+    # Integer math, so no float rounding creeps into displayed amounts
+    sign = '-' if cents < 0 else ''
+    dollars, cents = divmod(abs(cents), 100)
+    return f'{sign}{dollars}.{cents:02d}'
+
+def format_datetime(value, format='%Y-%m-%d %H:%M'):
+    return value.strftime(format)
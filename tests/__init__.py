@@ -0,0 +1,7 @@
+import os
+
+# Tests have no database to keep sessions in
+os.environ.setdefault('EXPENSES_SESSION_BACKEND', 'memory')
+
+# ...nor to listen on for category changes
+os.environ.setdefault('EXPENSES_CATEGORY_LISTEN', '0')
@@ -0,0 +1,66 @@
+class FakeCursor:
+    """
+    Stands in for a psycopg2 cursor. Results are looked up by the first
+    table name in `results` that appears in the executed query.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.rowcount = 0
+        self.query = None
+        self._rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query, params=None):
+        self.connection.executed.append((query, params))
+        self.query = query
+        self._rows = []
+        for table, rows in self.connection.results.items():
+            if table in query:
+                self._rows = list(rows)
+                break
+        self.rowcount = len(self._rows)
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return self._rows
+
+    def fetchmany(self, size):
+        return self._rows[:size]
+
+    def __iter__(self):
+        return iter(self._rows)
+
+
+class FakeConnection:
+    closed = 0
+
+    def __init__(self, results=None):
+        self.results = results or {}
+        self.executed = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self)
+
+
+class FakePool:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def getconn(self):
+        return self.connection
+
+    def putconn(self, connection, close=False):
+        pass
@@ -0,0 +1,120 @@
+import unittest
+from datetime import date
+from unittest import mock
+from app import app
+from expense_tracker import analytics, config
+from expense_tracker.analytics import ExpenseFrame, FrameCache, grouped_report
+from expense_tracker.analytics_cache import AnalyticsCache
+from expense_tracker.categories import category_registry
+from expense_tracker.page_cache import page_cache
+from tests.fakes import FakeConnection, FakePool
+
+# (day, amount cents, category id)
+EXPENSES = (
+    (date(2024, 1, 3), 1000, 1),
+    (date(2024, 1, 20), 3000, 2),
+    (date(2024, 1, 31), 2000, 1),
+    (date(2024, 3, 1), 500, 0),
+    (date(2024, 3, 4), 4500, 2),
+)
+CATEGORY_NAMES = {1: 'Groceries', 2: 'Travel'}
+
+def packed(expenses):
+    return ' '.join(f'{(day - analytics.EPOCH).days} {cents} {category_id}'
+                    for day, cents, category_id in expenses)
+
+
+@unittest.skipIf(analytics.np is None, 'NumPy is not installed')
+class GroupedReportTest(unittest.TestCase):
+    def setUp(self):
+        self.frame = ExpenseFrame.parse(packed(EXPENSES))
+
+    def test_months_with_trends(self):
+        groups = grouped_report(self.frame, 'month', CATEGORY_NAMES)['groups']
+
+        self.assertEqual([group['group_value'] for group in groups],
+                         [date(2024, 1, 1), date(2024, 3, 1)])
+        january, march = groups
+        self.assertEqual((january['txn_count'], january['total_amount']), (3, 6000))
+        self.assertEqual(january['p50_amount'], 2000)
+        self.assertAlmostEqual(january['p90_amount'], 2800)
+        self.assertEqual(march['running_total'], 11000)
+        # February had no spending and still counts in the window and the delta
+        self.assertAlmostEqual(march['moving_avg'], 11000 / 3)
+        self.assertEqual(march['delta'], 5000)
+        self.assertIsNone(march['delta_pct'])
+
+    def test_weeks_start_on_monday(self):
+        groups = grouped_report(self.frame, 'week', CATEGORY_NAMES)['groups']
+        self.assertEqual(groups[0]['group_value'], date(2024, 1, 1))
+        self.assertEqual(groups[-1]['group_value'], date(2024, 3, 4))
+
+    def test_categories_and_pivot(self):
+        report = grouped_report(self.frame.between('2024-01-01', '2024-03-31'),
+                                'category', CATEGORY_NAMES)
+
+        self.assertEqual([(group['group_value'], group['total_amount'])
+                          for group in report['groups']],
+                         [('Groceries', 3000), ('Travel', 7500)])
+        names, months, matrix = report['pivot']
+        self.assertEqual(names, ['Groceries', 'Travel'])
+        self.assertEqual(months, [date(2024, 1, 1), date(2024, 2, 1), date(2024, 3, 1)])
+        self.assertEqual(matrix.tolist(), [[3000, 0, 0], [3000, 0, 4500]])
+
+    def test_date_range_and_unknown_grouping(self):
+        frame = self.frame.between('2024-01-10', '2024-01-31')
+        self.assertEqual(len(frame), 2)
+        self.assertIsNone(grouped_report(frame, 'year', CATEGORY_NAMES))
+        self.assertEqual(grouped_report(ExpenseFrame.parse(None), 'day', {}),
+                         {'groups': [], 'pivot': None})
+
+
+@unittest.skipIf(analytics.np is None, 'NumPy is not installed')
+class AnalyticsViewTest(unittest.TestCase):
+    def setUp(self):
+        connection = FakeConnection({
+            'FROM users': [(1, )],
+            'FROM expenses': [(packed(EXPENSES), )],
+            'FROM categories': [{'id': 1, 'name': 'Groceries'},
+                                {'id': 2, 'name': 'Travel'}],
+        })
+        patches = (
+            mock.patch('expense_tracker.db_storage.get_pool',
+                       return_value=FakePool(connection)),
+            mock.patch.object(config, 'ANALYTICS_ENGINE', 'numpy'),
+            mock.patch.object(analytics, 'frame_cache', FrameCache(max_rows=100)),
+            mock.patch('app.analytics_cache', AnalyticsCache(max_rows=100)),
+        )
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        page_cache.clear()
+        category_registry.invalidate()
+        self.addCleanup(page_cache.clear)
+        self.addCleanup(category_registry.invalidate)
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as session:
+            session['user_signed_in'] = {'username': 'Alice', 'user_id': 7}
+
+    def test_category_pivot_is_rendered(self):
+        response = self.client.get('/analytics?grouping_option=category')
+        page = response.get_data(as_text=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Median Amount', page)
+        self.assertIn('Spending by Category and Month', page)
+        self.assertIn('2024-03', page)
+
+    def test_reports_go_through_the_analytics_cache(self):
+        self.client.get('/analytics?grouping_option=month')
+        page_cache.clear()
+        with mock.patch.object(analytics, 'grouped_report') as report:
+            response = self.client.get('/analytics?grouping_option=month')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('2024-03', response.get_data(as_text=True))
+        report.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
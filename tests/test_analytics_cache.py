@@ -0,0 +1,102 @@
+import unittest
+from datetime import date
+from decimal import Decimal
+from expense_tracker.analytics_cache import AnalyticsCache, GroupedColumns
+
+
+class FakeStorage:
+    def __init__(self, overlap=False):
+        self.overlap = overlap
+        self.grouped_calls = 0
+        self.overlap_calls = []
+
+    def get_grouped_data(self, user_id, group_option, date_from=None, date_to=None):
+        if group_option not in ('month', 'category'):
+            return None
+        self.grouped_calls += 1
+        return [
+            {'group_value': date(2024, 1, 1), 'txn_count': 3,
+             'total_amount': 1001, 'avg_amount': Decimal('333.67')},
+            {'group_value': date(2024, 2, 1), 'txn_count': 1,
+             'total_amount': 250, 'avg_amount': Decimal('250.00')},
+        ]
+
+    def writes_overlap(self, user_id, since_version, date_from=None, date_to=None):
+        self.overlap_calls.append(since_version)
+        return self.overlap
+
+
+class AnalyticsCacheTest(unittest.TestCase):
+    def test_columns_rebuild_the_query_rows(self):
+        storage = FakeStorage()
+        rows = storage.get_grouped_data(7, 'month')
+        self.assertEqual(GroupedColumns(rows).rows(), rows)
+
+    def test_same_data_version_is_a_hit(self):
+        cache = AnalyticsCache(max_rows=100)
+        storage = FakeStorage()
+        first = cache.grouped_data(storage, 7, 'month', '2024-01-01', None, 3)
+        second = cache.grouped_data(storage, 7, 'month', '2024-01-01', None, 3)
+
+        self.assertEqual(first, second)
+        self.assertEqual(storage.grouped_calls, 1)
+        self.assertEqual(storage.overlap_calls, [])
+        self.assertEqual(cache.stats()['hits_total'], 1)
+
+    def test_writes_outside_the_range_keep_the_result(self):
+        cache = AnalyticsCache(max_rows=100)
+        storage = FakeStorage(overlap=False)
+        cache.grouped_data(storage, 7, 'month', '2024-01-01', '2024-02-29', 3)
+        cache.grouped_data(storage, 7, 'month', '2024-01-01', '2024-02-29', 5)
+        cache.grouped_data(storage, 7, 'month', '2024-01-01', '2024-02-29', 5)
+
+        self.assertEqual(storage.grouped_calls, 1)
+        self.assertEqual(storage.overlap_calls, [3])
+
+    def test_writes_inside_the_range_recompute(self):
+        cache = AnalyticsCache(max_rows=100)
+        storage = FakeStorage(overlap=True)
+        cache.grouped_data(storage, 7, 'month', None, None, 3)
+        cache.grouped_data(storage, 7, 'month', None, None, 4)
+
+        self.assertEqual(storage.grouped_calls, 2)
+        self.assertEqual(cache.stats()['misses_total'], 2)
+
+    def test_evicts_least_recently_used_results_over_budget(self):
+        cache = AnalyticsCache(max_rows=4)
+        storage = FakeStorage()
+        cache.grouped_data(storage, 1, 'month', None, None, 1)
+        cache.grouped_data(storage, 2, 'month', None, None, 1)
+        cache.grouped_data(storage, 1, 'month', None, None, 1)
+        cache.grouped_data(storage, 3, 'month', None, None, 1)
+
+        self.assertEqual(cache.stats()['rows'], 4)
+        cache.grouped_data(storage, 2, 'month', None, None, 1)
+        self.assertEqual(storage.grouped_calls, 4)
+
+    def test_invalid_grouping_is_not_cached(self):
+        cache = AnalyticsCache(max_rows=100)
+        self.assertIsNone(cache.grouped_data(FakeStorage(), 7, 'year', None, None, 1))
+        self.assertEqual(cache.stats()['entries'], 0)
+
+    def test_frame_reports_are_cached_and_copied(self):
+        cache = AnalyticsCache(max_rows=100)
+        storage = FakeStorage()
+        computed = []
+        def report():
+            computed.append(1)
+            return [{'group_value': date(2024, 1, 1), 'total_amount': 1001}], None
+
+        groups, _ = cache.cached(storage, 'numpy', 7, 'month', None, None, 3, 'USD', report)
+        groups[0]['total_amount'] /= 100
+        again, pivot = cache.cached(storage, 'numpy', 7, 'month', None, None, 3, 'USD', report)
+
+        self.assertEqual(len(computed), 1)
+        self.assertEqual(again[0]['total_amount'], 1001)
+        self.assertIsNone(pivot)
+        # Engines have their own entries
+        cache.grouped_data(storage, 7, 'month', None, None, 3)
+        self.assertEqual(storage.grouped_calls, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,217 @@
+import asyncio
+import inspect
+import unittest
+from datetime import datetime
+from unittest import mock
+from expense_tracker import config, utils
+from expense_tracker.async_storage import AsyncExpensesDatabaseStorage
+from expense_tracker.categories import category_registry
+from expense_tracker.db_storage import (ExpensesDatabaseStorage, expenses_page_query,
+                                        import_query, import_row)
+from expense_tracker.page_cache import page_cache
+from expense_tracker.passwords import PasswordHasher
+from tests.fakes import FakeConnection, FakePool
+
+try:
+    import asgi
+except ImportError:
+    asgi = None
+
+
+class FakeAsyncCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.description = None
+        self.rowcount = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def execute(self, query, params=None):
+        self.connection.executed.append((query, params))
+        self.rows = []
+        for table, rows in self.connection.results.items():
+            if table in query:
+                self.rows = list(rows)
+                break
+        self.description = [('column', )] if self.rows else None
+        self.rowcount = len(self.rows)
+
+    async def fetchall(self):
+        return self.rows
+
+    async def executemany(self, query, rows):
+        self.connection.executed.append((query, rows))
+
+
+class FakeAsyncPool:
+    def __init__(self, results):
+        self.results = results
+        self.executed = []
+
+    def connection(self):
+        pool = self
+
+        class Context:
+            async def __aenter__(self):
+                return pool
+
+            async def __aexit__(self, *exc_info):
+                return False
+
+        return Context()
+
+    def cursor(self, row_factory=None):
+        return FakeAsyncCursor(self)
+
+
+class AsyncStorageTest(unittest.TestCase):
+    def test_page_runs_the_shared_statement(self):
+        pool = FakeAsyncPool({'FROM expenses': [
+            (3, datetime(2024, 1, 2), 1250, 'Lunch', None, None, 'USD', None),
+            (2, datetime(2024, 1, 1), 300, 'Coffee', 1, 'Groceries', 'USD', None),
+        ]})
+        storage = AsyncExpensesDatabaseStorage(pool)
+        rows, next_key = asyncio.run(storage.get_user_expenses_page(7, 1))
+
+        self.assertEqual([row.id for row in rows], [3])
+        self.assertEqual(next_key, (datetime(2024, 1, 2), 3))
+        self.assertEqual(pool.executed, [expenses_page_query(7, 1)])
+        self.assertEqual(storage.query_count, 1)
+
+    def test_method_returning_early_runs_no_query(self):
+        pool = FakeAsyncPool({})
+        storage = AsyncExpensesDatabaseStorage(pool)
+        self.assertIsNone(asyncio.run(storage.get_grouped_data(7, 'year')))
+        self.assertEqual(pool.executed, [])
+
+    def test_import_uses_the_shared_insert(self):
+        pool = FakeAsyncPool({})
+        storage = AsyncExpensesDatabaseStorage(pool)
+        expense_data = {'transaction_date': '2024-01-31', 'transaction_time': '12:30',
+                        'amount_usd': '12.50', 'description': 'Pharmacy', 'category_id': '1'}
+        self.assertEqual(asyncio.run(storage.import_expenses(7, [expense_data] * 3,
+                                                             batch_size=2)), 3)
+
+        (query, first), (_, second) = pool.executed
+        self.assertEqual(query, import_query('(%s, %s, %s, %s, %s)'))
+        self.assertEqual(first, [import_row(7, expense_data)] * 2)
+        self.assertEqual(len(second), 1)
+
+    def test_methods_match_the_sync_storage(self):
+        methods = inspect.getmembers(AsyncExpensesDatabaseStorage, inspect.iscoroutinefunction)
+        for name, method in methods:
+            if name.startswith('_') or name == 'close_connection':
+                continue
+            with self.subTest(name=name):
+                sync_method = getattr(ExpensesDatabaseStorage, name)
+                sync_method = getattr(sync_method, '__wrapped__', sync_method)
+                sync_parameters = list(inspect.signature(sync_method).parameters.values())
+                if 'cursor' in inspect.signature(sync_method).parameters:
+                    sync_parameters.pop(1)
+                self.assertEqual(list(inspect.signature(method).parameters.values()),
+                                 sync_parameters)
+
+
+@unittest.skipIf(asgi is None, 'Quart is not installed')
+class AsgiAppTest(unittest.TestCase):
+    def setUp(self):
+        hasher = PasswordHasher(rounds=4, pool_size=0, max_pending=2)
+        self.connection = FakeConnection({
+            'FROM users': [{
+                'id': 7,
+                'user_name': 'Alice',
+                'user_password': hasher.hash('Secret'),
+            }],
+        })
+        patches = (
+            mock.patch('expense_tracker.db_storage.get_pool',
+                       return_value=FakePool(self.connection)),
+            mock.patch.object(asgi, 'password_hasher', hasher),
+            mock.patch.object(utils, 'password_hasher', hasher),
+            mock.patch.object(config, 'ASYNC_STORAGE_BACKEND', 'threaded'),
+        )
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_sign_in(self):
+        async def sign_in():
+            client = asgi.app.test_client()
+            response = await client.post('/sign_in', form={
+                'username': 'alice',
+                'password': 'Secret',
+            })
+            return response
+
+        response = asyncio.run(sign_in())
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('desc="1 queries"', response.headers['Server-Timing'])
+
+    def test_analytics_page_is_cached(self):
+        async def requests():
+            client = asgi.app.test_client()
+            await client.post('/sign_in', form={'username': 'alice', 'password': 'Secret'})
+            self.connection.results = {'FROM users': [(3, )], 'FROM budgets': [],
+                                       'FROM categories': [], 'FROM exchange_rates': [],
+                                       'expense_daily_rollups': [], 'FROM expenses': []}
+            path = '/analytics?grouping_option=category'
+            await client.get(path)  # Shows the sign-in flash, so isn't cached
+            first = await client.get(path)
+            cached = await client.get(path)
+            not_modified = await client.get(path, headers={'If-None-Match': first.headers['ETag']})
+            return first, await first.get_data(), cached, await cached.get_data(), not_modified
+
+        page_cache.clear()
+        self.addCleanup(page_cache.clear)
+        first, first_body, cached, cached_body, not_modified = asyncio.run(requests())
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(cached_body, first_body)
+        self.assertIn('desc="1 queries"', cached.headers['Server-Timing'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_streamed_list_loads_categories_before_opening_its_cursor(self):
+        async def streamed_list():
+            client = asgi.app.test_client()
+            await client.post('/sign_in', form={'username': 'alice', 'password': 'Secret'})
+            self.connection.results = {
+                'FROM users': [(3, )],
+                'FROM categories': [{'id': 1, 'name': 'Groceries'}],
+                'FROM expenses': [(12, datetime(2024, 5, 3, 9, 30), 1999, 'Groceries run',
+                                   1, 'Groceries', 'USD', None)],
+            }
+            response = await client.get('/expenses?stream=1')
+            return await response.get_data(as_text=True)
+
+        category_registry.invalidate()
+        self.addCleanup(category_registry.invalidate)
+        self.assertIn('Groceries run', asyncio.run(streamed_list()))
+        queries = [query for query, _ in self.connection.executed]
+        categories = next(index for index, query in enumerate(queries)
+                          if 'FROM categories' in query)
+        stream = next(index for index, query in enumerate(queries)
+                      if 'FROM expenses e' in query)
+        self.assertLess(categories, stream)
+
+    def test_tampered_page_cursor_is_a_bad_request(self):
+        async def expense_list():
+            client = asgi.app.test_client()
+            await client.post('/sign_in', form={'username': 'alice', 'password': 'Secret'})
+            self.connection.results = {'FROM users': [(3, )], 'FROM expenses': []}
+            return await client.get('/expenses', query_string={'after': 'garbage'})
+
+        page_cache.clear()
+        self.addCleanup(page_cache.clear)
+        self.assertEqual(asyncio.run(expense_list()).status_code, 400)
+        self.assertFalse(any('FROM expenses e' in query for query, _ in self.connection.executed))
+
+    def test_unported_paths_go_to_flask(self):
+        self.assertTrue(asgi.served_by_async_app({'path': '/expenses', 'method': 'GET'}))
+        self.assertFalse(asgi.served_by_async_app({'path': '/metrics', 'method': 'GET'}))
+        self.assertFalse(asgi.served_by_async_app({'path': '/expenses/import', 'method': 'POST'}))
+
+if __name__ == '__main__':
+    unittest.main()
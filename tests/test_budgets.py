@@ -0,0 +1,210 @@
+import os
+import random
+import unittest
+from datetime import date, timedelta
+from secrets import token_hex
+from unittest import mock
+from werkzeug.datastructures import MultiDict
+from app import app
+from expense_tracker import migrations, utils
+from expense_tracker.categories import category_registry
+from expense_tracker.db_storage import ExpensesDatabaseStorage
+from expense_tracker.page_cache import page_cache
+from tests.fakes import FakeConnection, FakePool
+
+ALERT = {'category_id': 1, 'month': date(2024, 5, 1), 'percent': 100,
+         'total_cents': 12050, 'budget_cents': 10000}
+
+
+class BudgetRequestTest(unittest.TestCase):
+    def test_valid_budget(self):
+        form = MultiDict({'category_id': '2', 'amount_usd': '250.50'})
+        self.assertEqual(utils.budget_request(form, category_ids={1, 2}), (2, 25050, []))
+        form = MultiDict({'category_id': '2', 'amount_usd': '21474836.47'})
+        self.assertEqual(utils.budget_request(form, category_ids={2}), (2, 2 ** 31 - 1, []))
+
+    def test_invalid_budgets(self):
+        for form in ({'category_id': '', 'amount_usd': '10'},
+                     {'category_id': '9', 'amount_usd': '10'},
+                     {'category_id': '1', 'amount_usd': 'lots'},
+                     {'category_id': '1', 'amount_usd': '0'},
+                     {'category_id': '1', 'amount_usd': '1e999999999'},
+                     {'category_id': '1', 'amount_usd': '1e30'},
+                     {'category_id': '1', 'amount_usd': '21474836.48'}):
+            category_id, _, errors = utils.budget_request(MultiDict(form), category_ids={1})
+            self.assertIsNone(category_id)
+            self.assertEqual(len(errors), 1, form)
+
+    def test_alert_message(self):
+        self.assertEqual(utils.budget_alert_message(ALERT, {1: 'Groceries'}),
+                         'Groceries: 100% of the May 2024 budget spent (120.50 of 100.00 USD)')
+
+
+class BudgetPagesTest(unittest.TestCase):
+    def setUp(self):
+        self.connection = FakeConnection({
+            'FROM users': [(1, )],
+            'FROM categories': [{'id': 1, 'name': 'Groceries'}],
+            'FROM budgets': [{'category_id': 1, 'category_name': 'Groceries',
+                              'budget_cents': 10000, 'spent_cents': 12050, 'txn_count': 3}],
+            'budget_alerts': [ALERT],
+            'INSERT INTO expenses': [(99, )],
+            'FROM expenses': [],
+        })
+        patch = mock.patch('expense_tracker.db_storage.get_pool',
+                           return_value=FakePool(self.connection))
+        patch.start()
+        self.addCleanup(patch.stop)
+        page_cache.clear()
+        category_registry.invalidate()
+        self.addCleanup(page_cache.clear)
+        self.addCleanup(category_registry.invalidate)
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as session:
+            session['user_signed_in'] = {'username': 'Alice', 'user_id': 7}
+
+    def test_list_shows_spend_against_this_months_budgets(self):
+        page = self.client.get('/expenses').get_data(as_text=True)
+        self.assertIn('Budgets this month', page)
+        self.assertIn('<td>120.50</td>', page)
+        self.assertIn('<td>-20.50</td>', page)
+        self.assertIn('over-budget', page)
+
+        query, params = next((query, params) for query, params in self.connection.executed
+                             if 'FROM budgets' in query)
+        self.assertIn('expense_monthly_totals', query)
+        self.assertEqual(params, (utils.current_month(), 7))
+
+    def test_analytics_shows_budgets(self):
+        page = self.client.get('/analytics').get_data(as_text=True)
+        self.assertIn('Budgets this month', page)
+
+    def test_writes_flash_the_alerts_they_raised(self):
+        self.client.post('/expenses', data={
+            'transaction_date': '2024-05-03',
+            'transaction_time': '09:30',
+            'amount_usd': '20.50',
+            'description': 'Groceries run',
+            'category_id': '1',
+        })
+        with self.client.session_transaction() as session:
+            messages = [message for _, message in session['_flashes']]
+        self.assertIn('Groceries: 100% of the May 2024 budget spent (120.50 of 100.00 USD)',
+                      messages)
+
+    def test_saving_a_budget(self):
+        response = self.client.post('/budgets', data={'category_id': '1', 'amount_usd': '100'})
+        self.assertEqual(response.status_code, 302)
+        query, params = next((query, params) for query, params in self.connection.executed
+                             if 'INSERT INTO budgets' in query)
+        self.assertEqual(params, (7, 1, 10000, [80, 100]))
+
+
+@unittest.skipUnless(os.environ.get('EXPENSES_TEST_DATABASE'),
+                     'set EXPENSES_TEST_DATABASE=1 to run against the local test database')
+class MonthlyTotalsTest(unittest.TestCase):
+    """
+    The trigger-maintained monthly totals against a full recompute, on
+    the local PostgreSQL test database:
+
+        EXPENSES_TEST_DATABASE=1 python -m pytest tests/test_budgets.py
+    """
+    @classmethod
+    def setUpClass(cls):
+        storage = ExpensesDatabaseStorage(is_test_env=True)
+        try:
+            migrations.apply_migrations(storage.connection)
+        finally:
+            storage.close_connection()
+
+    def setUp(self):
+        self.storage = ExpensesDatabaseStorage(is_test_env=True)
+        self.addCleanup(self.storage.close_connection)
+        self.user_id = self.storage.create_new_user(f'budgets_{token_hex(6)}', 'x' * 60)
+        self.addCleanup(self.execute, 'DELETE FROM users WHERE id = %s')
+        self.addCleanup(self.execute, 'DELETE FROM expenses WHERE user_id = %s')
+        self.category_ids = [category['id'] for category in self.storage.get_categories()][:3]
+
+    def execute(self, query):
+        with self.storage.connection:
+            with self.storage.connection.cursor() as cursor:
+                cursor.execute(query, (self.user_id, ))
+
+    def create(self, day, amount_usd, category_id):
+        return self.storage.create_new_expense(self.user_id, day.isoformat(), '12:00',
+                                               amount_usd, 'Budget test', category_id)
+
+    def mismatches(self):
+        return [row for row in self.storage.diff_monthly_totals()
+                if row['user_id'] == self.user_id]
+
+    def test_random_writes_keep_totals_equal_to_a_recompute(self):
+        rng = random.Random(25)
+        start = date(2024, 1, 1)
+        expense_ids = []
+        for _ in range(300):
+            day = start + timedelta(days=rng.randrange(120))
+            category_id = rng.choice(self.category_ids + [''])
+            amount = f'{rng.uniform(1, 300):.2f}'
+            operation = rng.random()
+            if operation < 0.5 or not expense_ids:
+                expense_ids.append(self.create(day, amount, category_id))
+            elif operation < 0.7:
+                self.storage.update_expense(self.user_id, rng.choice(expense_ids),
+                                            day.isoformat(), '08:00', amount,
+                                            'Budget test', category_id)
+            elif operation < 0.8:
+                self.storage.delete_expense_by_id(self.user_id, expense_ids.pop(
+                    rng.randrange(len(expense_ids))))
+            elif operation < 0.9:
+                self.storage.recategorize_expenses(self.user_id, rng.sample(
+                    expense_ids, min(5, len(expense_ids))), category_id or None)
+            else:
+                self.storage.shift_expense_dates(self.user_id, rng.sample(
+                    expense_ids, min(5, len(expense_ids))), rng.randint(-40, 40))
+
+        self.assertEqual(self.mismatches(), [])
+
+    def test_budget_changes_bump_the_data_version_but_touch_no_days(self):
+        version = self.storage.get_data_version(self.user_id)
+        self.storage.set_budget(self.user_id, self.category_ids[0], 10000, [80, 100])
+        self.storage.set_budget(self.user_id, self.category_ids[0], 20000, [80, 100])
+        self.assertTrue(self.storage.delete_budget(self.user_id, self.category_ids[0]))
+
+        self.assertEqual(self.storage.get_data_version(self.user_id), version + 3)
+        self.assertFalse(self.storage.writes_overlap(self.user_id, version))
+
+    def test_largest_budget_and_expense_raise_alerts(self):
+        self.storage.set_budget(self.user_id, self.category_ids[0], 2 ** 31 - 1, [80, 100])
+        self.create(date(2024, 3, 2), '21474836.47', self.category_ids[0])
+        self.assertEqual([alert['percent'] for alert in self.storage.pop_budget_alerts(self.user_id)],
+                         [80, 100])
+
+    def test_alerts_are_raised_once_per_percent_crossed(self):
+        category_id = self.category_ids[0]
+        month = date(2024, 3, 1)
+        self.storage.set_budget(self.user_id, category_id, 10000, [80, 100])
+
+        self.create(date(2024, 3, 2), '70.00', category_id)
+        self.assertEqual(self.storage.pop_budget_alerts(self.user_id), [])
+
+        expense_id = self.create(date(2024, 3, 3), '15.00', category_id)
+        self.create(date(2024, 3, 4), '20.00', category_id)
+        alerts = self.storage.pop_budget_alerts(self.user_id)
+        self.assertEqual([(alert['month'], alert['percent'], alert['total_cents'])
+                          for alert in alerts],
+                         [(month, 80, 8500), (month, 100, 10500)])
+
+        # Editing within the month adds the difference: no new crossings
+        self.storage.update_expense(self.user_id, expense_id, '2024-03-03', '12:00',
+                                    '16.00', 'Budget test', category_id)
+        self.assertEqual(self.storage.pop_budget_alerts(self.user_id), [])
+
+        spent = {budget['category_id']: budget['spent_cents']
+                 for budget in self.storage.get_budgets(self.user_id, month)}
+        self.assertEqual(spent, {category_id: 10600})
+        self.assertEqual(self.mismatches(), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+from unittest import mock
+from app import app
+from expense_tracker import config
+from expense_tracker.categories import category_registry
+from tests.fakes import FakeConnection, FakePool
+
+
+class BulkEditTest(unittest.TestCase):
+    def setUp(self):
+        self.connection = FakeConnection({
+            'FROM categories': [{'id': 1, 'name': 'Groceries'}],
+            'FROM requested': [(3, 'updated'), (5, 'future'), (8, 'not_found')],
+        })
+        patch = mock.patch('expense_tracker.db_storage.get_pool',
+                           return_value=FakePool(self.connection))
+        patch.start()
+        self.addCleanup(patch.stop)
+        category_registry.invalidate()
+        self.addCleanup(category_registry.invalidate)
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as session:
+            session['user_signed_in'] = {'username': 'Alice', 'user_id': 7}
+
+    def bulk_statements(self):
+        return [(query, params) for query, params in self.connection.executed
+                if 'FROM requested' in query]
+
+    def test_one_statement_for_the_whole_selection(self):
+        response = self.client.post('/expenses/bulk', data={
+            'action': 'shift_dates',
+            'expense_ids': ['8', '3', '5', '3'],
+            'days': '-2',
+        }, headers={'Accept': 'application/json'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {'results': {
+            '3': 'updated', '5': 'future', '8': 'not_found',
+        }})
+        (query, params), = self.bulk_statements()
+        self.assertIn('user_id', query)
+        self.assertEqual(params, ([3, 5, 8], -2, 7, -2, 7))
+
+    def test_recategorize_summary_is_flashed(self):
+        response = self.client.post('/expenses/bulk', data={
+            'action': 'recategorize',
+            'expense_ids': ['3', '5', '8'],
+            'category_id': '1',
+        }, follow_redirects=False)
+
+        self.assertEqual(response.status_code, 302)
+        (_, params), = self.bulk_statements()
+        self.assertEqual(params, ([3, 5, 8], 1, 7))
+        with self.client.session_transaction() as session:
+            messages = [message for _, message in session['_flashes']]
+        self.assertIn('1 of 3 expenses updated', messages)
+        self.assertIn('1 expenses were not found', messages)
+
+    def test_invalid_requests_run_no_statement(self):
+        for data in (
+            {'action': 'delete'},
+            {'action': 'archive', 'expense_ids': '1'},
+            {'action': 'recategorize', 'expense_ids': '1', 'category_id': '99'},
+            {'action': 'shift_dates', 'expense_ids': 'one', 'days': '1'},
+            {'action': 'delete', 'expense_ids': ['1', str(2 ** 31)]},
+            {'action': 'delete', 'expense_ids': '0'},
+            {'action': 'shift_dates', 'expense_ids': '1', 'days': '0'},
+        ):
+            response = self.client.post('/expenses/bulk', data=data,
+                                        headers={'Accept': 'application/json'})
+            self.assertEqual(response.status_code, 400, data)
+        self.assertEqual(self.bulk_statements(), [])
+
+    def test_selection_size_is_capped(self):
+        with mock.patch.object(config, 'BULK_MAX_EXPENSES', 2):
+            response = self.client.post('/expenses/bulk', data={
+                'action': 'delete', 'expense_ids': ['1', '2', '3'],
+            }, headers={'Accept': 'application/json'})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json(),
+                         {'errors': ['Select at most 2 expenses at a time']})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import time
+import unittest
+from expense_tracker import config, migrations
+from expense_tracker.categories import CategoryRegistry
+from expense_tracker.connection_pool import connect
+from expense_tracker.db_storage import ExpensesDatabaseStorage
+
+
+class FakeStorage:
+    def __init__(self):
+        self.queries = 0
+        self.categories = [{'id': 2, 'name': 'Groceries'}, {'id': 1, 'name': 'Health'}]
+
+    def get_categories(self):
+        self.queries += 1
+        return self.categories
+
+
+class CategoryRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.storage = FakeStorage()
+        self.registry = CategoryRegistry(ttl=60)
+
+    def test_categories_are_loaded_once(self):
+        self.assertEqual(self.registry.ids(self.storage), {1, 2})
+        self.assertEqual(self.registry.by_id(self.storage)[2], 'Groceries')
+        self.assertEqual([c['id'] for c in self.registry.ordered(self.storage)], [2, 1])
+        self.assertEqual(self.storage.queries, 1)
+
+    def test_invalidate_reloads(self):
+        self.registry.ids(self.storage)
+        self.storage.categories = [{'id': 3, 'name': 'Travel'}]
+        self.registry.invalidate()
+        self.assertEqual(self.registry.ids(self.storage), {3})
+        self.assertEqual(self.storage.queries, 2)
+
+    def test_expired_cache_reloads(self):
+        self.registry.ttl = 0
+        self.registry.ids(self.storage)
+        self.registry.ids(self.storage)
+        self.assertEqual(self.storage.queries, 2)
+
+
+@unittest.skipUnless(os.environ.get('EXPENSES_TEST_DATABASE'),
+                     'set EXPENSES_TEST_DATABASE=1 to run against the local test database')
+class CategoryListenerTest(unittest.TestCase):
+    def setUp(self):
+        self.storage = ExpensesDatabaseStorage(is_test_env=True)
+        self.addCleanup(self.storage.close_connection)
+        migrations.apply_migrations(self.storage.connection)
+        self.registry = CategoryRegistry(ttl=3600)
+        self.registry.listen(lambda: connect(config.TEST_DB_NAME), poll_seconds=0.05)
+        self.addCleanup(self.registry.stop_listening)
+
+    def execute(self, query, params):
+        with self.storage.connection:
+            with self.storage.connection.cursor() as cursor:
+                cursor.execute(query, params)
+
+    def wait_for_version(self, version):
+        deadline = time.monotonic() + 5
+        while self.registry.version < version and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertGreaterEqual(self.registry.version, version)
+
+    def test_changes_to_the_table_invalidate_the_registry(self):
+        # The listener invalidates once when it connects
+        self.wait_for_version(1)
+        names = set(self.registry.by_id(self.storage).values())
+
+        self.execute('INSERT INTO categories (name) VALUES (%s)', ('listener test', ))
+        self.addCleanup(self.execute, 'DELETE FROM categories WHERE name = %s',
+                        ('listener test', ))
+        self.wait_for_version(2)
+        self.assertEqual(set(self.registry.by_id(self.storage).values()),
+                         names | {'listener test'})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import threading
+import unittest
+from psycopg2 import extensions
+from expense_tracker.connection_pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = ConnectionPool(min_size=1, max_size=2, timeout=0.05,
+                                   connect=FakeConnection)
+
+    def test_connections_are_reused(self):
+        conn = self.pool.getconn()
+        self.pool.putconn(conn)
+        self.assertIs(self.pool.getconn(), conn)
+        self.assertEqual(self.pool.stats()['size'], 1)
+
+    def test_checkout_times_out_when_exhausted(self):
+        self.pool.getconn()
+        self.pool.getconn()
+        with self.assertRaises(PoolTimeout):
+            self.pool.getconn()
+        self.assertEqual(self.pool.stats()['timeouts_total'], 1)
+
+    def test_waiting_checkout_gets_returned_connection(self):
+        first = self.pool.getconn()
+        self.pool.getconn()
+        self.pool.timeout = 1
+        threading.Timer(0.01, self.pool.putconn, (first, )).start()
+        self.assertIs(self.pool.getconn(), first)
+
+    def test_closed_connection_is_replaced(self):
+        conn = self.pool.getconn()
+        conn.close()
+        self.pool.putconn(conn)
+        self.assertIsNot(self.pool.getconn(), conn)
+        self.assertEqual(self.pool.stats()['discarded_total'], 1)
+
+    def test_open_transaction_is_rolled_back_on_return(self):
+        conn = self.pool.getconn()
+        conn.status = extensions.TRANSACTION_STATUS_INERROR
+        self.pool.putconn(conn)
+        self.assertEqual(conn.status, extensions.TRANSACTION_STATUS_IDLE)
+        self.assertEqual(self.pool.stats()['in_use'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,197 @@
+import unittest
+from datetime import date, datetime
+from decimal import Decimal
+from unittest import mock
+from app import app
+from expense_tracker import analytics, utils
+from expense_tracker.categories import category_registry
+from expense_tracker.currencies import ExchangeRates, exchange_rates, read_rates
+from expense_tracker.db_storage import ExpenseRecord, ExpensesDatabaseStorage
+from expense_tracker.page_cache import page_cache
+from tests.fakes import FakeConnection, FakePool
+
+RATES = [
+    ('EUR', date(2024, 5, 1), Decimal('0.9')),
+    ('EUR', date(2024, 5, 3), Decimal('0.8')),
+    ('GBP', date(2024, 5, 1), Decimal('0.75')),
+]
+
+
+class FakeRatesStorage:
+    def __init__(self, rates=RATES):
+        self.rates = rates
+        self.loads = 0
+
+    def get_exchange_rates(self):
+        self.loads += 1
+        return self.rates
+
+
+def loaded_rates(rates=RATES):
+    registry = ExchangeRates(ttl=60)
+    registry.refresh(FakeRatesStorage(rates))
+    return registry
+
+
+class ReadRatesTest(unittest.TestCase):
+    def test_lines_become_rates_and_repeated_days_keep_the_last(self):
+        rates = read_rates([
+            'date,currency,units_per_usd',
+            '2024-05-01,eur,0.9',
+            '2024-05-01,EUR,0.91',
+            '2024-05-02,GBP,0.75',
+        ])
+        self.assertEqual(rates, [('EUR', date(2024, 5, 1), Decimal('0.91')),
+                                 ('GBP', date(2024, 5, 2), Decimal('0.75'))])
+
+    def test_bad_lines_are_named(self):
+        for line in ('2024-05-01,EUR,cheap', '2024-05-01,EURO,0.9',
+                     '2024-05-01,USD,1', '2024-05-01,EUR,0'):
+            with self.assertRaisesRegex(ValueError, 'Line 2'):
+                read_rates(['date,currency,units_per_usd', line])
+
+
+class ExchangeRatesTest(unittest.TestCase):
+    def test_rate_of_the_latest_day_on_or_before(self):
+        rates = loaded_rates()
+        ordinal = date(2024, 5, 1).toordinal()
+        self.assertEqual(rates.rate('EUR', ordinal - 10), 0.9)
+        self.assertEqual(rates.rate('EUR', ordinal + 1), 0.9)
+        self.assertEqual(rates.rate('EUR', ordinal + 2), 0.8)
+        self.assertEqual(rates.rate('EUR', ordinal + 100), 0.8)
+        self.assertEqual(rates.rate('USD', ordinal), 1.0)
+        with self.assertRaises(ValueError):
+            rates.rate('JPY', ordinal)
+
+    def test_generation_changes_only_with_the_rates(self):
+        rates = ExchangeRates(ttl=60)
+        storage = FakeRatesStorage()
+        generation = rates.refresh(storage)
+        rates.invalidate()
+        self.assertEqual(rates.refresh(storage), generation)
+        self.assertEqual(storage.loads, 2)
+
+        storage.rates = RATES[:1]
+        rates.invalidate()
+        self.assertEqual(rates.refresh(storage), generation + 1)
+        self.assertEqual(rates.currencies(storage), ['USD', 'EUR'])
+
+    def test_records_keep_amounts_entered_in_the_report_currency(self):
+        records = [
+            ExpenseRecord(1, datetime(2024, 5, 3, 9), 1000, 'Lunch', None, None, 'USD', None),
+            ExpenseRecord(2, datetime(2024, 5, 2, 9), 1111, 'Taxi', None, None, 'EUR', 1000),
+            ExpenseRecord(3, datetime(2024, 5, 2, 9), 1000, 'Tea', None, None, 'GBP', 750),
+        ]
+        rates = loaded_rates()
+        self.assertEqual(rates.convert_records(records, 'EUR'), [800, 1000, 900])
+        self.assertEqual(rates.convert_records(records, 'USD'), [1000, 1111, 1000])
+
+    def test_grouped_rows_are_converted_day_by_day(self):
+        rows = [
+            {'group_value': 'Food', 'day': date(2024, 5, 2), 'txn_count': 2, 'total_amount': 1000},
+            {'group_value': 'Food', 'day': date(2024, 5, 3), 'txn_count': 1, 'total_amount': 1000},
+            {'group_value': 'Rent', 'day': date(2024, 5, 3), 'txn_count': 1, 'total_amount': 5},
+        ]
+        self.assertEqual(loaded_rates().convert_grouped(rows, 'EUR'), [
+            {'group_value': 'Food', 'txn_count': 3, 'total_amount': 1700,
+             'avg_amount': Decimal('566.67')},
+            {'group_value': 'Rent', 'txn_count': 1, 'total_amount': 4,
+             'avg_amount': Decimal('4.00')},
+        ])
+
+    @unittest.skipIf(analytics.np is None, 'numpy is not installed')
+    def test_frames_convert_like_grouped_rows(self):
+        np = analytics.np
+        days = [date(2024, 4, 20), date(2024, 5, 2), date(2024, 5, 3), date(2024, 6, 1)]
+        cents = [1234, 999, 1, 250000]
+        frame = analytics.ExpenseFrame(
+            np.array([day.toordinal() - analytics.EPOCH.toordinal() for day in days],
+                     dtype=np.int32),
+            np.array(cents, dtype=np.int64),
+            np.zeros(len(days), dtype=np.int32),
+        )
+        rates = loaded_rates()
+        converted = rates.convert_frame(frame, 'EUR')
+
+        rows = [{'group_value': day, 'day': day, 'txn_count': 1, 'total_amount': amount}
+                for day, amount in zip(days, cents)]
+        self.assertEqual(converted.amount_cents.tolist(),
+                         [row['total_amount'] for row in rates.convert_grouped(rows, 'EUR')])
+        self.assertIs(rates.convert_frame(frame, 'USD'), frame)
+
+
+class GroupedDataByDayTest(unittest.TestCase):
+    def test_by_day_splits_groups_into_days(self):
+        connection = FakeConnection({'expense_daily_rollups': []})
+        with mock.patch('expense_tracker.db_storage.get_pool',
+                        return_value=FakePool(connection)):
+            storage = ExpensesDatabaseStorage()
+            storage.get_grouped_data(7, 'category', by_day=True)
+            storage.get_grouped_data(7, 'month')
+
+        by_day, plain = (query for query, _ in connection.executed
+                         if 'expense_daily_rollups' in query)
+        self.assertIn('r.day,', by_day)
+        self.assertIn('GROUP BY c.name, r.day', by_day)
+        self.assertNotIn('r.day,', plain)
+        self.assertIn('GROUP BY 1 ORDER BY', plain)
+
+
+class CurrencyFormTest(unittest.TestCase):
+    def setUp(self):
+        self.connection = FakeConnection({
+            'FROM users': [(1, )],
+            'FROM categories': [{'id': 1, 'name': 'Groceries'}],
+            'FROM exchange_rates': RATES,
+            'INSERT INTO expenses': [(99, )],
+        })
+        patch = mock.patch('expense_tracker.db_storage.get_pool',
+                           return_value=FakePool(self.connection))
+        patch.start()
+        self.addCleanup(patch.stop)
+        page_cache.clear()
+        category_registry.invalidate()
+        exchange_rates.invalidate()
+        self.addCleanup(page_cache.clear)
+        self.addCleanup(category_registry.invalidate)
+        self.addCleanup(exchange_rates.invalidate)
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as session:
+            session['user_signed_in'] = {'username': 'Alice', 'user_id': 7}
+
+    def create(self, currency, amount='10.00'):
+        return self.client.post('/expenses', data={
+            'transaction_date': '2024-05-03',
+            'transaction_time': '09:30',
+            'amount_usd': amount,
+            'description': 'Taxi',
+            'category_id': '1',
+            'currency': currency,
+        })
+
+    def inserts(self):
+        return [params for query, params in self.connection.executed
+                if 'INSERT INTO expenses' in query]
+
+    def test_amount_is_stored_as_entered_with_its_currency(self):
+        response = self.create('eur')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.inserts()[0][1:], (1000, 'Taxi', 7, 1, 'EUR', 1000))
+
+    def test_currencies_without_rates_are_rejected(self):
+        page = self.create('JPY').get_data(as_text=True)
+        self.assertIn('Currency is not supported', page)
+        self.assertEqual(self.inserts(), [])
+
+    def test_amounts_past_the_cents_range_once_converted_are_rejected(self):
+        # 0.75 GBP per USD: the largest amount is 28633115.29 USD
+        page = self.create('GBP', str(utils.MAX_AMOUNT)).get_data(as_text=True)
+        self.assertIn('must be at most 21474836.47 USD once converted', page)
+        self.assertEqual(self.inserts(), [])
+
+        self.assertEqual(self.create('GBP', '16106127.35').status_code, 302)
+        self.assertEqual(len(self.inserts()), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+import json
+import unittest
+from datetime import datetime
+from unittest import mock
+from expense_tracker import exporters
+
+ROWS = [
+    (1, datetime(2024, 1, 31, 12, 30), 1250, 'Bread, milk', 'Groceries', 'USD', None),
+    (2, datetime(2024, 2, 1), 5, 'Gum', None, 'EUR', 4),
+]
+
+
+class ExportersTest(unittest.TestCase):
+    def test_csv_export(self):
+        output = ''.join(exporters.csv_chunks(iter(ROWS)))
+        self.assertEqual(output.splitlines(), [
+            'id,transaction_datetime,amount_usd,description,category,currency,original_amount',
+            '1,2024-01-31T12:30,12.50,"Bread, milk",Groceries,USD,12.50',
+            '2,2024-02-01T00:00,0.05,Gum,,EUR,0.04',
+        ])
+
+    def test_jsonl_export(self):
+        lines = ''.join(exporters.jsonl_chunks(iter(ROWS))).splitlines()
+        self.assertEqual(json.loads(lines[1]), {
+            'id': 2,
+            'transaction_datetime': '2024-02-01T00:00',
+            'amount_usd': '0.05',
+            'description': 'Gum',
+            'category': None,
+            'currency': 'EUR',
+            'original_amount': '0.04',
+        })
+
+    def test_output_is_chunked(self):
+        with mock.patch.object(exporters, 'CHUNK_SIZE', 10):
+            chunks = list(exporters.csv_chunks(iter(ROWS)))
+        self.assertGreater(len(chunks), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import threading
+import unittest
+from datetime import datetime
+from unittest import mock
+import psycopg2
+from expense_tracker.db_storage import ExpensesDatabaseStorage
+from expense_tracker.group_commit import GroupCommitWriter
+from tests.fakes import FakeConnection, FakePool
+
+MISSING_CATEGORY = 99
+
+
+class FakeBatchStorage:
+    def __init__(self):
+        self.batches = []
+        self.next_id = 1
+        self.closed = 0
+
+    def create_new_expenses(self, rows):
+        self.batches.append(rows)
+        if any(row[4] == MISSING_CATEGORY for row in rows):
+            raise psycopg2.IntegrityError('violates foreign key constraint')
+        ids = list(range(self.next_id, self.next_id + len(rows)))
+        self.next_id += len(rows)
+        return ids
+
+    def close_connection(self):
+        self.closed += 1
+
+
+def expense(category_id=1):
+    return {
+        'transaction_date': '2024-03-01',
+        'transaction_time': '12:30',
+        'amount_usd': '4.20',
+        'description': 'Coffee',
+        'category_id': str(category_id),
+    }
+
+
+class GroupCommitWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.storage = FakeBatchStorage()
+        self.writer = GroupCommitWriter(batch_size=3, max_wait=5,
+                                        storage_factory=lambda: self.storage)
+        self.addCleanup(self.writer.stop)
+
+    def test_concurrent_creates_share_one_insert(self):
+        futures = [self.writer.submit(user_id, **expense()) for user_id in (7, 8, 9)]
+
+        self.assertEqual([future.result(timeout=1) for future in futures], [1, 2, 3])
+        self.assertEqual(len(self.storage.batches), 1)
+        self.assertEqual([row[3] for row in self.storage.batches[0]], [7, 8, 9])
+        self.assertEqual(self.storage.batches[0][0][:2],
+                         (datetime(2024, 3, 1, 12, 30), 420))
+        self.assertEqual(self.writer.stats()['expenses_total'], 3)
+
+    def test_failed_batch_gives_each_request_its_own_result(self):
+        futures = [self.writer.submit(7, **expense(category_id))
+                   for category_id in (1, MISSING_CATEGORY, 2)]
+
+        self.assertEqual(futures[0].result(timeout=1), 1)
+        with self.assertRaises(psycopg2.IntegrityError):
+            futures[1].result(timeout=1)
+        self.assertEqual(futures[2].result(timeout=1), 2)
+        self.assertEqual([len(rows) for rows in self.storage.batches], [3, 1, 1, 1])
+
+    def test_stop_commits_what_is_queued(self):
+        self.writer.max_wait = 0
+        future = self.writer.submit(7, **expense())
+        self.writer.stop()
+        self.assertEqual(future.result(timeout=1), 1)
+        self.assertGreaterEqual(self.storage.closed, 1)
+
+    def test_invalid_values_raise_in_the_caller(self):
+        with self.assertRaises(ValueError):
+            self.writer.submit(7, **dict(expense(), transaction_date='2024-13-01'))
+        self.assertEqual(self.storage.batches, [])
+
+    def test_create_new_expense_waits_for_the_id(self):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+                       self.writer.create_new_expense(7, **expense())))
+                   for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=1)
+        self.assertEqual(sorted(results), [1, 2, 3])
+
+
+class CreateNewExpensesTest(unittest.TestCase):
+    def test_ids_are_taken_from_the_sequence_before_inserting(self):
+        connection = FakeConnection({'nextval': [(41, ), (42, )]})
+        rows = [(datetime(2024, 3, 1), 420, 'Coffee', 7, 1, 'USD', None),
+                (datetime(2024, 3, 2), 999, None, 8, None, 'EUR', 999)]
+        with mock.patch('expense_tracker.db_storage.get_pool',
+                        return_value=FakePool(connection)), \
+                mock.patch('expense_tracker.db_storage.execute_values') as execute_values:
+            ids = ExpensesDatabaseStorage().create_new_expenses(rows)
+
+        self.assertEqual(ids, [41, 42])
+        self.assertEqual(connection.executed[0][1], (2, ))
+        _, query, values = execute_values.call_args.args
+        self.assertIn('INSERT INTO expenses', query)
+        self.assertEqual(values, [(41, *rows[0]), (42, *rows[1])])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import io
+import unittest
+from unittest import mock
+from app import app
+from expense_tracker import importers, utils
+from expense_tracker.categories import category_registry
+from expense_tracker.db_storage import ExpensesDatabaseStorage
+from tests.fakes import FakeConnection, FakePool
+
+CATEGORIES = {1: 'Health', 2: 'Groceries'}
+
+
+class ImportersTest(unittest.TestCase):
+    def test_parse_csv(self):
+        data = io.StringIO(
+            'Date,Time,Amount,Description,Category\n'
+            '2024-01-31,12:30,12.50,Bread and milk,groceries\n'
+            '2024-02-01,,3,Pharmacy,1\n'
+        )
+        rows = list(importers.parse_csv(data, CATEGORIES))
+        self.assertEqual(rows[0], (2, {
+            'transaction_date': '2024-01-31',
+            'transaction_time': '12:30',
+            'amount_usd': '12.50',
+            'description': 'Bread and milk',
+            'category_id': '2',
+        }))
+        self.assertEqual(rows[1][1]['category_id'], '1')
+        self.assertEqual(rows[1][1]['transaction_time'], '')
+
+    def test_parse_csv_keeps_unknown_category_for_validation(self):
+        data = io.StringIO('date,amount,description,category\n2024-01-31,1,Gift,Presents\n')
+        _, expense_data = next(importers.parse_csv(data, CATEGORIES))
+        self.assertEqual(expense_data['category_id'], 'Presents')
+
+    def test_parse_sgml_ofx(self):
+        data = io.StringIO(
+            'OFXHEADER:100\n'
+            '<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>\n'
+            '<STMTTRN>\n<TRNTYPE>DEBIT\n<DTPOSTED>20240131123000.000[-5:EST]\n'
+            '<TRNAMT>-42.10\n<NAME>Coffee shop\n</STMTTRN>\n'
+            '<STMTTRN>\n<TRNTYPE>CREDIT\n<DTPOSTED>20240201\n'
+            '<TRNAMT>100.00\n<NAME>Salary\n</STMTTRN>\n'
+            '</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>\n'
+        )
+        rows = list(importers.parse_ofx(data))
+        self.assertEqual(rows[0], (3, {
+            'transaction_date': '2024-01-31',
+            'transaction_time': '12:30',
+            'amount_usd': '42.10',
+            'description': 'Coffee shop',
+            'category_id': '',
+        }))
+        # Credits come out negative so validation rejects them
+        self.assertEqual(rows[1][1]['amount_usd'], '-100.00')
+        self.assertEqual(rows[1][1]['transaction_time'], '')
+
+    def test_parser_for(self):
+        self.assertIs(importers.parser_for('bank.OFX'), importers.parse_ofx)
+        self.assertIs(importers.parser_for('export.csv'), importers.parse_csv)
+        self.assertIsNone(importers.parser_for('notes.txt'))
+
+    def test_rows_with_unstorable_amounts_are_skipped(self):
+        data = io.StringIO(
+            'date,amount,description\n'
+            '2024-01-31,inf,Infinite\n'
+            '2024-01-31,nan,Not a number\n'
+            '2024-01-31,1e999999999,Huge\n'
+            '2024-01-31,21474836.48,Past the INT cents range\n'
+            '2024-01-31,21474836.47,Largest\n'
+        )
+        row_errors = []
+        valid = list(utils.validated_expenses(importers.parse_csv(data, CATEGORIES),
+                                              row_errors, category_ids=set(CATEGORIES)))
+        self.assertEqual([expense['description'] for expense in valid], ['Largest'])
+        self.assertEqual([line_number for line_number, _ in row_errors], [2, 3, 4, 5])
+
+
+class ImportPageTest(unittest.TestCase):
+    def setUp(self):
+        self.connection = FakeConnection({
+            'FROM users': [(1, )],
+            'FROM categories': [{'id': 1, 'name': 'Health'}],
+        })
+        patch = mock.patch('expense_tracker.db_storage.get_pool',
+                           return_value=FakePool(self.connection))
+        patch.start()
+        self.addCleanup(patch.stop)
+        category_registry.invalidate()
+        self.addCleanup(category_registry.invalidate)
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as session:
+            session['user_signed_in'] = {'username': 'Alice', 'user_id': 7}
+
+    def test_categories_are_loaded_before_the_import_starts(self):
+        def import_expenses(user_id, expenses):
+            queries_before = len(self.connection.executed)
+            # A registry reload now would commit the import's transaction
+            category_registry.invalidate()
+            imported = list(expenses)
+            self.assertEqual(len(self.connection.executed), queries_before)
+            return len(imported)
+
+        data = io.BytesIO(b'date,amount,description,category\n'
+                          b'2024-01-31,12.50,Pharmacy,Health\n'
+                          b'2024-01-31,3,Gift,Presents\n')
+        with mock.patch.object(ExpensesDatabaseStorage, 'import_expenses',
+                               side_effect=import_expenses):
+            page = self.client.post('/expenses/import', data={
+                'expenses_file': (data, 'expenses.csv'),
+            }).get_data(as_text=True)
+
+        self.assertIn('Imported 1 expenses', page)
+        self.assertIn('1 rows were skipped', page)
+
+if __name__ == '__main__':
+    unittest.main()
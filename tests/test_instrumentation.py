@@ -0,0 +1,50 @@
+import unittest
+from unittest import mock
+from app import app
+from expense_tracker import instrumentation
+from expense_tracker.instrumentation import Histogram, fingerprint
+from tests.fakes import FakeConnection, FakePool
+
+
+class InstrumentationTest(unittest.TestCase):
+    def test_fingerprint(self):
+        self.assertEqual(
+            fingerprint(b"SELECT *\n  FROM expenses WHERE user_id = 42 AND description = 'it''s' AND id IN (1, 2, 3)"),
+            'SELECT * FROM expenses WHERE user_id = ? AND description = ? AND id IN (?...)'
+        )
+
+    def test_histogram_is_cumulative(self):
+        histogram = Histogram('test_seconds', 'Test', 'route', buckets=(0.1, 1))
+        histogram.observe('/a', 0.05)
+        histogram.observe('/a', 0.5)
+        histogram.observe('/a', 5)
+        lines = histogram.render()
+        self.assertIn('test_seconds_bucket{route="/a",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{route="/a",le="1"} 2', lines)
+        self.assertIn('test_seconds_bucket{route="/a",le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_count{route="/a"} 3', lines)
+
+    def test_slow_query_log(self):
+        with mock.patch('expense_tracker.config.SLOW_QUERY_MS', 10), \
+                self.assertLogs(instrumentation.slow_query_logger) as logs:
+            instrumentation.record_storage_call('get_categories', 0.02, 8,
+                                                b'SELECT * FROM categories')
+        self.assertIn('get_categories', logs.output[0])
+
+    def test_request_profile(self):
+        connection = FakeConnection({'FROM users': []})
+        with mock.patch('expense_tracker.db_storage.get_pool',
+                        return_value=FakePool(connection)):
+            response = app.test_client().post('/sign_in', data={
+                'username': 'nobody',
+                'password': 'Secret',
+            })
+            metrics_page = app.test_client().get('/metrics').get_data(as_text=True)
+
+        self.assertIn('db;dur=', response.headers['Server-Timing'])
+        self.assertIn('desc="1 queries"', response.headers['Server-Timing'])
+        self.assertIn('expenses_request_duration_seconds_count{route="/sign_in"}', metrics_page)
+        self.assertIn('expenses_storage_call_duration_seconds_count{method="find_user_auth"}', metrics_page)
+
+if __name__ == '__main__':
+    unittest.main()
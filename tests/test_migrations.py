@@ -0,0 +1,46 @@
+import unittest
+from unittest import mock
+from expense_tracker import config, migrations
+from expense_tracker.db_storage import ExpensesDatabaseStorage
+from tests.fakes import FakeConnection, FakePool
+
+
+class MigrationsTest(unittest.TestCase):
+    def test_migrations_have_unique_versions(self):
+        versions = [version for version, _, _ in migrations.available_migrations()]
+        self.assertEqual(versions, sorted(set(versions)))
+
+    def test_plan_index_names_walks_subplans(self):
+        plan = {
+            'Node Type': 'Nested Loop',
+            'Plans': [
+                {'Node Type': 'Index Scan', 'Index Name': 'a_idx'},
+                {'Node Type': 'Hash', 'Plans': [
+                    {'Node Type': 'Bitmap Index Scan', 'Index Name': 'b_idx'},
+                ]},
+            ],
+        }
+        self.assertEqual(migrations.plan_index_names(plan), {'a_idx', 'b_idx'})
+
+    def test_index_checks_explain_the_storage_statements(self):
+        connection = FakeConnection({'FROM expenses': [], 'FROM expense_daily_rollups': [],
+                                     'FROM users': []})
+        with mock.patch('expense_tracker.db_storage.get_pool',
+                        return_value=FakePool(connection)):
+            storage = ExpensesDatabaseStorage()
+            storage.get_user_expenses_page(1, config.EXPENSES_PAGE_SIZE)
+            storage.search_expenses(1, config.EXPENSES_PAGE_SIZE, text='coffee')
+            storage.get_grouped_data(1, 'month', date_from='2024-01-01')
+            storage.get_user_id('admin')
+
+        checks = {name: (query, list(params))
+                  for name, query, params, _ in migrations.INDEX_CHECKS}
+        page, search, grouped, user = [(query, list(params))
+                                       for query, params in connection.executed]
+        self.assertEqual(checks['get_user_expenses_page'], page)
+        self.assertEqual(checks['search_expenses'], search)
+        self.assertEqual(checks['get_grouped_data'], grouped)
+        self.assertEqual(checks['get_user_id'], user)
+
+if __name__ == '__main__':
+    unittest.main()
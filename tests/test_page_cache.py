@@ -0,0 +1,67 @@
+import unittest
+from unittest import mock
+from flask import g
+from app import app
+from expense_tracker.page_cache import PageCache, page_cache
+from tests.fakes import FakeConnection, FakePool
+
+
+class PageCacheTest(unittest.TestCase):
+    def test_evicts_least_recently_used_pages_over_budget(self):
+        cache = PageCache(max_bytes=10)
+        cache.set('a', b'aaaa')
+        cache.set('b', b'bbbb')
+        cache.get('a')
+        cache.set('c', b'cccc')
+
+        self.assertEqual(cache.get('a'), b'aaaa')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats()['bytes'], 8)
+
+
+class CachedPageTest(unittest.TestCase):
+    def setUp(self):
+        self.connection = FakeConnection({'FROM users': [(3, )]})
+        patch = mock.patch('expense_tracker.db_storage.get_pool',
+                           return_value=FakePool(self.connection))
+        patch.start()
+        self.addCleanup(patch.stop)
+        page_cache.clear()
+        self.addCleanup(page_cache.clear)
+
+        self.test_client = app.test_client()
+        with self.test_client.session_transaction() as session:
+            session['user_signed_in'] = {'username': 'Alice', 'user_id': 7}
+
+    def get(self, **kwargs):
+        with self.test_client as client:
+            response = client.get('/expenses', **kwargs)
+            return response, g.storage.query_count
+
+    def test_unchanged_page_is_not_modified(self):
+        first, _ = self.get()
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first.headers['ETag'])
+
+        response, query_count = self.get(headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(query_count, 1)
+
+    def test_unchanged_page_is_served_from_cache(self):
+        first, _ = self.get()
+        response, query_count = self.get()
+        self.assertEqual(response.get_data(), first.get_data())
+        self.assertEqual(query_count, 1)
+
+    def test_new_data_version_changes_etag(self):
+        first, _ = self.get()
+        self.connection.results['FROM users'] = [(4, )]
+        response, query_count = self.get(headers={'If-None-Match': first.headers['ETag']})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], first.headers['ETag'])
+        # Data version, expenses page and this month's budgets
+        self.assertEqual(query_count, 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import os
+import unittest
+from datetime import datetime
+from secrets import token_hex
+from unittest import mock
+from app import app
+from expense_tracker import config, migrations, utils
+from expense_tracker.categories import category_registry
+from expense_tracker.db_storage import (ExpenseRecord, ExpensesDatabaseStorage,
+                                        expenses_page_query, split_page)
+from expense_tracker.page_cache import page_cache
+from tests.fakes import FakeConnection, FakePool
+
+KEY = (datetime(2024, 5, 3, 9, 30, 15, 250), 981)
+
+
+def record(expense_id, transaction_datetime):
+    return ExpenseRecord(expense_id, transaction_datetime, 100, 'Lunch',
+                         None, None, 'USD', None)
+
+
+class PageCursorTest(unittest.TestCase):
+    def test_cursors_round_trip(self):
+        cursor_str = utils.encode_page_cursor(KEY)
+        self.assertEqual(utils.decode_page_cursor(cursor_str), KEY)
+
+    def test_no_cursor_is_the_first_page(self):
+        self.assertIsNone(utils.decode_page_cursor(None))
+        self.assertIsNone(utils.decode_page_cursor(''))
+
+    def test_bad_cursors_are_rejected(self):
+        for cursor_str in ('garbage', '2024-05-03T09:30~', '~981', '2024-13-03~981',
+                           '2024-05-03~1~2', '2024-05-03~abc', '2024-05-03~0',
+                           '2024-05-03~-5', f'2024-05-03~{utils.MAX_EXPENSE_ID + 1}',
+                           '2024-05-03T09:30+02:00~981', '2024-05-03~' + '9' * 5000):
+            with self.subTest(cursor_str=cursor_str):
+                with self.assertRaises(ValueError):
+                    utils.decode_page_cursor(cursor_str)
+
+
+class SplitPageTest(unittest.TestCase):
+    def test_a_short_page_is_the_last(self):
+        rows = [record(3, KEY[0]), record(2, KEY[0])]
+        self.assertEqual(split_page(list(rows), 2), (rows, None))
+
+    def test_the_extra_row_gives_the_next_key(self):
+        rows = [record(3, datetime(2024, 5, 3)), record(2, datetime(2024, 5, 2)),
+                record(1, datetime(2024, 5, 1))]
+        page, next_key = split_page(list(rows), 2)
+
+        self.assertEqual(page, rows[:2])
+        self.assertEqual(next_key, (datetime(2024, 5, 2), 2))
+
+
+class KeysetPredicateTest(unittest.TestCase):
+    def test_equal_datetimes_are_ordered_by_id(self):
+        query, params = expenses_page_query(7, 50, after=KEY)
+
+        self.assertIn('(e.transaction_datetime, e.id) < (%s, %s)', query)
+        self.assertTrue(query.endswith('ORDER BY e.transaction_datetime DESC, e.id DESC LIMIT %s'))
+        self.assertEqual(params, [7, KEY[0], KEY[0], KEY[1], 51])
+
+
+class ExpenseListCursorTest(unittest.TestCase):
+    def setUp(self):
+        self.connection = FakeConnection({
+            'FROM categories': [{'id': 1, 'name': 'Groceries'}],
+            'FROM expenses': [],
+        })
+        patch = mock.patch('expense_tracker.db_storage.get_pool',
+                           return_value=FakePool(self.connection))
+        patch.start()
+        self.addCleanup(patch.stop)
+        page_cache.clear()
+        category_registry.invalidate()
+        self.addCleanup(page_cache.clear)
+        self.addCleanup(category_registry.invalidate)
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as session:
+            session['user_signed_in'] = {'username': 'Alice', 'user_id': 7}
+
+    def page_queries(self):
+        return [params for query, params in self.connection.executed
+                if 'FROM expenses e' in query]
+
+    def test_cursor_selects_the_page(self):
+        response = self.client.get('/expenses', query_string={
+            'after': utils.encode_page_cursor(KEY)})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.page_queries(),
+                         [[7, KEY[0], KEY[0], KEY[1], config.EXPENSES_PAGE_SIZE + 1]])
+
+    def test_tampered_cursors_are_bad_requests(self):
+        for path, args in (('/expenses', {}), ('/expenses/search', {'q': 'lunch'})):
+            for cursor_str in ('garbage', '2024-05-03T09:30~99999999999'):
+                with self.subTest(path=path, cursor_str=cursor_str):
+                    response = self.client.get(path, query_string={**args, 'after': cursor_str})
+                    self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.page_queries(), [])
+
+
+@unittest.skipUnless(os.environ.get('EXPENSES_TEST_DATABASE'),
+                     'set EXPENSES_TEST_DATABASE=1 to run against the local test database')
+class KeysetPagesTest(unittest.TestCase):
+    def setUp(self):
+        self.storage = ExpensesDatabaseStorage(is_test_env=True)
+        self.addCleanup(self.storage.close_connection)
+        migrations.apply_migrations(self.storage.connection)
+        self.user_id = self.storage.create_new_user(f'pages_{token_hex(6)}', 'x' * 60)
+        self.addCleanup(self.execute, 'DELETE FROM users WHERE id = %s')
+        self.addCleanup(self.execute, 'DELETE FROM expenses WHERE user_id = %s')
+
+    def execute(self, query):
+        with self.storage.connection:
+            with self.storage.connection.cursor() as cursor:
+                cursor.execute(query, (self.user_id, ))
+
+    def test_pages_split_equal_datetimes_by_id(self):
+        ids = [self.storage.create_new_expense(self.user_id, '2024-05-03', '09:30',
+                                               '1.00', f'Lunch {number}', '')
+               for number in range(5)]
+        ids.append(self.storage.create_new_expense(self.user_id, '2024-05-02', '09:30',
+                                                   '1.00', 'Older', ''))
+
+        seen = []
+        after = None
+        while True:
+            page, after = self.storage.get_user_expenses_page(self.user_id, 2, after)
+            seen.extend(expense.id for expense in page)
+            if after is None:
+                break
+
+        self.assertEqual(seen, sorted(ids[:5], reverse=True) + [ids[5]])
+
+if __name__ == '__main__':
+    unittest.main()
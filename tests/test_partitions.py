@@ -0,0 +1,126 @@
+import os
+import unittest
+from datetime import date, datetime
+from unittest import mock
+from expense_tracker import config, migrations
+from expense_tracker.connection_pool import connect
+from expense_tracker.db_storage import ExpensesDatabaseStorage
+from tests.fakes import FakeConnection, FakePool
+
+PARTITION_INDEX = 'expenses_2024_01_user_id_transaction_datetime_id_idx'
+
+
+class PartitionPruningTest(unittest.TestCase):
+    def test_keyset_pages_bound_the_datetime_on_its_own(self):
+        connection = FakeConnection({'FROM expenses': []})
+        with mock.patch('expense_tracker.db_storage.get_pool',
+                        return_value=FakePool(connection)):
+            storage = ExpensesDatabaseStorage()
+            after = (datetime(2024, 1, 15, 12), 981)
+            storage.get_user_expenses_page(7, 50, after)
+            storage.search_expenses(7, 50, min_cents=100, after=after)
+
+        page_params, search_params = [params for _, params in connection.executed]
+        self.assertEqual(page_params, [7, after[0], after[0], 981, 51])
+        self.assertEqual(search_params, [7, 100, after[0], after[0], 981, 51])
+
+
+class PartitionIndexCheckTest(unittest.TestCase):
+    def test_partition_indexes_count_as_their_parent(self):
+        plan = [{'Plan': {'Node Type': 'Append', 'Plans': [
+            {'Node Type': 'Index Scan', 'Index Name': PARTITION_INDEX},
+        ]}}]
+        connection = FakeConnection({
+            'EXPLAIN': [(plan, )],
+            'pg_inherits': [(PARTITION_INDEX, ),
+                            ('expenses_user_id_transaction_datetime_idx', )],
+        })
+
+        results = migrations.check_index_usage(connection)
+
+        name, expected, used, ok = results[0]
+        self.assertEqual(name, 'get_user_expenses_page')
+        self.assertEqual(used, {PARTITION_INDEX})
+        for name, expected, used, ok in results:
+            self.assertEqual(ok, expected == 'expenses_user_id_transaction_datetime_idx', name)
+
+
+@unittest.skipUnless(os.environ.get('EXPENSES_TEST_DATABASE'),
+                     'set EXPENSES_TEST_DATABASE=1 to run against the local test database')
+class PartitionedExpensesTest(unittest.TestCase):
+    """
+    Writes to a partitioned expenses table, in a scratch database created
+    next to the test database (partitioning can't be undone).
+    """
+    hash_partitions = 0
+
+    @classmethod
+    def admin(cls, statement):
+        connection = connect(config.TEST_DB_NAME, config.DB_PRIMARY_DSN)
+        try:
+            connection.autocommit = True
+            with connection.cursor() as cursor:
+                cursor.execute(statement)
+        finally:
+            connection.close()
+
+    def setUp(self):
+        db_name = f'{config.TEST_DB_NAME}_partitions_{self.hash_partitions}'
+        self.admin(f'DROP DATABASE IF EXISTS {db_name} WITH (FORCE)')
+        self.admin(f'CREATE DATABASE {db_name}')
+        self.addCleanup(self.admin, f'DROP DATABASE {db_name} WITH (FORCE)')
+        patch = mock.patch.object(config, 'TEST_DB_NAME', db_name)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+        self.storage = ExpensesDatabaseStorage(is_test_env=True)
+        self.addCleanup(self.storage.close_connection)
+        with self.storage.connection:
+            with self.storage.connection.cursor() as cursor:
+                cursor.execute((migrations.MIGRATIONS_DIR.parent / 'schema.sql').read_text())
+        migrations.apply_migrations(self.storage.connection)
+
+        self.user_id = self.storage.create_new_user('partitions', 'x' * 60)
+        self.expense_id = self.create('2024-05-03')
+        self.storage.partition_expenses(self.hash_partitions, 1)
+
+    def create(self, day):
+        return self.storage.create_new_expense(self.user_id, day, '12:00', '10.00',
+                                               'Partition test', '')
+
+    def query(self, query, params=()):
+        with self.storage.connection:
+            with self.storage.connection.cursor() as cursor:
+                cursor.execute(query, params)
+                return cursor.fetchall()
+
+    def test_expenses_older_than_the_oldest_partition_are_stored(self):
+        older_id = self.create('2020-01-15')
+        self.storage.update_expense(self.user_id, self.expense_id, '2019-06-01', '08:00',
+                                    '12.00', 'Partition test', '')
+        self.storage.shift_expense_dates(self.user_id, [older_id], -400)
+        self.storage.import_expenses(self.user_id, [{
+            'transaction_date': '2018-02-01', 'transaction_time': '', 'amount_usd': '3',
+            'description': 'Imported', 'category_id': '',
+        }])
+
+        self.assertEqual(self.query('SELECT transaction_datetime FROM expenses_default'
+                                    ' ORDER BY 1'),
+                         [(datetime(2018, 2, 1), ), (datetime(2018, 12, 11, 12), ),
+                          (datetime(2019, 6, 1, 8), )])
+        self.assertEqual([row for row in self.storage.diff_rollups()
+                          if row['user_id'] == self.user_id], [])
+
+        # Months with rows in the default partition get no partition of their own
+        self.assertEqual(self.query('SELECT expenses_create_partition(%s)',
+                                    (date(2019, 6, 1), )), [(False, )])
+        self.assertEqual(self.query('SELECT expenses_create_partition(%s)',
+                                    (date(2017, 1, 1), )), [(True, )])
+        self.assertEqual(self.storage.create_expense_partitions(1), 0)
+
+
+class HashPartitionedExpensesTest(PartitionedExpensesTest):
+    hash_partitions = 3
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import threading
+import unittest
+from expense_tracker.passwords import PasswordHasher, HashingBusy
+
+
+class PasswordHasherTest(unittest.TestCase):
+    def setUp(self):
+        self.hasher = PasswordHasher(rounds=4, pool_size=0, max_pending=2)
+
+    def test_hash_and_check(self):
+        password_hash = self.hasher.hash('Secret')
+        self.assertTrue(self.hasher.check('Secret', password_hash))
+        self.assertFalse(self.hasher.check('secret', password_hash))
+
+    def test_needs_rehash_when_cost_changes(self):
+        password_hash = self.hasher.hash('Secret')
+        self.assertFalse(self.hasher.needs_rehash(password_hash))
+        self.hasher.rounds = 5
+        self.assertTrue(self.hasher.needs_rehash(password_hash))
+
+    def test_busy_when_too_many_jobs_pending(self):
+        release = threading.Event()
+        started = threading.Barrier(3)
+
+        def slow_job():
+            started.wait()
+            release.wait()
+
+        threads = [
+            threading.Thread(target=self.hasher._run, args=(slow_job, ))
+            for _ in range(2)
+        ]
+        for thread in threads:
+            thread.start()
+        started.wait()
+
+        with self.assertRaises(HashingBusy):
+            self.hasher.hash('Secret')
+
+        release.set()
+        for thread in threads:
+            thread.join()
+
+    def test_process_pool(self):
+        hasher = PasswordHasher(rounds=4, pool_size=1, max_pending=2)
+        try:
+            self.assertTrue(hasher.check('Secret', hasher.hash('Secret')))
+        finally:
+            hasher.shutdown()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+from datetime import datetime
+from unittest import mock
+from app import app
+from expense_tracker.categories import category_registry
+from expense_tracker.db_storage import ExpenseRecord, expense_values
+from expense_tracker.page_cache import page_cache
+from expense_tracker.utils import cents_to_currency
+from tests.fakes import FakeConnection, FakePool
+
+ROWS = [
+    (12, datetime(2024, 5, 3, 9, 30), 1999, 'Groceries run', 1, 'Groceries', 'USD', None),
+    (11, datetime(2024, 5, 2, 18, 5), 7, 'Gum', None, None, 'USD', None),
+]
+
+
+class CurrencyTest(unittest.TestCase):
+    def test_cents_to_currency_is_exact(self):
+        self.assertEqual(cents_to_currency(1999), '19.99')
+        self.assertEqual(cents_to_currency(7), '0.07')
+        self.assertEqual(cents_to_currency(-250), '-2.50')
+        self.assertEqual(cents_to_currency(10 ** 15 + 1), '10000000000000.01')
+
+    def test_form_amounts_are_stored_in_exact_cents(self):
+        # float('19.99') * 100 is 1998.9999999999998
+        _, amount_cents, _, _ = expense_values('2024-05-03', '', '19.99', 'Lunch', '')
+        self.assertEqual(amount_cents, 1999)
+
+
+class ExpensePagesTest(unittest.TestCase):
+    def setUp(self):
+        self.connection = FakeConnection({
+            'FROM users': [(1, )],
+            'FROM categories': [{'id': 1, 'name': 'Groceries'}],
+            'FROM expenses': ROWS,
+        })
+        patch = mock.patch('expense_tracker.db_storage.get_pool',
+                           return_value=FakePool(self.connection))
+        patch.start()
+        self.addCleanup(patch.stop)
+        page_cache.clear()
+        category_registry.invalidate()
+        self.addCleanup(page_cache.clear)
+        self.addCleanup(category_registry.invalidate)
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as session:
+            session['user_signed_in'] = {'username': 'Alice', 'user_id': 7}
+
+    def test_list_formats_records_while_rendering(self):
+        page = self.client.get('/expenses').get_data(as_text=True)
+
+        self.assertIn('2024-05-03 09:30', page)
+        self.assertIn('<td>19.99</td>', page)
+        self.assertIn('0.07 USD', page)
+
+    def test_streamed_list_loads_categories_before_opening_its_cursor(self):
+        page = self.client.get('/expenses?stream=1').get_data(as_text=True)
+        self.assertIn('Groceries run', page)
+
+        queries = [query for query, _ in self.connection.executed]
+        categories = next(index for index, query in enumerate(queries)
+                          if 'FROM categories' in query)
+        stream = next(index for index, query in enumerate(queries)
+                      if 'FROM expenses e' in query)
+        self.assertLess(categories, stream)
+
+    def test_edit_form_shows_stored_then_submitted_values(self):
+        page = self.client.get('/expenses/12/edit').get_data(as_text=True)
+        self.assertIn('value="2024-05-03"', page)
+        self.assertIn('value="09:30"', page)
+        self.assertIn('value="19.99"', page)
+
+        response = self.client.post('/expenses/12/edit', data={
+            'transaction_date': '2024-05-03',
+            'transaction_time': '09:30',
+            'amount_usd': 'lots',
+            'description': 'Groceries run',
+            'category_id': '',
+        })
+        page = response.get_data(as_text=True)
+        self.assertIn('value="lots"', page)
+        self.assertRegex(page, r'<option value=""\s+selected')
+
+    def test_records_come_from_plain_rows(self):
+        record = ExpenseRecord._make(ROWS[0])
+        self.assertEqual((record.amount_cents_usd, record.category_name),
+                         (1999, 'Groceries'))
+
+if __name__ == '__main__':
+    unittest.main()
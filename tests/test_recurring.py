@@ -0,0 +1,116 @@
+import unittest
+from datetime import datetime
+from unittest import mock
+from app import app
+from expense_tracker import config, recurring
+from expense_tracker.categories import category_registry
+from tests.fakes import FakeConnection, FakePool
+
+
+class FakeRecurringStorage:
+    def __init__(self, results):
+        self.results = list(results)
+        self.calls = []
+
+    def materialize_recurring_expenses(self, *args):
+        self.calls.append(args)
+        return self.results.pop(0)
+
+
+class MaterializeDueTest(unittest.TestCase):
+    def test_batches_run_until_no_rule_is_due(self):
+        storage = FakeRecurringStorage([(500, 6000), (20, 240), (0, 0)])
+        now = datetime(2024, 6, 1)
+        with mock.patch.object(config, 'RECURRING_BATCH_SIZE', 500):
+            self.assertEqual(recurring.materialize_due(storage, now, catch_up=True),
+                             (520, 6240))
+
+        self.assertEqual(len(storage.calls), 3)
+        self.assertEqual(storage.calls[0][:2], (now, 500))
+        self.assertIs(storage.calls[0][3], True)
+
+    def test_another_process_holding_the_lock(self):
+        self.assertIsNone(recurring.materialize_due(FakeRecurringStorage([None])))
+        self.assertEqual(recurring.materialize_due(FakeRecurringStorage([(2, 2), None])),
+                         (2, 2))
+
+
+class BatchResults:
+    # Query results that change from one execution to the next
+    def __init__(self, *results):
+        self.results = list(results)
+
+    def __iter__(self):
+        return iter(self.results.pop(0) if len(self.results) > 1 else self.results[0])
+
+
+class RecurringViewsTest(unittest.TestCase):
+    def setUp(self):
+        self.connection = FakeConnection({
+            'WITH due': BatchResults([(1, 3)], [(0, 0)]),
+            'INSERT INTO recurring_expenses': [(5, )],
+            'FROM recurring_expenses': [],
+            'FROM categories': [{'id': 1, 'name': 'Housing'}],
+        })
+        patch = mock.patch('expense_tracker.db_storage.get_pool',
+                           return_value=FakePool(self.connection))
+        patch.start()
+        self.addCleanup(patch.stop)
+        category_registry.invalidate()
+        self.addCleanup(category_registry.invalidate)
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as session:
+            session['user_signed_in'] = {'username': 'Alice', 'user_id': 7}
+
+    def rule_form(self, **fields):
+        form = {
+            'transaction_date': '2024-01-31',
+            'transaction_time': '09:00',
+            'amount_usd': '1200.50',
+            'description': 'Rent',
+            'category_id': '1',
+            'frequency': 'monthly',
+            'ends_on': '',
+        }
+        form.update(fields)
+        return form
+
+    def test_past_occurrences_are_added_on_creation(self):
+        response = self.client.post('/recurring', data=self.rule_form())
+        self.assertEqual(response.status_code, 302)
+
+        (_, insert_params), = [(query, params) for query, params in self.connection.executed
+                               if 'INSERT INTO recurring_expenses' in query]
+        self.assertEqual(insert_params, (7, 120050, 'Rent', 1, 'monthly',
+                                         datetime(2024, 1, 31, 9), None,
+                                         datetime(2024, 1, 31, 9)))
+        params = [params for query, params in self.connection.executed
+                  if 'WITH due' in query]
+        self.assertEqual(len(params), 2)
+        self.assertEqual((params[0]['rule_id'], params[0]['catch_up']), (5, True))
+        # Only the scheduler's runs over all rules take the lock
+        self.assertFalse(any('pg_try_advisory_xact_lock' in query
+                             for query, _ in self.connection.executed))
+        with self.client.session_transaction() as session:
+            self.assertIn('3 expenses added', session['_flashes'][0][1])
+
+    def test_rules_may_start_in_the_future(self):
+        response = self.client.post('/recurring', data=self.rule_form(
+            transaction_date=f'{datetime.now().year + 1}-01-01',
+        ))
+        self.assertEqual(response.status_code, 302)
+
+    def test_invalid_rules_are_not_created(self):
+        response = self.client.post('/recurring', data=self.rule_form(
+            frequency='hourly', ends_on='2023-12-31',
+        ))
+        page = response.get_data(as_text=True)
+
+        self.assertIn('Choose how often the expense repeats', page)
+        self.assertIn('End date cannot be before the first occurrence', page)
+        self.assertFalse(any('INSERT INTO recurring_expenses' in query
+                             for query, _ in self.connection.executed))
+
+if __name__ == '__main__':
+    unittest.main()
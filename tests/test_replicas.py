@@ -0,0 +1,132 @@
+import os
+import unittest
+from unittest import mock
+import psycopg2
+from flask import g
+from app import app, READ_PRIMARY_COOKIE
+from expense_tracker import config
+from expense_tracker.connection_pool import pool_name
+from expense_tracker.db_storage import ExpensesDatabaseStorage
+from expense_tracker.page_cache import page_cache
+from tests.fakes import FakeConnection, FakePool
+
+REPLICA_DSN = 'host=replica1 port=5433'
+
+
+class UnreachablePool(FakePool):
+    def getconn(self):
+        raise psycopg2.OperationalError('could not connect to server')
+
+
+class ReplicaTestCase(unittest.TestCase):
+    def setUp(self):
+        self.primary = FakeConnection({'FROM users': [(3, )], 'FROM expenses': []})
+        self.replica = FakeConnection({'FROM users': [(3, )], 'FROM expenses': []})
+        self.pools = {'': FakePool(self.primary), REPLICA_DSN: FakePool(self.replica)}
+        for patch in (
+            mock.patch('expense_tracker.db_storage.get_pool',
+                       side_effect=lambda db_name, dsn='', read_only=False: self.pools[dsn]),
+            mock.patch.object(config, 'DB_REPLICA_DSNS', [REPLICA_DSN]),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+
+
+class ReadRoutingTest(ReplicaTestCase):
+    def test_reads_go_to_the_replica_and_writes_to_the_primary(self):
+        storage = ExpensesDatabaseStorage()
+        storage.replica_reads = True
+        storage.get_data_version(7)
+        storage.delete_expense_by_id(7, 1)
+
+        self.assertEqual(len(self.replica.executed), 1)
+        self.assertIn('DELETE FROM expenses', self.primary.executed[0][0])
+
+    def test_reads_stay_on_the_primary_unless_enabled(self):
+        storage = ExpensesDatabaseStorage()
+        storage.get_data_version(7)
+
+        self.assertEqual(len(self.primary.executed), 1)
+        self.assertEqual(self.replica.executed, [])
+
+    def test_unreachable_replica_falls_back_to_the_primary(self):
+        self.pools[REPLICA_DSN] = UnreachablePool(self.replica)
+        storage = ExpensesDatabaseStorage()
+        storage.replica_reads = True
+        with self.assertLogs('expense_tracker.db_storage', 'WARNING'):
+            storage.get_data_version(7)
+
+        self.assertEqual(len(self.primary.executed), 1)
+        self.assertFalse(storage.replica_reads)
+
+    def test_pool_name_leaves_out_the_password(self):
+        self.assertEqual(pool_name('expenses', 'host=db2 port=5433 password=secret'),
+                         'expenses@db2:5433')
+        self.assertEqual(pool_name('expenses', ''), 'expenses')
+
+
+class ReadYourWritesTest(ReplicaTestCase):
+    def setUp(self):
+        super().setUp()
+        page_cache.clear()
+        self.addCleanup(page_cache.clear)
+        self.test_client = app.test_client()
+        with self.test_client.session_transaction() as session:
+            session['user_signed_in'] = {'username': 'Alice', 'user_id': 7}
+
+    def list_expenses(self):
+        with self.test_client as client:
+            response = client.get('/expenses')
+            return response, g.storage.replica_reads
+
+    def test_pages_read_from_the_replica(self):
+        response, replica_reads = self.list_expenses()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(replica_reads)
+        self.assertTrue(self.replica.executed)
+
+    def test_reads_after_a_write_go_to_the_primary(self):
+        response = self.test_client.post('/expenses/bulk', data={'action': 'delete'})
+        cookie = self.test_client.get_cookie(READ_PRIMARY_COOKIE)
+        self.assertIsNotNone(cookie)
+        self.assertIn(f'Max-Age={config.DB_READ_YOUR_WRITES_SECONDS}',
+                      response.headers['Set-Cookie'])
+
+        _, replica_reads = self.list_expenses()
+        self.assertFalse(replica_reads)
+        self.assertEqual(self.replica.executed, [])
+
+
+@unittest.skipUnless(os.environ.get('EXPENSES_TEST_REPLICA_DSN'),
+                     'set EXPENSES_TEST_REPLICA_DSN to a second local PostgreSQL server')
+class TwoServersTest(unittest.TestCase):
+    """
+    Against two local servers, both with the test database, e.g.:
+
+        EXPENSES_TEST_REPLICA_DSN='port=5433' python -m pytest tests/test_replicas.py
+    """
+    def server(self, connection):
+        with connection:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT current_setting('port'),"
+                               " current_setting('transaction_read_only')")
+                return cursor.fetchone()
+
+    def test_reads_run_in_read_only_transactions_on_the_replica(self):
+        with mock.patch.object(config, 'DB_REPLICA_DSNS',
+                               [os.environ['EXPENSES_TEST_REPLICA_DSN']]):
+            storage = ExpensesDatabaseStorage(is_test_env=True)
+        storage.replica_reads = True
+        try:
+            primary_port, primary_read_only = self.server(storage.connection)
+            replica_port, replica_read_only = self.server(storage.read_connection)
+            storage.get_categories()
+        finally:
+            storage.close_connection()
+
+        self.assertNotEqual(primary_port, replica_port)
+        self.assertEqual(primary_read_only, 'off')
+        self.assertEqual(replica_read_only, 'on')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import os
+import unittest
+from datetime import date, datetime
+from secrets import token_hex
+from unittest import mock
+from app import app
+from expense_tracker import migrations
+from expense_tracker.db_storage import ExpensesDatabaseStorage
+from tests.fakes import FakeConnection, FakePool
+
+MISMATCH = {'user_id': 7, 'day': date(2024, 5, 3), 'category_id': 1,
+            'expected_count': 2, 'rollup_count': 1,
+            'expected_cents': 3000, 'rollup_cents': 1000}
+
+
+class GroupedDataTest(unittest.TestCase):
+    def test_groups_are_read_from_the_rollups(self):
+        connection = FakeConnection({'expense_daily_rollups': []})
+        with mock.patch('expense_tracker.db_storage.get_pool',
+                        return_value=FakePool(connection)):
+            storage = ExpensesDatabaseStorage()
+            storage.get_grouped_data(7, 'week', '2024-01-01', '2024-03-31')
+            self.assertIsNone(storage.get_grouped_data(7, 'quarter'))
+
+        (query, params), = connection.executed
+        self.assertIn('FROM expense_daily_rollups r', query)
+        self.assertNotIn('FROM expenses', query)
+        self.assertEqual(params, ['week', 7, date(2024, 1, 1), date(2024, 3, 31)])
+
+
+class CheckRollupsCommandTest(unittest.TestCase):
+    def run_command(self, results, *args):
+        connection = FakeConnection(results)
+        with mock.patch('expense_tracker.db_storage.get_pool',
+                        return_value=FakePool(connection)):
+            result = app.test_cli_runner().invoke(args=['check-rollups', *args])
+        return result, connection
+
+    def test_mismatches_are_listed_and_fail_the_check(self):
+        result, _ = self.run_command({'expense_daily_rollups': [MISMATCH],
+                                      'expense_monthly_totals': []})
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn('user 7 day 2024-05-03 category 1: expected 2 txns / 3000 cents, '
+                      'rollup has 1 txns / 1000 cents', result.output)
+        self.assertIn('1 mismatching rollup rows', result.output)
+        self.assertIn('0 mismatching monthly total rows', result.output)
+
+    def test_consistent_rollups_pass(self):
+        result, _ = self.run_command({'expense_daily_rollups': [],
+                                      'expense_monthly_totals': []})
+        self.assertEqual(result.exit_code, 0)
+
+    def test_rebuild(self):
+        result, connection = self.run_command({'expense_daily_rollups': [MISMATCH],
+                                               'expense_monthly_totals': []}, '--rebuild')
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('Rebuilt', result.output)
+        queries = [query for query, _ in connection.executed]
+        self.assertIn('DELETE FROM expense_daily_rollups', queries)
+        self.assertIn('DELETE FROM expense_monthly_totals', queries)
+
+
+@unittest.skipUnless(os.environ.get('EXPENSES_TEST_DATABASE'),
+                     'set EXPENSES_TEST_DATABASE=1 to run against the local test database')
+class RollupTriggerTest(unittest.TestCase):
+    """The trigger-maintained daily rollups against a fresh aggregation."""
+    def setUp(self):
+        self.storage = ExpensesDatabaseStorage(is_test_env=True)
+        self.addCleanup(self.storage.close_connection)
+        migrations.apply_migrations(self.storage.connection)
+        self.user_id = self.storage.create_new_user(f'rollups_{token_hex(6)}', 'x' * 60)
+        self.addCleanup(self.execute, 'DELETE FROM users WHERE id = %s')
+        self.addCleanup(self.execute, 'DELETE FROM expenses WHERE user_id = %s')
+        self.category_id = self.storage.get_categories()[0]['id']
+
+    def execute(self, query):
+        with self.storage.connection:
+            with self.storage.connection.cursor() as cursor:
+                cursor.execute(query, (self.user_id, ))
+
+    def mismatches(self):
+        return [row for row in self.storage.diff_rollups() if row['user_id'] == self.user_id]
+
+    def grouped(self):
+        return {row['group_value']: (row['txn_count'], row['total_amount'])
+                for row in self.storage.get_grouped_data(self.user_id, 'day')}
+
+    def test_rollups_follow_inserts_updates_and_deletes(self):
+        first = self.storage.create_new_expense(self.user_id, '2024-05-03', '09:00',
+                                                '10.00', 'Lunch', self.category_id)
+        second = self.storage.create_new_expense(self.user_id, '2024-05-03', '18:00',
+                                                 '5.50', 'Coffee', '')
+        self.assertEqual(self.mismatches(), [])
+
+        self.storage.update_expense(self.user_id, first, '2024-05-04', '09:00',
+                                    '12.00', 'Lunch', self.category_id)
+        self.assertEqual(self.mismatches(), [])
+        self.assertEqual(self.grouped(), {datetime(2024, 5, 3): (1, 550),
+                                          datetime(2024, 5, 4): (1, 1200)})
+
+        self.storage.delete_expense_by_id(self.user_id, second)
+        self.assertEqual(self.mismatches(), [])
+        self.assertEqual(self.grouped(), {datetime(2024, 5, 4): (1, 1200)})
+
+if __name__ == '__main__':
+    unittest.main()
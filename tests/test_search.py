@@ -0,0 +1,77 @@
+import unittest
+from datetime import datetime
+from unittest import mock
+from app import app
+from expense_tracker import config
+from expense_tracker.categories import category_registry
+from expense_tracker.db_storage import search_tsquery
+from tests.fakes import FakeConnection, FakePool
+
+
+class SearchTsqueryTest(unittest.TestCase):
+    def test_words_become_prefix_terms(self):
+        self.assertEqual(search_tsquery('Star coff'), 'star:* & coff:*')
+
+    def test_tsquery_operators_are_dropped(self):
+        self.assertEqual(search_tsquery("pizza & !(sushi) | 'x'"), 'pizza:* & sushi:* & x:*')
+        self.assertIsNone(search_tsquery(' &! '))
+
+
+class SearchViewTest(unittest.TestCase):
+    def setUp(self):
+        self.connection = FakeConnection({
+            'FROM categories': [{'id': 1, 'name': 'Groceries'}],
+            'FROM expenses': [],
+        })
+        patch = mock.patch('expense_tracker.db_storage.get_pool',
+                           return_value=FakePool(self.connection))
+        patch.start()
+        self.addCleanup(patch.stop)
+        category_registry.invalidate()
+        self.addCleanup(category_registry.invalidate)
+
+        self.client = app.test_client()
+        with self.client.session_transaction() as session:
+            session['user_signed_in'] = {'username': 'Alice', 'user_id': 7}
+
+    def search_params(self):
+        searches = [params for query, params in self.connection.executed
+                    if 'to_tsquery' in query or 'amount_cents_usd >=' in query]
+        self.assertEqual(len(searches), 1)
+        return searches[0]
+
+    def test_filters_are_combined_in_one_query(self):
+        response = self.client.get('/expenses/search', query_string={
+            'q': 'star coff',
+            'min_amount': '1.10',
+            'category_id': '1',
+            'date_to': '2024-01-31',
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('No matching expenses', response.get_data(as_text=True))
+        self.assertEqual(self.search_params(), [
+            7, 'star:* & coff:*', 110, 1, datetime(2024, 2, 1),
+            config.EXPENSES_PAGE_SIZE + 1,
+        ])
+
+    def test_invalid_filters_run_no_search(self):
+        response = self.client.get('/expenses/search', query_string={
+            'min_amount': 'ten', 'category_id': '99',
+        })
+        page = response.get_data(as_text=True)
+
+        self.assertIn('Minimum amount must be a number', page)
+        self.assertIn('Category value is not supported', page)
+        self.assertFalse(any('FROM expenses' in query
+                             for query, _ in self.connection.executed))
+
+    def test_amounts_past_the_cents_range_are_form_errors(self):
+        for amount in ('1e999999999', '1e500000', '21474836.48', 'inf'):
+            response = self.client.get('/expenses/search', query_string={'max_amount': amount})
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('Maximum amount must be a number up to 21474836.47',
+                          response.get_data(as_text=True))
+
+if __name__ == '__main__':
+    unittest.main()
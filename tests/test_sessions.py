@@ -0,0 +1,149 @@
+import unittest
+from unittest import mock
+from flask import Flask, g, session
+from expense_tracker.db_storage import ExpensesDatabaseStorage
+from expense_tracker.sessions import (
+    CachedSessionStore,
+    MemorySessionStore,
+    PostgresSessionStore,
+    ServerSideSessionInterface,
+)
+from tests.fakes import FakeConnection, FakePool
+
+
+def make_app(store):
+    app = Flask(__name__)
+    app.secret_key = 'test-key'
+    app.session_interface = ServerSideSessionInterface(store)
+
+    @app.route('/set/<value>')
+    def set_value(value):
+        session['value'] = value
+        return ''
+
+    @app.route('/get')
+    def get_value():
+        return session.get('value', '')
+
+    @app.route('/regenerate')
+    def regenerate():
+        session.regenerate()
+        return ''
+
+    return app
+
+
+class CachedSessionStoreTest(unittest.TestCase):
+    def test_least_recently_used_session_is_evicted(self):
+        store = CachedSessionStore(MemorySessionStore(), max_size=2, ttl=60)
+        store.set('a', 'v1', 'A', 60)
+        store.set('b', 'v1', 'B', 60)
+        store.cached('a', 'v1')
+        store.set('c', 'v1', 'C', 60)
+
+        self.assertEqual(store.cached('a', 'v1'), 'A')
+        self.assertIsNone(store.cached('b', 'v1'))
+        # Still in the shared store
+        self.assertEqual(store.get('b', 'v1'), 'B')
+
+    def test_other_version_is_read_from_the_shared_store(self):
+        shared = MemorySessionStore()
+        worker_a = CachedSessionStore(shared, max_size=10, ttl=60)
+        worker_b = CachedSessionStore(shared, max_size=10, ttl=60)
+        worker_a.set('s', 'v1', 'old', 60)
+        self.assertEqual(worker_a.get('s', 'v1'), 'old')
+
+        worker_b.set('s', 'v2', 'new', 60)
+        self.assertEqual(worker_a.get('s', 'v2'), 'new')
+        self.assertEqual(worker_a.stats()['misses_total'], 1)
+
+
+class ServerSideSessionTest(unittest.TestCase):
+    def setUp(self):
+        self.shared = MemorySessionStore()
+        self.app = make_app(CachedSessionStore(self.shared, max_size=10, ttl=60))
+        self.client = self.app.test_client()
+
+    def test_cookie_only_holds_signed_id(self):
+        self.client.get('/set/secret-value')
+        cookie = self.client.get_cookie('session')
+        self.assertNotIn('secret-value', cookie.value)
+        self.assertEqual(self.client.get('/get').get_data(as_text=True), 'secret-value')
+
+    def test_session_is_shared_between_workers(self):
+        self.client.get('/set/first')
+        other_worker = make_app(CachedSessionStore(self.shared, max_size=10, ttl=60))
+        other_client = other_worker.test_client()
+        other_client.set_cookie('session', self.client.get_cookie('session').value)
+
+        self.assertEqual(other_client.get('/get').get_data(as_text=True), 'first')
+        other_client.get('/set/second')
+
+        # The first worker's cached copy is older than the cookie
+        self.client.set_cookie('session', other_client.get_cookie('session').value)
+        self.assertEqual(self.client.get('/get').get_data(as_text=True), 'second')
+
+    def test_tampered_cookie_starts_a_new_session(self):
+        self.client.get('/set/mine')
+        sid = self.client.get_cookie('session').value.split('.')[0]
+        self.client.set_cookie('session', f'{sid}.forged.signature')
+        self.assertEqual(self.client.get('/get').get_data(as_text=True), '')
+
+    def test_regenerate_drops_the_old_id(self):
+        self.client.get('/set/kept')
+        old_sid = self.client.get_cookie('session').value.split('.')[0]
+        self.client.get('/regenerate')
+
+        self.assertIsNone(self.shared.get(old_sid))
+        self.assertEqual(self.client.get('/get').get_data(as_text=True), 'kept')
+
+
+class CountingPool(FakePool):
+    # Tracks how many connections are checked out at once
+    def __init__(self, connection):
+        super().__init__(connection)
+        self.checked_out = 0
+        self.most_checked_out = 0
+
+    def getconn(self):
+        self.checked_out += 1
+        self.most_checked_out = max(self.most_checked_out, self.checked_out)
+        return super().getconn()
+
+    def putconn(self, connection, close=False):
+        self.checked_out -= 1
+
+
+class PostgresSessionStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.connection = FakeConnection({'FROM sessions': [('{"value": "first"}', )]})
+        self.pool = CountingPool(self.connection)
+        patch = mock.patch('expense_tracker.db_storage.get_pool', return_value=self.pool)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+        self.app = make_app(CachedSessionStore(PostgresSessionStore(), max_size=0, ttl=0))
+
+        @self.app.before_request
+        def create_db_connection():
+            g.storage = ExpensesDatabaseStorage()
+            g.storage.get_user_id('alice')
+
+        @self.app.teardown_appcontext
+        def teardown_db(exception=None):
+            if hasattr(g, 'storage'):
+                g.storage.close_connection()
+
+    def test_requests_hold_one_connection_at_a_time(self):
+        client = self.app.test_client()
+        client.get('/set/first')
+        client.get('/set/second')
+
+        self.assertEqual(self.pool.most_checked_out, 1)
+        self.assertEqual(self.pool.checked_out, 0)
+        saves = [query for query, _ in self.connection.executed
+                 if 'INSERT INTO sessions' in query]
+        self.assertEqual(len(saves), 2)
+
+if __name__ == '__main__':
+    unittest.main()
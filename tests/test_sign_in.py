@@ -0,0 +1,65 @@
+import unittest
+from unittest import mock
+from flask import g
+from app import app
+from expense_tracker import utils
+from expense_tracker.passwords import HashingBusy, PasswordHasher
+from tests.fakes import FakeConnection, FakePool
+
+
+class SignInTest(unittest.TestCase):
+    def setUp(self):
+        hasher = self.hasher = PasswordHasher(rounds=4, pool_size=0, max_pending=2)
+        self.connection = FakeConnection({
+            'FROM users': [{
+                'id': 7,
+                'user_name': 'Alice',
+                'user_password': hasher.hash('Secret'),
+            }],
+        })
+        patches = (
+            mock.patch('expense_tracker.db_storage.get_pool',
+                       return_value=FakePool(self.connection)),
+            mock.patch.object(utils, 'password_hasher', hasher),
+        )
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        self.test_client = app.test_client()
+
+    def test_sign_in_takes_one_query(self):
+        with self.test_client as client:
+            response = client.post('/sign_in', data={
+                'username': 'alice',
+                'password': 'Secret',
+            })
+            self.assertEqual(response.status_code, 302)
+            self.assertEqual(g.storage.query_count, 1)
+
+        with self.test_client.session_transaction() as session:
+            self.assertEqual(session['user_signed_in'],
+                             {'username': 'Alice', 'user_id': 7})
+
+    def test_wrong_password_takes_one_query(self):
+        with self.test_client as client:
+            response = client.post('/sign_in', data={
+                'username': 'alice',
+                'password': 'Wrong',
+            })
+            self.assertIn('Wrong credentials', response.get_data(as_text=True))
+            self.assertEqual(g.storage.query_count, 1)
+
+    def test_busy_hasher_skips_the_rehash_but_signs_in(self):
+        self.hasher.rounds = 5
+        with mock.patch.object(self.hasher, 'hash_async', side_effect=HashingBusy):
+            response = self.test_client.post('/sign_in', data={
+                'username': 'alice',
+                'password': 'Secret',
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse([query for query, _ in self.connection.executed
+                          if 'UPDATE users' in query])
+
+if __name__ == '__main__':
+    unittest.main()